@@ -0,0 +1,418 @@
+'''
+Reports over the study history of a library.
+
+The review history kept by the SQLite backend is mirrored into NumPy columns, with decks,
+terms and profiles encoded as integers, and cached in `.progress/reviews.npz`. The cache is
+kept with the path and file stats of the database it mirrors, so a report on an unchanged
+database reads nothing from it, and a cache of another or a rebuilt database is dropped.
+Each report only fetches the reviews added since the last one, then aggregates the columns in memory,
+so summaries stay fast over millions of reviews. Score trends come from the progress store,
+so they are available with any backend.
+
+Usage:
+    python runner/analytics.py Swedish/flashcards
+    python runner/analytics.py Swedish/flashcards --profile alice --days 14 --limit 20
+'''
+
+import argparse, getpass, sqlite3, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from handlers import *
+from progress import ProgressStore
+
+
+class ReviewColumns:
+    COLUMNS = {
+        "id": np.int64,
+        "deck": np.int32,
+        "term": np.int32,
+        "profile": np.int32,
+        "ts": np.float64,
+        "correct": np.int8,
+        "latency": np.float32,
+    }
+    VOCABULARIES = ("deck", "term", "profile")
+
+    def __init__(self, db_path: Path, cache_path: Path) -> None:
+        """
+        Initializes the columns from the cache, without reading the database yet.
+
+        Args:
+            db_path (Path): The SQLite database holding the review history.
+            cache_path (Path): The `.npz` file the columns are cached in.
+
+        Attributes:
+            columns (Dict[str, np.ndarray]): One array per column of the reviews table.
+            vocabularies (Dict[str, List[str]]): The strings of the deck, term and profile codes.
+            codes (Dict[str, Dict[str, int]]): The code of each string, per vocabulary.
+            stat (List[int]): The modification times and sizes of the database and its
+                write-ahead log when the columns were last refreshed.
+        """
+        self.db_path: Path = Path(db_path)
+        self.cache_path: Path = Path(cache_path)
+        self._clear()
+        if self.cache_path.exists():
+            with np.load(self.cache_path) as cache:
+                if "source" in cache.files and str(cache["source"]) == str(
+                    self.db_path.resolve()
+                ):
+                    for name in self.COLUMNS:
+                        self.columns[name] = cache[name]
+                    for name in self.VOCABULARIES:
+                        self.vocabularies[name] = cache[f"{name}_vocabulary"].tolist()
+                    self.stat = cache["stat"].tolist()
+        self.codes: Dict[str, Dict[str, int]] = {
+            name: {value: code for code, value in enumerate(values)}
+            for name, values in self.vocabularies.items()
+        }
+
+    def _clear(self) -> None:
+        """
+        Empties the columns and vocabularies.
+        """
+        self.columns: Dict[str, np.ndarray] = {
+            name: np.empty(0, dtype) for name, dtype in self.COLUMNS.items()
+        }
+        self.vocabularies: Dict[str, List[str]] = {
+            name: [] for name in self.VOCABULARIES
+        }
+        self.codes = {name: {} for name in self.VOCABULARIES}
+        self.stat: List[int] = []
+
+    def _stat(self) -> List[int]:
+        """
+        Reads the modification times and sizes of the database and its write-ahead log.
+
+        Returns:
+            List[int]: The modification time in nanoseconds and size of each, 0 if missing.
+        """
+        stat = []
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal")):
+            try:
+                result = path.stat()
+                stat += [result.st_mtime_ns, result.st_size]
+            except FileNotFoundError:
+                stat += [0, 0]
+        return stat
+
+    def __len__(self) -> int:
+        """
+        Returns the number of reviews loaded.
+
+        Returns:
+            int: The number of reviews.
+        """
+        return len(self.columns["id"])
+
+    def _encode(self, name: str, value: str) -> int:
+        """
+        Returns the code of a string, adding it to its vocabulary if it is new.
+
+        Args:
+            name (str): The vocabulary, "deck", "term" or "profile".
+            value (str): The string.
+
+        Returns:
+            int: The code.
+        """
+        codes = self.codes[name]
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(codes)
+            self.vocabularies[name].append(value)
+        return code
+
+    def refresh(self, batch: int = 100_000) -> int:
+        """
+        Appends the reviews added to the database since the last refresh, and updates the cache.
+        Nothing is read if the database has not changed. If the last review loaded is no longer
+        in the database, it was rebuilt, and every review is read again.
+
+        Args:
+            batch (int): The number of rows fetched at a time.
+
+        Returns:
+            int: The number of reviews added.
+        """
+        if not self.db_path.exists():
+            return 0
+        stat = self._stat()
+        if stat == self.stat:
+            return 0
+        db = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True)
+        try:
+            if len(self):
+                row = db.execute(
+                    "SELECT ts FROM reviews WHERE id = ?",
+                    (int(self.columns["id"][-1]),),
+                ).fetchone()
+                if row is None or row[0] != self.columns["ts"][-1]:
+                    self._clear()
+            last = int(self.columns["id"][-1]) if len(self) else 0
+            cursor = db.execute(
+                "SELECT id, deck, term, profile, ts, correct, latency FROM reviews "
+                "WHERE id > ? ORDER BY id",
+                (last,),
+            )
+            parts: Dict[str, List[np.ndarray]] = {name: [] for name in self.COLUMNS}
+            while True:
+                rows = cursor.fetchmany(batch)
+                if not rows:
+                    break
+                ids, decks, terms, profiles, ts, correct, latency = zip(*rows)
+                values = {
+                    "id": ids,
+                    "deck": [self._encode("deck", deck) for deck in decks],
+                    "term": [self._encode("term", term) for term in terms],
+                    "profile": [self._encode("profile", name) for name in profiles],
+                    "ts": ts,
+                    "correct": correct,
+                    "latency": latency,
+                }
+                for name, dtype in self.COLUMNS.items():
+                    parts[name].append(np.asarray(values[name], dtype))
+        finally:
+            db.close()
+        added = sum(len(part) for part in parts["id"])
+        for name in self.COLUMNS:
+            self.columns[name] = np.concatenate([self.columns[name]] + parts[name])
+        self.stat = stat
+        self._save()
+        return added
+
+    def _save(self) -> None:
+        """
+        Writes the columns to the cache, replacing it atomically.
+        """
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = self.cache_path.with_suffix(".tmp.npz")
+        arrays = dict(self.columns)
+        arrays["source"] = np.array(str(self.db_path.resolve()))
+        arrays["stat"] = np.array(self.stat, np.int64)
+        for name in self.VOCABULARIES:
+            arrays[f"{name}_vocabulary"] = np.array(self.vocabularies[name], dtype=str)
+        np.savez(temporary, **arrays)
+        temporary.replace(self.cache_path)
+
+    def select(self, profile: Optional[str] = None, since: float = 0) -> np.ndarray:
+        """
+        Returns a mask of the reviews of a profile since a point in time.
+
+        Args:
+            profile (Optional[str]): The learner profile, or None for every profile.
+            since (float): The earliest review to include, as a UNIX timestamp.
+
+        Returns:
+            np.ndarray: A boolean mask over the reviews.
+        """
+        mask = self.columns["ts"] >= since
+        if profile is not None:
+            mask &= self.columns["profile"] == self.codes["profile"].get(profile, -1)
+        return mask
+
+
+class ReviewReport:
+    def __init__(self, columns: ReviewColumns, mask: np.ndarray) -> None:
+        """
+        Initializes a report over a selection of reviews.
+
+        Args:
+            columns (ReviewColumns): The review history.
+            mask (np.ndarray): Which reviews to report on.
+        """
+        self.columns = columns
+        self.deck = columns.columns["deck"][mask]
+        self.term = columns.columns["term"][mask]
+        self.ts = columns.columns["ts"][mask]
+        self.correct = columns.columns["correct"][mask]
+        self.latency = columns.columns["latency"][mask]
+
+    def decks(self, recent: float) -> List[Tuple[str, int, float, float, float, float]]:
+        """
+        Summarizes every deck, comparing recent accuracy with the accuracy before it.
+
+        Args:
+            recent (float): Where the recent window starts, as a UNIX timestamp. The earlier
+                window has the same length.
+
+        Returns:
+            List[Tuple[str, int, float, float, float, float]]: (deck, reviews, accuracy,
+                mean latency, recent accuracy change, last review) per deck, most reviewed first.
+                Accuracies are percentages, and the change is NaN without reviews in both windows.
+        """
+        size = len(self.columns.vocabularies["deck"])
+        reviews = np.bincount(self.deck, minlength=size)
+        correct = np.bincount(self.deck, self.correct, minlength=size)
+        latency = np.bincount(self.deck, self.latency, minlength=size)
+        last = np.zeros(size)
+        np.maximum.at(last, self.deck, self.ts)
+        previous = recent - (time.time() - recent)
+        windows = []
+        for start, end in ((previous, recent), (recent, np.inf)):
+            inside = (self.ts >= start) & (self.ts < end)
+            seen = np.bincount(self.deck[inside], minlength=size)
+            right = np.bincount(self.deck[inside], self.correct[inside], minlength=size)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                windows.append(np.where(seen > 0, right / seen * 100, np.nan))
+        change = windows[1] - windows[0]
+        rows = []
+        for code in np.argsort(-reviews, kind="stable"):
+            if reviews[code]:
+                rows.append(
+                    (
+                        self.columns.vocabularies["deck"][code],
+                        int(reviews[code]),
+                        correct[code] / reviews[code] * 100,
+                        latency[code] / reviews[code],
+                        float(change[code]),
+                        float(last[code]),
+                    )
+                )
+        return rows
+
+    def hardest_cards(
+        self, minimum: int = 3, limit: int = 10
+    ) -> List[Tuple[str, str, int, float, float]]:
+        """
+        Finds the cards answered correctly least often.
+
+        Args:
+            minimum (int): The fewest reviews a card needs to be ranked.
+            limit (int): The number of cards to return.
+
+        Returns:
+            List[Tuple[str, str, int, float, float]]: (deck, term, reviews, accuracy, mean
+                latency) per card, hardest first, slowest first among equals.
+        """
+        terms = len(self.columns.vocabularies["term"])
+        card = self.deck.astype(np.int64) * terms + self.term
+        if len(self.columns.vocabularies["deck"]) * terms <= max(len(card), 1 << 20):
+            keys = np.arange(len(self.columns.vocabularies["deck"]) * terms)
+        else:  # too many possible cards to count densely
+            keys, card = np.unique(card, return_inverse=True)
+        reviews = np.bincount(card, minlength=len(keys))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            accuracy = (
+                np.bincount(card, self.correct, minlength=len(keys)) / reviews * 100
+            )
+            latency = np.bincount(card, self.latency, minlength=len(keys)) / reviews
+        ranked = np.lexsort((-latency, accuracy))
+        rows = []
+        for index in ranked[reviews[ranked] >= minimum][:limit]:
+            deck, term = divmod(int(keys[index]), terms)
+            rows.append(
+                (
+                    self.columns.vocabularies["deck"][deck],
+                    self.columns.vocabularies["term"][term],
+                    int(reviews[index]),
+                    float(accuracy[index]),
+                    float(latency[index]),
+                )
+            )
+        return rows
+
+    def hours(self) -> List[Tuple[int, int, float]]:
+        """
+        Summarizes accuracy by the local hour of the day reviews were made at, with the UTC
+        offset in effect at each review. Offsets only change on quarter hours, so the local
+        time is looked up once per quarter hour with reviews.
+
+        Returns:
+            List[Tuple[int, int, float]]: (hour, reviews, accuracy) for every hour with reviews.
+        """
+        quarters, inverse = np.unique(self.ts // 900, return_inverse=True)
+        local = [time.localtime(quarter * 900).tm_hour for quarter in quarters.tolist()]
+        hour = np.asarray(local, np.int64)[inverse]
+        reviews = np.bincount(hour, minlength=24)
+        correct = np.bincount(hour, self.correct, minlength=24)
+        return [
+            (h, int(reviews[h]), correct[h] / reviews[h] * 100)
+            for h in range(24)
+            if reviews[h]
+        ]
+
+
+def score_trends(
+    progress: ProgressStore, count: int = 5
+) -> List[Tuple[str, float, float, int]]:
+    """
+    Compares the latest scores of each deck with the scores before them.
+
+    Args:
+        progress (ProgressStore): The learner's progress.
+        count (int): The number of scores in each window.
+
+    Returns:
+        List[Tuple[str, float, float, int]]: (deck, earlier average, recent average, attempts)
+            for decks with scores in both windows, most declining first.
+    """
+    trends = []
+    for deck, entry in progress.load()["decks"].items():
+        scores = [score for _, score in entry["scores"]]
+        recent, earlier = scores[-count:], scores[-2 * count : -count]
+        if earlier:
+            trends.append(
+                (
+                    deck,
+                    sum(earlier) / len(earlier),
+                    sum(recent) / len(recent),
+                    len(scores),
+                )
+            )
+    return sorted(trends, key=lambda trend: trend[2] - trend[1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report on the study history.")
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument("--profile", default=getpass.getuser())
+    parser.add_argument("--all-profiles", action="store_true")
+    parser.add_argument(
+        "--days", type=float, default=7, help="The length of the trend windows."
+    )
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+    directory = Path(args.filepath).resolve() / ".progress"
+
+    started = time.perf_counter()
+    columns = ReviewColumns(directory / "library.db", directory / "reviews.npz")
+    added = columns.refresh()
+    loaded = time.perf_counter()
+    report = ReviewReport(
+        columns, columns.select(None if args.all_profiles else args.profile)
+    )
+    recent = time.time() - args.days * 86400
+    decks = report.decks(recent)
+    hardest = report.hardest_cards(limit=args.limit)
+    hours = report.hours()
+    finished = time.perf_counter()
+
+    PrintHandler.print_notice(
+        f"{len(report.deck)} of {len(columns)} reviews ({added} new), "
+        f"loaded in {loaded - started:.3f}s, aggregated in {finished - loaded:.3f}s"
+    )
+    PrintHandler.print_notice("Decks:")
+    for deck, reviews, accuracy, latency, change, last in decks:
+        trend = (
+            "" if np.isnan(change) else f", {change:+.0f} points in {args.days:g} days"
+        )
+        last = time.strftime("%Y-%m-%d", time.localtime(last))
+        print(
+            f"\t{deck}: {reviews} reviews, {accuracy:.0f}% correct, "
+            f"{latency:.1f}s per answer{trend}, last {last}"
+        )
+    PrintHandler.print_notice("Hardest cards:")
+    for deck, term, reviews, accuracy, latency in hardest:
+        print(f"\t{term} ({deck}): {accuracy:.0f}% of {reviews}, {latency:.1f}s")
+    PrintHandler.print_notice("By hour of day:")
+    for hour, reviews, accuracy in hours:
+        print(f"\t{hour:02d}:00 {reviews} reviews, {accuracy:.0f}% correct")
+    PrintHandler.print_notice("Decks trending down:")
+    for deck, earlier, latest, attempts in score_trends(
+        ProgressStore(directory, args.profile)
+    ):
+        if latest < earlier:
+            print(f"\t{deck}: {earlier:.0f}% -> {latest:.0f}% over {attempts} attempts")
@@ -0,0 +1,267 @@
+'''
+Paginated deck browser.
+
+Lists one directory level of a library at a time with os.scandir, a page at a time, and
+caches each listing until the directory changes, so picking a deck from a huge tree only
+reads the directories that are opened. Typing / and then text filters the current directory
+as it is typed, and extending the filter only searches the entries that matched before.
+
+Usage:
+    python runner/browser.py Swedish/flashcards
+'''
+
+import argparse, os, sys
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from handlers import *
+
+Entry = Tuple[str, bool]  # (name, is a directory)
+
+
+class DeckBrowser:
+    def __init__(
+        self,
+        root: Path,
+        page_size: int = 20,
+        describe: Optional[Callable[[List[Path]], List[str]]] = None,
+        build_session: Optional[Callable[[str], Optional[Path]]] = None,
+    ) -> None:
+        """
+        Initializes a browser at the root of a library.
+
+        Args:
+            root (Path): The root directory of the library.
+            page_size (int): The number of entries shown per page.
+            describe (Optional[Callable[[List[Path]], List[str]]]): Returns a note to show next
+                to each of the decks on a page, such as its recent scores.
+            build_session (Optional[Callable[[str], Optional[Path]]]): Turns a card query typed
+                after ? into a deck to study, raising ValueError if the query is not valid.
+
+        Attributes:
+            directory (Path): The directory being browsed.
+            page (int): The page being shown, from 0.
+            query (str): The filter typed for the current directory.
+            listings (Dict[Path, Tuple[int, List[Entry]]]): The modification time and entries of each directory listed so far.
+            matches (List[Entry]): The entries of the current directory that match the filter.
+        """
+        self.root: Path = Path(root).resolve()
+        self.page_size: int = page_size
+        self.describe = describe
+        self.build_session = build_session
+        self.directory: Path = self.root
+        self.page: int = 0
+        self.query: str = ""
+        self.listings: Dict[Path, Tuple[int, List[Entry]]] = {}
+        self.matches: List[Entry] = []
+
+    def listing(self, directory: Path) -> List[Entry]:
+        """
+        Lists a directory, directories first, skipping hidden entries. The listing is cached
+        until the directory's modification time changes.
+
+        Args:
+            directory (Path): The directory to list.
+
+        Returns:
+            List[Entry]: The entries of the directory, sorted.
+        """
+        mtime = os.stat(directory).st_mtime_ns
+        cached = self.listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with os.scandir(directory) as scan:
+            entries = [
+                (entry.name, entry.is_dir())
+                for entry in scan
+                if not entry.name.startswith(".")
+            ]
+        entries.sort(key=lambda entry: (not entry[1], entry[0].lower()))
+        self.listings[directory] = (mtime, entries)
+        return entries
+
+    def open(self, directory: Path) -> None:
+        """
+        Moves the browser to a directory, clearing the filter. If the directory was removed,
+        the browser moves to the nearest directory above it that still exists.
+
+        Args:
+            directory (Path): The directory to browse.
+
+        Raises:
+            FileNotFoundError: If the root of the library was removed.
+        """
+        while True:
+            try:
+                self.matches = self.listing(directory)
+                break
+            except (FileNotFoundError, NotADirectoryError):
+                if directory == self.root:
+                    raise
+                self.listings.pop(directory, None)
+                directory = directory.parent
+        self.directory = directory
+        self.query = ""
+        self.page = 0
+
+    def filter(self, query: str) -> None:
+        """
+        Filters the current directory by a case-insensitive substring. If the new filter
+        extends the previous one, only the previous matches are searched.
+
+        Args:
+            query (str): The text the entry names must contain.
+        """
+        query = query.lower()
+        if not (self.query and query.startswith(self.query)):
+            self.open(self.directory)
+        self.matches = [entry for entry in self.matches if query in entry[0].lower()]
+        self.query = query
+        self.page = 0
+
+    def pages(self) -> int:
+        """
+        Returns the number of pages of the current matches.
+
+        Returns:
+            int: The number of pages, at least 1.
+        """
+        return max(1, -(-len(self.matches) // self.page_size))
+
+    def visible(self) -> List[Entry]:
+        """
+        Returns the entries on the current page.
+
+        Returns:
+            List[Entry]: The entries shown.
+        """
+        start = self.page * self.page_size
+        return self.matches[start : start + self.page_size]
+
+    def render(self) -> str:
+        """
+        Renders the current page.
+
+        Returns:
+            str: The header and numbered entries of the page.
+        """
+        location = self.directory.relative_to(self.root).as_posix()
+        header = f"- {self.root.name}/{'' if location == '.' else location + '/'}"
+        header += f" (page {self.page + 1}/{self.pages()}"
+        header += f", filter: {self.query})" if self.query else ")"
+        visible = self.visible()
+        notes = [""] * len(visible)
+        if self.describe is not None:
+            decks = [self.directory / name for name, is_dir in visible if not is_dir]
+            described = iter(self.describe(decks))
+            notes = ["" if is_dir else next(described) for _, is_dir in visible]
+        lines = [header]
+        for i, ((name, is_dir), note) in enumerate(zip(visible, notes)):
+            lines.append(f"{i + 1}. {name}{'/' if is_dir else ''}{note}")
+        return "\n".join(lines)
+
+    def read_command(self, prompt: str) -> str:
+        """
+        Reads a command at the prompt. On a terminal, keys are read one at a time, and text
+        starting with / filters the current directory as it is typed.
+
+        Args:
+            prompt (str): The prompt to show.
+
+        Returns:
+            str: The command, once Enter is pressed.
+        """
+        if not sys.stdin.isatty():
+            return input(prompt)
+        typed = ""
+        while True:
+            print(prompt + typed, end="", flush=True)
+            key = IOHandler.read_key()
+            if key == "\n":
+                print()
+                return typed
+            if key in ("\x7f", "\b"):
+                typed = typed[:-1]
+            elif key == "\x04":
+                raise EOFError
+            elif key.isprintable():
+                typed += key
+            if typed.startswith("/"):
+                self.filter(typed[1:])
+            print("\033[2J")
+            print(self.render())
+
+    def choose(
+        self, message: str = "Choose file to add to the queue."
+    ) -> Optional[Path]:
+        """
+        Lets the user browse to a deck.
+
+        Numbers open a directory or pick a deck, N and P turn pages, B goes up a directory,
+        and Q escapes. Text starting with / filters the current directory, as it is typed on
+        a terminal, and / alone clears the filter. Text starting with ? builds a session from
+        a card query, if the browser can.
+
+        Args:
+            message (str): The message shown at the prompt.
+
+        Returns:
+            Optional[Path]: The deck chosen, or None if the user escaped.
+        """
+        self.open(self.directory)
+        error = ""
+        extra = " [?query]" if self.build_session is not None else ""
+        while True:
+            print("\033[2J")
+            print(self.render())
+            if error:
+                PrintHandler.print_exception(error)
+                error = ""
+            try:
+                inp = self.read_command(
+                    f"- {message} [1 to {len(self.visible())}] [N/P page] [B back] [/filter]{extra} [Q to escape] "
+                ).strip()
+            except (KeyboardInterrupt, EOFError):
+                print("\nExiting...")
+                quit()
+            command = inp.lower()
+            if command == "q":
+                return None
+            elif command == "n":
+                self.page = min(self.page + 1, self.pages() - 1)
+            elif command == "p":
+                self.page = max(self.page - 1, 0)
+            elif command == "b":
+                if self.directory != self.root:
+                    self.open(self.directory.parent)
+            elif command.isdigit():
+                visible = self.visible()
+                if not 1 <= int(command) <= len(visible):
+                    error = f"Enter valid input between 1 and {len(visible)}."
+                    continue
+                name, is_dir = visible[int(command) - 1]
+                if not is_dir:
+                    return self.directory / name
+                self.open(self.directory / name)
+            elif command.startswith("?") and self.build_session is not None:
+                try:
+                    session = self.build_session(inp[1:].strip())
+                except ValueError as e:
+                    error = str(e)
+                    continue
+                if session is not None:
+                    return session
+            elif command.startswith("/"):
+                self.filter(command[1:])
+            elif command:
+                error = "Start a filter with /."
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Browse the decks of a library.")
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument("--page-size", type=int, default=20)
+    args = parser.parse_args()
+    chosen = DeckBrowser(Path(args.filepath), args.page_size).choose("Choose a deck.")
+    if chosen is not None:
+        print(chosen)
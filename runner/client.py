@@ -0,0 +1,126 @@
+'''
+Thin terminal client for the local study server.
+
+Usage:
+    python runner/client.py --socket /tmp/flashcards.sock
+    python runner/client.py --port 8765 --profile alice
+'''
+
+import argparse, getpass, json, socket
+from typing import Any, Dict, Optional
+
+from handlers import *
+from server import parse_address_args
+
+
+class StudyClient:
+    def __init__(self, socket_path: Optional[str], host: str, port: int) -> None:
+        """
+        Connects to a study server.
+
+        Args:
+            socket_path (Optional[str]): The server's Unix socket. If None, TCP is used.
+            host (str): The server's host over TCP.
+            port (int): The server's port over TCP.
+
+        Attributes:
+            connection (socket.socket): The connection to the server.
+            stream (IO): A line-buffered file over the connection.
+        """
+        if socket_path is not None:
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(socket_path)
+        else:
+            self.connection = socket.create_connection((host, port))
+        self.stream = self.connection.makefile("rw", encoding="utf-8")
+
+    def request(self, **request: Any) -> Dict[str, Any]:
+        """
+        Sends a request and waits for the reply.
+
+        Args:
+            **request (Any): The fields of the request.
+
+        Returns:
+            Dict[str, Any]: The server's reply.
+
+        Raises:
+            ConnectionError: If the server closed the connection.
+        """
+        self.stream.write(json.dumps(request, ensure_ascii=False) + "\n")
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise ConnectionError("The server closed the connection.")
+        return json.loads(line)
+
+    def start(self, profile: str) -> None:
+        """
+        Lets the user pick decks and study them until they escape.
+
+        Args:
+            profile (str): The learner profile to study as.
+        """
+        reply = self.request(op="hello", profile=profile)
+        if "error" in reply:
+            PrintHandler.print_exception(reply["error"])
+            return
+        decks = self.request(op="list")["decks"]
+        while True:
+            print("\033[2J")
+            PrintHandler.print_list(decks)
+            selection = IOHandler.handle_choose_input(
+                "Choose file to study.", 1, len(decks) + 1, "Q"
+            )
+            if selection is None:
+                PrintHandler.print_notice("Exiting...")
+                return
+            if not self.study(decks[selection - 1]):
+                PrintHandler.print_notice("Exiting...")
+                return
+
+    def study(self, deck: str) -> bool:
+        """
+        Studies one deck, making the user retype wrong answers like the local runner does.
+
+        Args:
+            deck (str): The key of the deck to study.
+
+        Returns:
+            bool: Whether the user wants to continue studying.
+        """
+        PrintHandler.print_notice(f"Now Studying: {deck}")
+        reply = self.request(op="study", deck=deck)
+        if "error" in reply:
+            PrintHandler.print_exception(reply["error"])
+            return IOHandler.handle_boolean_input("Continue?")
+        while not reply["done"]:
+            try:
+                attempt = input("\r" + reply["prompt"] + "\n")
+            except (KeyboardInterrupt, EOFError):
+                print("\nExiting...")
+                quit()
+            reply = self.request(op="answer", text=attempt)
+            if "error" in reply:
+                PrintHandler.print_exception(reply["error"])
+                return IOHandler.handle_boolean_input("Continue?")
+            if not reply["correct"]:
+                att2 = ""
+                while att2 != reply["answer"]:
+                    PrintHandler.print_notice(
+                        f"Type the correct answer: {reply['answer']} : ", end=""
+                    )
+                    att2 = input()
+                    if att2 != reply["answer"]:
+                        print("\033[F\033[K", end="")
+            print("\033[2J")
+        PrintHandler.print_notice(f"Score: {reply['score']}%")
+        return IOHandler.handle_boolean_input("Continue?")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Study through a local study server.")
+    parse_address_args(parser)
+    parser.add_argument("--profile", default=getpass.getuser())
+    args = parser.parse_args()
+    StudyClient(args.socket, args.host, args.port).start(args.profile)
@@ -0,0 +1,168 @@
+'''
+Process-wide cache of parsed decks.
+
+Decks are cached by path and modification time, so a deck is only read and parsed again
+once it changes. The cache is kept under a budget of bytes actually held by the cached
+strings and lists, evicting the least recently used decks first, and counts its hits,
+misses and evictions.
+'''
+
+import os, sys, threading
+from collections import OrderedDict
+from itertools import chain
+from typing import Dict, Optional, Sequence, Tuple
+
+from metrics import REGISTRY
+
+LOOKUPS = REGISTRY.counter(
+    "flashcards_deck_cache_lookups", "Parsed deck cache lookups.", ["result"]
+)
+EVICTIONS = REGISTRY.counter(
+    "flashcards_deck_cache_evictions", "Decks evicted from the parsed deck cache."
+)
+
+Parsed = Tuple[
+    str, Tuple[Tuple[str, ...], ...], Tuple[str, ...]
+]  # (content, cards, lines)
+
+
+def deck_size(
+    content: Optional[str], cards: Sequence[Sequence[str]], lines: Sequence[str] = ()
+) -> int:
+    """
+    Measures the bytes held by a parsed deck: its content, its cards and their sides, and its
+    card lines. Decks have this fixed shape, so it is measured flat instead of by walking it.
+
+    Args:
+        content (Optional[str]): The content of the deck.
+        cards (Sequence[Sequence[str]]): The cards.
+        lines (Sequence[str]): The card lines.
+
+    Returns:
+        int: The size in bytes.
+    """
+    return (
+        sys.getsizeof(content or "")
+        + sys.getsizeof(cards)
+        + sum(map(sys.getsizeof, cards))
+        + sum(map(sys.getsizeof, chain.from_iterable(cards)))
+        + sys.getsizeof(lines)
+        + sum(map(sys.getsizeof, lines))
+    )
+
+
+class ParsedDeckCache:
+    def __init__(self, budget: int) -> None:
+        """
+        Initializes an empty cache.
+
+        Args:
+            budget (int): The most bytes the cached decks may hold.
+
+        Attributes:
+            entries (OrderedDict[Tuple[str, str, int], Tuple[Parsed, int]]): The parsed decks and
+                their sizes, by backend, path and modification time, least recently used first.
+            current (Dict[Tuple[str, str], Tuple[str, str, int]]): The key of the cached version
+                of each deck, by backend and path.
+            used (int): The bytes held by the cached decks.
+            hits (int): The lookups that found the deck.
+            misses (int): The lookups that did not.
+            evictions (int): The decks evicted to stay within the budget.
+        """
+        self.budget: int = budget
+        self.entries: "OrderedDict[Tuple[str, str, int], Tuple[Parsed, int]]" = (
+            OrderedDict()
+        )
+        self.current: Dict[Tuple[str, str], Tuple[str, str, int]] = {}
+        self.used: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str, int]) -> Optional[Parsed]:
+        """
+        Looks up a parsed deck, marking it as recently used.
+
+        Args:
+            key (Tuple[str, str, int]): The backend, absolute path and modification time of the deck.
+
+        Returns:
+            Optional[Parsed]: The content, cards and card lines, or None if not cached.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                LOOKUPS.labels("miss").inc()
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        LOOKUPS.labels("hit").inc()
+        return entry[0]
+
+    def put(self, key: Tuple[str, str, int], parsed: Parsed) -> None:
+        """
+        Caches a parsed deck, replacing older versions of it and evicting the least recently
+        used decks while over budget. A deck larger than the whole budget is not cached.
+
+        Args:
+            key (Tuple[str, str, int]): The backend, absolute path and modification time of the deck.
+            parsed (Parsed): The content, cards and card lines.
+        """
+        size = deck_size(*parsed)
+        with self.lock:
+            old = self.current.pop(key[:2], None)
+            if old is not None:
+                self.used -= self.entries.pop(old)[1]
+            if size > self.budget:
+                return
+            self.entries[key] = (parsed, size)
+            self.current[key[:2]] = key
+            self.used += size
+            self._evict()
+
+    def _evict(self) -> None:
+        """
+        Evicts the least recently used decks until the cache is within budget. Takes no lock,
+        so callers must hold it.
+        """
+        while self.used > self.budget and self.entries:
+            key, (_, size) = self.entries.popitem(last=False)
+            del self.current[key[:2]]
+            self.used -= size
+            self.evictions += 1
+            EVICTIONS.inc()
+
+    def resize(self, budget: int) -> None:
+        """
+        Changes the budget, evicting decks if it shrank.
+
+        Args:
+            budget (int): The most bytes the cached decks may hold.
+        """
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Reports how the cache is doing.
+
+        Returns:
+            Dict[str, int]: The decks and bytes cached, the budget, and the hits, misses and evictions.
+        """
+        with self.lock:
+            return {
+                "decks": len(self.entries),
+                "bytes": self.used,
+                "budget": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+DECK_CACHE = ParsedDeckCache(
+    int(os.environ.get("FLASHCARDS_DECK_CACHE_BYTES", 64 * 1024 * 1024))
+)
@@ -0,0 +1,256 @@
+'''
+Vocabulary coverage of phrase decks by word decks.
+
+Tokenizes every card and keeps an inverted index from each token to the word cards that
+define it, so each phrase card can be checked for words that no word deck defines, and
+phrase decks can be studied with the words they need first. Decks are re-indexed only
+when they change.
+
+Usage:
+    python runner/deckcoverage.py Swedish/flashcards
+    python runner/deckcoverage.py Swedish/flashcards --deck Duolingo/s7fraser.txt
+'''
+
+import argparse, re
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from handlers import *
+
+WordEntry = Tuple[str, int]  # (deck, position of the card in the deck)
+
+
+class CoverageIndex:
+    ARTICLES = {"en", "ett"}
+    TOKEN_RE = re.compile(r"[^\W\d_]+")
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty index.
+
+        Attributes:
+            decks (Dict[str, Tuple[int, bool, List[List[str]]]]): The modification time, whether it
+                is a phrase deck, and the cards of each indexed deck.
+            words (Dict[str, Set[WordEntry]]): Maps each token to the word cards defining it.
+        """
+        self.decks: Dict[str, Tuple[int, bool, List[List[str]]]] = {}
+        self.words: Dict[str, Set[WordEntry]] = {}
+
+    @staticmethod
+    def tokenize(text: str) -> List[str]:
+        """
+        Splits text into lowercase word tokens, dropping punctuation and digits.
+
+        Args:
+            text (str): The text to split.
+
+        Returns:
+            List[str]: The tokens, in order.
+        """
+        return CoverageIndex.TOKEN_RE.findall(text.lower())
+
+    @staticmethod
+    def is_phrase_deck(name: str, cards: List[List[str]]) -> bool:
+        """
+        Decides whether a deck holds phrases or single words.
+
+        Decks named like "s7fraser" are phrase decks and decks named like "... ord" are word
+        decks. Other decks are phrase decks if their terms average more than two tokens.
+
+        Args:
+            name (str): The deck's filename without extension.
+            cards (List[List[str]]): The cards of the deck.
+
+        Returns:
+            bool: True for a phrase deck, False for a word deck.
+        """
+        name = name.lower()
+        if "fraser" in name:
+            return True
+        if name.split()[-1:] == ["ord"]:
+            return False
+        if not cards:
+            return False
+        tokens = sum(len(CoverageIndex.tokenize(card[0])) for card in cards)
+        return tokens / len(cards) > 2
+
+    def _defines(self, term: str) -> Set[str]:
+        """
+        Returns the tokens a word card defines. Articles are left out of multi-word terms,
+        so "en familj" defines "familj" but not "en".
+
+        Args:
+            term (str): The term of the word card.
+
+        Returns:
+            Set[str]: The tokens defined.
+        """
+        tokens = self.tokenize(term)
+        if len(tokens) > 1:
+            return {token for token in tokens if token not in self.ARTICLES}
+        return set(tokens)
+
+    def update(self, files: Iterable[Any], root: Path) -> int:
+        """
+        Brings the index in line with a library, re-indexing only the decks that changed.
+
+        Args:
+            files (Iterable[File]): Every deck of the library.
+            root (Path): The root directory of the library, to key decks by relative path.
+
+        Returns:
+            int: The number of decks indexed or dropped.
+        """
+        changed = 0
+        present = set()
+        for file in files:
+            deck = Path(file.filepath).resolve().relative_to(root).as_posix()
+            present.add(deck)
+            if deck in self.decks and self.decks[deck][0] == file.mtime:
+                continue
+            self.drop(deck)
+            cards = [list(card) for card in file.cards if len(card) >= 2]
+            phrase = self.is_phrase_deck(Path(deck).stem, cards)
+            self.decks[deck] = (file.mtime, phrase, cards)
+            if not phrase:
+                for position, card in enumerate(cards):
+                    for token in self._defines(card[0]):
+                        self.words.setdefault(token, set()).add((deck, position))
+            changed += 1
+        for deck in set(self.decks) - present:
+            self.drop(deck)
+            changed += 1
+        return changed
+
+    def drop(self, deck: str) -> None:
+        """
+        Removes a deck from the index.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+        """
+        if deck not in self.decks:
+            return
+        _, phrase, cards = self.decks.pop(deck)
+        if phrase:
+            return
+        for position, card in enumerate(cards):
+            for token in self._defines(card[0]):
+                entries = self.words.get(token)
+                if entries is not None:
+                    entries.discard((deck, position))
+                    if not entries:
+                        del self.words[token]
+
+    def word_card(self, entry: WordEntry) -> List[str]:
+        """
+        Returns the word card of an index entry.
+
+        Args:
+            entry (WordEntry): The entry.
+
+        Returns:
+            List[str]: The card.
+        """
+        return self.decks[entry[0]][2][entry[1]]
+
+    def unknown_words(self, phrase: str) -> List[str]:
+        """
+        Returns the tokens of a phrase that no word card defines. Articles are not reported,
+        as they are learned with the nouns they come with.
+
+        Args:
+            phrase (str): The phrase.
+
+        Returns:
+            List[str]: The undefined tokens, in order of appearance.
+        """
+        unknown = []
+        for token in self.tokenize(phrase):
+            if token in self.ARTICLES or token in self.words or token in unknown:
+                continue
+            unknown.append(token)
+        return unknown
+
+    def report(self, deck: str) -> List[Tuple[str, List[str]]]:
+        """
+        Lists the undefined words of every phrase in a deck.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+
+        Returns:
+            List[Tuple[str, List[str]]]: (phrase, undefined tokens) pairs.
+
+        Raises:
+            KeyError: If the deck is not indexed.
+        """
+        return [(card[0], self.unknown_words(card[0])) for card in self.decks[deck][2]]
+
+    def phrase_decks(self) -> List[str]:
+        """
+        Returns the indexed phrase decks.
+
+        Returns:
+            List[str]: The deck keys, sorted.
+        """
+        return sorted(deck for deck, (_, phrase, _) in self.decks.items() if phrase)
+
+    def needed_words(
+        self, cards: List[List[str]], prefer: Optional[str] = None
+    ) -> List[WordEntry]:
+        """
+        Finds the word cards that phrase cards need, in the order the phrases first need them.
+
+        Each word card is included once. When a token is defined by several word cards, one
+        from the `prefer` folder is chosen.
+
+        Args:
+            cards (List[List[str]]): The phrase cards, in the order to study them.
+            prefer (Optional[str]): The folder to prefer word cards from, e.g. "Duolingo".
+
+        Returns:
+            List[WordEntry]: The word cards, as (deck, position) entries.
+        """
+        needed: List[WordEntry] = []
+        included: Set[WordEntry] = set()
+        for card in cards:
+            for token in self.tokenize(card[0]):
+                entries = self.words.get(token)
+                if not entries or entries & included:
+                    continue
+                entry = min(
+                    entries,
+                    key=lambda e: (Path(e[0]).parent.name != prefer, e),
+                )
+                included.add(entry)
+                needed.append(entry)
+        return needed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report words of phrase decks that no word deck defines."
+    )
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument(
+        "--deck", help="Only report this deck, relative to the library."
+    )
+    args = parser.parse_args()
+    from helper import Runner
+
+    runner = Runner(args.filepath)
+    index = CoverageIndex()
+    index.update(runner._list_files(), runner.filepath)
+    if args.deck and args.deck not in index.decks:
+        PrintHandler.print_exception(f"Unknown deck: {args.deck}")
+        raise SystemExit(1)
+    for deck in [args.deck] if args.deck else index.phrase_decks():
+        phrases = index.report(deck)
+        covered = sum(1 for _, unknown in phrases if not unknown)
+        PrintHandler.print_notice(
+            f"{deck}: {covered}/{len(phrases)} phrases fully covered"
+        )
+        for phrase, unknown in phrases:
+            if unknown:
+                print(f"\t{phrase}: {', '.join(unknown)}")
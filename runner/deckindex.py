@@ -0,0 +1,359 @@
+'''
+Byte-offset index of a deck file, for editing cards without rewriting the file.
+
+Every card, comment and blank line is indexed with its byte offset, so an edit only writes
+the bytes it changes. An edit that keeps the line's length is written in place. Otherwise
+the whole old line is overwritten with a "#~~~" tombstone comment, so no part of a multibyte
+character is left behind, and the new line is appended. The file is compacted, in its
+logical order and with every comment kept, once tombstones make up a quarter of it. Until
+then a card moved by an edit is read from the end of the file, after every other card.
+
+Writes can take a lock of the deck, so sessions of any profile never write it at the same
+time, and refuse to write a file changed since it was indexed.
+'''
+
+import contextlib, os
+from pathlib import Path
+from typing import ContextManager, List, Optional
+
+from handlers import *
+from progress import FileLock
+
+
+class IndexedLine:
+    __slots__ = ("kind", "start", "length", "text")
+
+    def __init__(self, kind: str, start: int, length: int, text: str) -> None:
+        """
+        Initializes an indexed line.
+
+        Args:
+            kind (str): "card", "comment", "blank" or "tombstone".
+            start (int): The byte offset of the line in the file.
+            length (int): The length of the line in bytes, including its line ending.
+            text (str): The text of the line, without its line ending.
+        """
+        self.kind = kind
+        self.start = start
+        self.length = length
+        self.text = text
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}({self.kind!r}, {self.start}, {self.length}, {self.text!r})"
+
+
+class DeckIndex:
+    TOMBSTONE = b"#~"
+    COMPACT_RATIO = 0.25
+
+    def __init__(self, filepath: Path, lock: Optional[FileLock] = None) -> None:
+        """
+        Indexes a deck file.
+
+        Args:
+            filepath (Path): The deck file.
+            lock (Optional[FileLock]): The lock to hold while writing, shared by everything
+                writing the deck.
+
+        Attributes:
+            lines (List[IndexedLine]): The live lines in their logical order. Lines moved by an
+                edit keep their place here, while being at the end of the file.
+            size (int): The size of the file in bytes.
+            dead (int): The bytes taken by tombstones.
+            stamp (tuple): The size and modification time the index was built for.
+            lock (Optional[FileLock]): The lock held while writing.
+        """
+        self.filepath: Path = Path(filepath)
+        self.lock: Optional[FileLock] = lock
+        self.lines: List[IndexedLine] = []
+        self.size: int = 0
+        self.dead: int = 0
+        self.stamp: tuple = ()
+        self.build()
+
+    @staticmethod
+    def classify(text: str) -> str:
+        """
+        Classifies a line the same way `File._parse_file` decides what is a card.
+
+        Args:
+            text (str): The line, without its line ending.
+
+        Returns:
+            str: "card", "comment", "blank" or "tombstone".
+        """
+        stripped = text.strip()
+        if stripped == "":
+            return "blank"
+        if text.startswith(DeckIndex.TOMBSTONE.decode()):
+            return "tombstone"
+        if stripped.startswith("#"):
+            return "comment"
+        return "card"
+
+    def build(self) -> None:
+        """
+        Reads the file and indexes every line.
+        """
+        with open(self.filepath, "rb") as file:
+            data = file.read()
+        self.lines, self.dead, offset = [], 0, 0
+        for raw in data.splitlines(keepends=True):
+            text = raw.rstrip(b"\r\n").decode("utf-8")
+            line = IndexedLine(self.classify(text), offset, len(raw), text)
+            if line.kind == "tombstone":
+                self.dead += line.length
+            else:
+                self.lines.append(line)
+            offset += len(raw)
+        self.size = offset
+        self.stamp = self._stat()
+
+    def _stat(self) -> tuple:
+        """
+        Returns the size and modification time of the file.
+
+        Returns:
+            tuple: (size, modification time in nanoseconds).
+        """
+        stat = self.filepath.stat()
+        return stat.st_size, stat.st_mtime_ns
+
+    def stale(self) -> bool:
+        """
+        Returns whether the file changed since it was indexed.
+
+        Returns:
+            bool: True if the index has to be rebuilt.
+        """
+        try:
+            return self._stat() != self.stamp
+        except FileNotFoundError:
+            return True
+
+    def _writing(self) -> ContextManager:
+        """
+        Holds the lock, if any, while writing, checking that the file was not changed by
+        anyone else since it was indexed.
+
+        Returns:
+            ContextManager: The held lock.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        stack = contextlib.ExitStack()
+        if self.lock is not None:
+            stack.enter_context(self.lock)
+        if self.stale():
+            stack.close()
+            raise ValueError(f"{self.filepath} changed on disk.")
+        return stack
+
+    def cards(self) -> List[IndexedLine]:
+        """
+        Returns the card lines in the order they are in the file, which is the order
+        `File` parses them in.
+
+        Returns:
+            List[IndexedLine]: The card lines.
+        """
+        return sorted(
+            (line for line in self.lines if line.kind == "card"),
+            key=lambda line: line.start,
+        )
+
+    def _write_at(self, offset: int, data: bytes) -> None:
+        """
+        Writes bytes at an offset of the file, in place.
+
+        Args:
+            offset (int): Where to write.
+            data (bytes): What to write.
+        """
+        with open(self.filepath, "r+b") as file:
+            file.seek(offset)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _ending(self, line: IndexedLine) -> bytes:
+        """
+        Returns the line ending of an indexed line, so patches keep the file's style.
+
+        Args:
+            line (IndexedLine): The line.
+
+        Returns:
+            bytes: b"\\r\\n", b"\\n", or b"" for a last line without one.
+        """
+        return {2: b"\r\n", 1: b"\n", 0: b""}[
+            line.length - len(line.text.encode("utf-8"))
+        ]
+
+    def patch(self, line: IndexedLine, text: str) -> bool:
+        """
+        Rewrites a line in place if the new text fits it exactly. Comments are padded with
+        trailing spaces to fit.
+
+        Args:
+            line (IndexedLine): The line to rewrite.
+            text (str): The new text, without a line ending.
+
+        Returns:
+            bool: True if the line was rewritten, False if it does not fit.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        with self._writing():
+            return self._patch(line, text)
+
+    def _patch(self, line: IndexedLine, text: str) -> bool:
+        """
+        Rewrites a line in place if it fits, without taking the lock.
+
+        Args:
+            line (IndexedLine): The line to rewrite.
+            text (str): The new text, without a line ending.
+
+        Returns:
+            bool: True if the line was rewritten, False if it does not fit.
+        """
+        ending = self._ending(line)
+        data = text.encode("utf-8")
+        room = line.length - len(ending)
+        if self.classify(text) == "comment" and len(data) < room:
+            data += b" " * (room - len(data))
+        if len(data) != room:
+            return False
+        self._write_at(line.start, data)
+        line.text = data.decode("utf-8")
+        line.kind = self.classify(line.text)
+        self.stamp = self._stat()
+        return True
+
+    def _append(self, texts: List[str]) -> List[IndexedLine]:
+        """
+        Appends lines to the end of the file.
+
+        Args:
+            texts (List[str]): The lines, without line endings.
+
+        Returns:
+            List[IndexedLine]: The appended lines.
+        """
+        data = b""
+        if self.size:
+            with open(self.filepath, "rb") as file:
+                file.seek(self.size - 1)
+                if file.read(1) != b"\n":
+                    data = b"\n"  # end the last line before appending
+            for line in self.lines:
+                if line.start + line.length == self.size:
+                    line.length += len(data)
+        appended, offset = [], self.size + len(data)
+        for text in texts:
+            raw = text.encode("utf-8") + b"\n"
+            appended.append(IndexedLine(self.classify(text), offset, len(raw), text))
+            offset += len(raw)
+            data += raw
+        with open(self.filepath, "ab") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        self.size = offset
+        self.stamp = self._stat()
+        return appended
+
+    def replace(self, line: IndexedLine, texts: List[str]) -> List[IndexedLine]:
+        """
+        Replaces a line with one or more lines, such as an edited card followed by a note.
+
+        A single line that fits is patched in place. Otherwise the old line becomes a tombstone
+        and the new lines are appended, keeping the old line's place in the logical order.
+        In the file they are at the end, after every other card, until it is compacted, so
+        `cards` and anything parsing the file see the card moved to the end of the deck.
+
+        Args:
+            line (IndexedLine): The line to replace.
+            texts (List[str]): The new lines, without line endings.
+
+        Returns:
+            List[IndexedLine]: The lines now standing for the old one.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        with self._writing():
+            if len(texts) == 1 and self._patch(line, texts[0]):
+                return [line]
+            position = self.lines.index(line)
+            room = line.length - len(self._ending(line))
+            self._write_at(line.start, (self.TOMBSTONE + b"~" * room)[:room])
+            self.dead += line.length
+            appended = self._append(texts)
+            self.lines[position : position + 1] = appended
+            if self.dead > self.size * self.COMPACT_RATIO:
+                self._compact()
+            return appended
+
+    def maybe_compact(self) -> bool:
+        """
+        Compacts the file if tombstones take up too much of it.
+
+        Returns:
+            bool: True if the file was compacted.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        if self.dead <= self.size * self.COMPACT_RATIO:
+            return False
+        self.compact()
+        return True
+
+    def set_header(self, text: str, prefix: str) -> bool:
+        """
+        Sets the first line of the file, such as its score line. An existing header is rewritten
+        in place if the new one fits; otherwise the file is compacted with the new header.
+
+        Args:
+            text (str): The new header, a comment.
+            prefix (str): How an existing header starts, e.g. "# Score:". If the first line
+                does not start with it, the header is inserted before it.
+
+        Returns:
+            bool: True if the header was written in place.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        with self._writing():
+            first = self.lines[0] if self.lines else None
+            if first is not None and first.start == 0 and first.text.startswith(prefix):
+                if self._patch(first, text):
+                    return True
+                first.text = text
+            else:
+                self.lines.insert(0, IndexedLine(self.classify(text), 0, 0, text))
+            self._compact()
+            return False
+
+    def compact(self) -> None:
+        """
+        Rewrites the file in its logical order without tombstones, keeping every comment.
+
+        Raises:
+            ValueError: If the file changed since it was indexed.
+        """
+        with self._writing():
+            self._compact()
+
+    def _compact(self) -> None:
+        """
+        Rewrites the file in its logical order, without taking the lock.
+        """
+        texts = "".join(f"{line.text}\n" for line in self.lines)
+        FileHandler.atomic_write(self.filepath, texts)
+        self.build()
@@ -0,0 +1,338 @@
+'''
+Cross-deck duplicate and conflict detection.
+
+Indexes every card of a library by its normalized term and definition, and reports exact
+duplicates, terms defined differently in different places, and near-duplicate terms. Near
+duplicates are found with MinHash signatures over character trigrams, bucketed with LSH,
+so only cards sharing a bucket are compared. Decks are re-indexed only when they change.
+
+Usage:
+    python runner/duplicates.py Swedish/flashcards
+'''
+
+import argparse, random, re, zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+from handlers import *
+
+Entry = Tuple[str, str, str]  # (deck, term, definition)
+
+
+class DuplicateIndex:
+    PRIME = (1 << 61) - 1
+
+    def __init__(
+        self, bands: int = 8, rows: int = 4, threshold: float = 0.6, seed: int = 1
+    ) -> None:
+        """
+        Initializes an empty index.
+
+        With `bands` bands of `rows` rows, terms whose trigram Jaccard similarity is around
+        (1 / bands) ** (1 / rows) or more are likely to share a bucket.
+
+        Args:
+            bands (int): The number of LSH bands.
+            rows (int): The number of MinHash values per band.
+            threshold (float): The trigram Jaccard similarity at which two terms are near duplicates.
+            seed (int): The seed of the MinHash functions.
+
+        Attributes:
+            decks (Dict[str, Tuple[int, List[Entry]]]): The modification time and entries of each indexed deck.
+            by_term (Dict[str, Dict[Entry, int]]): Maps each normalized term to its entries,
+                with how many times each occurs.
+            buckets (Dict[Tuple[int, Tuple[int, ...]], Set[str]]): Maps each LSH band value to the normalized terms in it.
+            signatures (Dict[str, Tuple[int, ...]]): The MinHash signature of each normalized term.
+        """
+        self.bands: int = bands
+        self.rows: int = rows
+        self.threshold: float = threshold
+        generator = random.Random(seed)
+        self.hashes: List[Tuple[int, int]] = [
+            (generator.randrange(1, self.PRIME), generator.randrange(self.PRIME))
+            for _ in range(bands * rows)
+        ]
+        self.decks: Dict[str, Tuple[int, List[Entry]]] = {}
+        self.by_term: Dict[str, Dict[Entry, int]] = {}
+        self.buckets: Dict[Tuple[int, Tuple[int, ...]], Set[str]] = {}
+        self.signatures: Dict[str, Tuple[int, ...]] = {}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalizes a term or definition, ignoring case, punctuation and spacing.
+
+        Args:
+            text (str): The text to normalize.
+
+        Returns:
+            str: The normalized text.
+        """
+        return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+    @staticmethod
+    def key(card: List[str]) -> Tuple[str, str]:
+        """
+        Returns the key two cards share if they are exact duplicates.
+
+        Args:
+            card (List[str]): The card.
+
+        Returns:
+            Tuple[str, str]: The normalized term and definition.
+        """
+        definition = card[1] if len(card) > 1 else ""
+        return DuplicateIndex.normalize(card[0]), DuplicateIndex.normalize(definition)
+
+    @staticmethod
+    def trigrams(term: str) -> Set[str]:
+        """
+        Returns the character trigrams of a normalized term, padded at both ends.
+
+        Args:
+            term (str): The normalized term.
+
+        Returns:
+            Set[str]: The trigrams.
+        """
+        padded = f"  {term} "
+        return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+    def _signature(self, term: str) -> Tuple[int, ...]:
+        """
+        Computes the MinHash signature of a normalized term.
+
+        Args:
+            term (str): The normalized term.
+
+        Returns:
+            Tuple[int, ...]: One minimum per hash function.
+        """
+        grams = [zlib.crc32(gram.encode()) for gram in self.trigrams(term)]
+        return tuple(
+            min((a * g + b) % self.PRIME for g in grams) for a, b in self.hashes
+        )
+
+    def _bands(
+        self, signature: Tuple[int, ...]
+    ) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        """
+        Splits a signature into its LSH band values.
+
+        Args:
+            signature (Tuple[int, ...]): The MinHash signature.
+
+        Returns:
+            Iterable[Tuple[int, Tuple[int, ...]]]: (band number, band values) pairs.
+        """
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows]
+
+    def _add(self, entry: Entry) -> None:
+        """
+        Adds an entry to the term and bucket maps.
+
+        Args:
+            entry (Entry): The entry to add.
+        """
+        term = self.normalize(entry[1])
+        if term not in self.by_term:
+            self.by_term[term] = {}
+            self.signatures[term] = self._signature(term)
+            for band in self._bands(self.signatures[term]):
+                self.buckets.setdefault(band, set()).add(term)
+        entries = self.by_term[term]
+        entries[entry] = entries.get(entry, 0) + 1
+
+    def _remove(self, entry: Entry) -> None:
+        """
+        Removes an entry from the term and bucket maps.
+
+        Args:
+            entry (Entry): The entry to remove.
+        """
+        term = self.normalize(entry[1])
+        entries = self.by_term.get(term)
+        if entries is None or entry not in entries:
+            return
+        entries[entry] -= 1
+        if not entries[entry]:
+            del entries[entry]
+        if not entries:
+            del self.by_term[term]
+            for band in self._bands(self.signatures.pop(term)):
+                self.buckets[band].discard(term)
+                if not self.buckets[band]:
+                    del self.buckets[band]
+
+    def update(self, files: Iterable[Any], root: Path) -> int:
+        """
+        Brings the index in line with a library, re-indexing only the decks that changed.
+
+        Args:
+            files (Iterable[File]): Every deck of the library.
+            root (Path): The root directory of the library, to key decks by relative path.
+
+        Returns:
+            int: The number of decks indexed or dropped.
+        """
+        changed = 0
+        present = set()
+        for file in files:
+            present.add(self.deck_key(file, root))
+            changed += self.update_deck(file, root)
+        for deck in set(self.decks) - present:
+            self.drop(deck)
+            changed += 1
+        return changed
+
+    @staticmethod
+    def deck_key(file: Any, root: Path) -> str:
+        """
+        Returns the key a deck is indexed under.
+
+        Args:
+            file (File): The deck.
+            root (Path): The root directory of the library.
+
+        Returns:
+            str: The deck's path relative to the library, with forward slashes.
+        """
+        return Path(file.filepath).resolve().relative_to(root).as_posix()
+
+    def update_deck(self, file: Any, root: Path) -> bool:
+        """
+        Re-indexes one deck if it changed since it was indexed.
+
+        Args:
+            file (File): The deck, as loaded.
+            root (Path): The root directory of the library, to key decks by relative path.
+
+        Returns:
+            bool: Whether the deck was indexed.
+        """
+        deck = self.deck_key(file, root)
+        if deck in self.decks and self.decks[deck][0] == file.mtime:
+            return False
+        self.drop(deck)
+        entries = [
+            (deck, card[0], card[1] if len(card) > 1 else "") for card in file.cards
+        ]
+        for entry in entries:
+            self._add(entry)
+        self.decks[deck] = (file.mtime, entries)
+        return True
+
+    def conflicts_of(
+        self, file: Any, root: Path
+    ) -> List[Tuple[List[str], List[Entry]]]:
+        """
+        Finds the cards of a deck whose term is defined differently elsewhere in the library.
+
+        Args:
+            file (File): The deck, indexed with `update_deck`.
+            root (Path): The root directory of the library.
+
+        Returns:
+            List[Tuple[List[str], List[Entry]]]: Each conflicting card with the entries of
+                other decks defining its term differently.
+        """
+        deck = self.deck_key(file, root)
+        found = []
+        for card in file.cards:
+            term, definition = self.key(card)
+            others = [
+                entry
+                for entry in self.by_term.get(term, {})
+                if entry[0] != deck and self.normalize(entry[2]) != definition
+            ]
+            if others:
+                found.append((card, sorted(others)))
+        return found
+
+    def drop(self, deck: str) -> None:
+        """
+        Removes a deck from the index.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+        """
+        if deck in self.decks:
+            for entry in self.decks.pop(deck)[1]:
+                self._remove(entry)
+
+    def duplicates(self) -> List[List[Entry]]:
+        """
+        Finds cards that appear more than once with the same term and definition.
+
+        Returns:
+            List[List[Entry]]: Groups of duplicate entries.
+        """
+        groups = []
+        for entries in self.by_term.values():
+            by_definition: Dict[str, List[Entry]] = {}
+            for entry, count in entries.items():
+                by_definition.setdefault(self.normalize(entry[2]), []).extend(
+                    [entry] * count
+                )
+            groups += [sorted(g) for g in by_definition.values() if len(g) > 1]
+        return sorted(groups)
+
+    def conflicts(self) -> List[List[Entry]]:
+        """
+        Finds terms that are defined differently in different places.
+
+        Returns:
+            List[List[Entry]]: Groups of entries sharing a term but not a definition.
+        """
+        groups = []
+        for entries in self.by_term.values():
+            if len({self.normalize(entry[2]) for entry in entries}) > 1:
+                groups.append(sorted(entries))
+        return sorted(groups)
+
+    def near_duplicates(self) -> List[Tuple[float, str, str]]:
+        """
+        Finds pairs of different terms that are spelled almost the same.
+
+        Only terms sharing an LSH bucket are compared.
+
+        Returns:
+            List[Tuple[float, str, str]]: (similarity, term, term) triples, most similar first.
+        """
+        pairs: Set[Tuple[str, str]] = set()
+        for terms in self.buckets.values():
+            if len(terms) > 1:
+                ordered = sorted(terms)
+                for i, first in enumerate(ordered):
+                    for second in ordered[i + 1 :]:
+                        pairs.add((first, second))
+        found = []
+        for first, second in pairs:
+            a, b = self.trigrams(first), self.trigrams(second)
+            similarity = len(a & b) / len(a | b)
+            if similarity >= self.threshold:
+                found.append((round(similarity, 2), first, second))
+        return sorted(found, key=lambda pair: (-pair[0], pair[1], pair[2]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Report duplicate and conflicting cards across a library."
+    )
+    parser.add_argument("filepath", help="The root directory of the library.")
+    args = parser.parse_args()
+    from helper import Runner
+
+    runner = Runner(args.filepath)
+    index = DuplicateIndex()
+    index.update(runner._list_files(), runner.filepath)
+    PrintHandler.print_notice("Exact duplicates:")
+    for group in index.duplicates():
+        print("\t" + " | ".join(": ".join(entry) for entry in group))
+    PrintHandler.print_notice("Conflicting definitions:")
+    for group in index.conflicts():
+        print("\t" + " | ".join(": ".join(entry) for entry in group))
+    PrintHandler.print_notice("Near duplicates:")
+    for similarity, first, second in index.near_duplicates():
+        print(f"\t{similarity:.2f} {first} ~ {second}")
@@ -0,0 +1,253 @@
+'''
+Batch grading of exams taken on paper or in a text editor.
+
+A deck is handed out as a quiz sheet listing the prompts, each student fills in the
+answers, and a directory of returned sheets is graded at once over a process pool with
+the same matching rule as studying. Writes a report per student and a report per card.
+
+Answer sheets are text files named after the student, with one "prompt: answer" line per
+card. Lines starting with # are ignored, and prompts left out are graded as wrong.
+
+Usage:
+    python runner/grading.py Swedish/flashcards/Duolingo/s7.txt --blank quiz.txt
+    python runner/grading.py Swedish/flashcards/Duolingo/s7.txt sheets/ --out reports/
+'''
+
+import argparse, csv, os, time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from helper import *
+
+Result = Tuple[str, List[int]]  # (student, indices of the cards answered wrong)
+Failure = Tuple[str, str]  # (sheet, why it could not be graded)
+
+_key: Optional["AnswerKey"] = None  # the answer key of a worker process
+
+
+class AnswerKey:
+    def __init__(self, cards: List[List[str]], flip: bool = True) -> None:
+        """
+        Builds the answer key of a deck.
+
+        Args:
+            cards (List[List[str]]): The cards of the deck.
+            flip (bool): Whether the definition is shown and the term answered, as in the
+                "Flip term and definition" setting.
+
+        Attributes:
+            cards (List[List[str]]): The cards that have both sides.
+            term (int): The index of the side printed on the sheet.
+            definition (int): The index of the side the student has to answer.
+            prompts (Dict[str, List[int]]): The indices of the cards shown with each prompt.
+        """
+        self.cards: List[List[str]] = [card for card in cards if len(card) >= 2]
+        self.term: int = 1 if flip else 0
+        self.definition: int = 0 if flip else 1
+        self.prompts: Dict[str, List[int]] = {}
+        for i, card in enumerate(self.cards):
+            self.prompts.setdefault(card[self.term], []).append(i)
+
+    def blank(self) -> str:
+        """
+        Renders the quiz sheet to hand out.
+
+        Returns:
+            str: One "prompt: " line per card.
+        """
+        return "".join(f"{card[self.term]}: \n" for card in self.cards)
+
+    def grade(self, text: str) -> List[int]:
+        """
+        Grades an answer sheet. A prompt shared by several cards takes its answers in order.
+
+        Args:
+            text (str): The content of the sheet.
+
+        Returns:
+            List[int]: The indices of the cards answered wrong or not at all, ascending.
+        """
+        answered = [False] * len(self.cards)
+        used: Dict[str, int] = {}
+        for line in text.splitlines():
+            if line.startswith("#") or ": " not in line:
+                continue
+            prompt, attempt = line.split(": ", 1)
+            indices = self.prompts.get(prompt)
+            if indices is None or used.get(prompt, 0) >= len(indices):
+                continue
+            i = indices[used.get(prompt, 0)]
+            used[prompt] = used.get(prompt, 0) + 1
+            answered[i] = CardHandler.check_answer(
+                attempt, self.cards[i][self.definition]
+            )
+        return [i for i, correct in enumerate(answered) if not correct]
+
+
+def _init_worker(key: AnswerKey) -> None:
+    """
+    Hands the answer key to a worker process once, instead of with every sheet.
+
+    Args:
+        key (AnswerKey): The answer key.
+    """
+    global _key
+    _key = key
+
+
+def _grade_sheets(paths: List[str]) -> Tuple[List[Result], List[Failure]]:
+    """
+    Grades a batch of sheets in a worker process. A sheet that cannot be read fails on its
+    own, without failing the rest of the batch.
+
+    Args:
+        paths (List[str]): The paths of the sheets.
+
+    Returns:
+        Tuple[List[Result], List[Failure]]: The result of each sheet graded, and each sheet
+            that could not be read.
+    """
+    results, failures = [], []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8-sig") as file:
+                text = file.read()
+        except (UnicodeDecodeError, OSError) as e:
+            failures.append((path, str(e)))
+            continue
+        results.append((Path(path).stem, _key.grade(text)))
+    return results, failures
+
+
+class ExamGrader:
+    def __init__(
+        self, key: AnswerKey, workers: Optional[int] = None, batch: int = 256
+    ) -> None:
+        """
+        Initializes a grader.
+
+        Args:
+            key (AnswerKey): The answer key of the exam.
+            workers (Optional[int]): The number of processes. Defaults to the number of CPUs.
+            batch (int): The number of sheets sent to a process at a time.
+        """
+        self.key = key
+        self.workers = workers or os.cpu_count() or 1
+        self.batch = batch
+
+    def grade(self, sheets: List[Path]) -> Tuple[List[Result], List[Failure]]:
+        """
+        Grades every sheet over the process pool.
+
+        Args:
+            sheets (List[Path]): The answer sheets.
+
+        Returns:
+            Tuple[List[Result], List[Failure]]: The result of each sheet, sorted by student,
+                and the sheets that could not be read, sorted by path.
+        """
+        paths = [str(sheet) for sheet in sheets]
+        batches = [paths[i : i + self.batch] for i in range(0, len(paths), self.batch)]
+        results: List[Result] = []
+        failures: List[Failure] = []
+        if self.workers == 1 or len(batches) <= 1:
+            _init_worker(self.key)
+            graded = map(_grade_sheets, batches)
+        else:
+            with ProcessPoolExecutor(
+                self.workers, initializer=_init_worker, initargs=(self.key,)
+            ) as pool:
+                graded = list(pool.map(_grade_sheets, batches))
+        for batch_results, batch_failures in graded:
+            results += batch_results
+            failures += batch_failures
+        return sorted(results), sorted(failures)
+
+    def write_reports(self, results: List[Result], out: Path) -> Tuple[Path, Path]:
+        """
+        Writes the per-student and per-card reports as CSV.
+
+        Args:
+            results (List[Result]): The graded sheets.
+            out (Path): The directory to write the reports to.
+
+        Returns:
+            Tuple[Path, Path]: The student report and the card report.
+        """
+        out.mkdir(parents=True, exist_ok=True)
+        total = len(self.key.cards)
+        missed = [0] * total
+        students = out / "students.csv"
+        with open(students, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["student", "correct", "total", "score", "wrong"])
+            for student, wrong in results:
+                for i in wrong:
+                    missed[i] += 1
+                writer.writerow(
+                    [
+                        student,
+                        total - len(wrong),
+                        total,
+                        MathHandler.calc_last_score(len(wrong), total) if total else 0,
+                        " | ".join(self.key.cards[i][self.key.term] for i in wrong),
+                    ]
+                )
+        cards = out / "cards.csv"
+        with open(cards, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["prompt", "answer", "correct", "wrong", "percent correct"])
+            for i, card in enumerate(self.key.cards):
+                right = len(results) - missed[i]
+                writer.writerow(
+                    [
+                        card[self.key.term],
+                        card[self.key.definition],
+                        right,
+                        missed[i],
+                        round(right / len(results) * 100) if results else 0,
+                    ]
+                )
+        return students, cards
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grade answer sheets against a deck.")
+    parser.add_argument("deck", help="The deck the exam was made from.")
+    parser.add_argument("sheets", nargs="?", help="The directory of answer sheets.")
+    parser.add_argument(
+        "--out", help="Where to write the reports. Defaults to the sheets."
+    )
+    parser.add_argument(
+        "--blank", help="Write the quiz sheet to hand out to this file."
+    )
+    parser.add_argument(
+        "--no-flip",
+        dest="flip",
+        action="store_false",
+        help="Show terms and ask for definitions.",
+    )
+    parser.add_argument("--workers", type=int)
+    args = parser.parse_args()
+    key = AnswerKey(File(args.deck).cards, args.flip)
+    if args.blank:
+        FileHandler.atomic_write(args.blank, key.blank())
+        PrintHandler.print_notice(
+            f"Wrote a quiz of {len(key.cards)} cards to {args.blank}"
+        )
+    if args.sheets:
+        sheets = sorted(Path(args.sheets).glob("*.txt"))
+        grader = ExamGrader(key, args.workers)
+        started = time.perf_counter()
+        results, failures = grader.grade(sheets)
+        elapsed = time.perf_counter() - started
+        reports = grader.write_reports(results, Path(args.out or args.sheets))
+        PrintHandler.print_notice(
+            f"Graded {len(results)} sheets in {elapsed:.2f}s "
+            f"({len(results) / max(elapsed, 1e-9):.0f}/s)"
+        )
+        for sheet, reason in failures:
+            PrintHandler.print_exception(f"Could not grade {sheet}: {reason}")
+        for report in reports:
+            PrintHandler.print_notice(f"Wrote {report}")
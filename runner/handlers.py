@@ -1,7 +1,16 @@
-import sys, time, random, inspect, os
+import sys, time, random, inspect, os, stat, tempfile
 from pathlib import Path
 from typing import List, Type, Any, Optional
 
+if sys.platform.startswith("win"):
+    import msvcrt
+else:
+    import termios, tty
+
+# read once at import, as reading the umask sets it for every thread in between
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
 
 class TypeHandler:
     @staticmethod
@@ -284,6 +293,67 @@ class FileHandler:
         """
         return str(Path(filepath).resolve())
 
+    @staticmethod
+    def file_mode(filename):
+        """
+        Returns the permissions a file written over the given path should have. Temporary
+        files are only readable by their owner, so they are given these before replacing it.
+
+        Args:
+            filename (str or Path): The path about to be written.
+
+        Returns:
+            int: The permission bits of the existing file, or those of a new file under the
+                umask the program started with.
+        """
+        try:
+            return stat.S_IMODE(os.stat(filename).st_mode)
+        except FileNotFoundError:
+            return 0o666 & ~_UMASK
+
+    @staticmethod
+    def set_mode(fd, mode):
+        """
+        Sets the permissions of an open file, where the platform supports it.
+
+        Args:
+            fd (int): The file descriptor.
+            mode (int): The permission bits.
+        """
+        if hasattr(os, "fchmod"):  # not on Windows before Python 3.13
+            os.fchmod(fd, mode)
+
+    @staticmethod
+    def atomic_write(filename, text, mode=None):
+        """
+        Writes text to a file atomically, so readers never see a partially written file.
+
+        The text is written to a temporary file in the same directory, flushed to disk,
+        and then renamed over the target. The file keeps the permissions of the target, or
+        gets the default permissions of a new file if there is none.
+
+        Args:
+            filename (str or Path): The path to write to.
+            text (str): The content to write.
+            mode (int, optional): The permissions to give the file instead.
+        """
+        path = Path(filename)
+        if mode is None:
+            mode = FileHandler.file_mode(path)
+        fd, temp_name = tempfile.mkstemp(
+            dir=path.parent, prefix=f".{path.name}.", suffix=".tmp"
+        )
+        try:
+            FileHandler.set_mode(fd, mode)
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(text)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_name, path)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+
 
 class CardHandler:
     @staticmethod
@@ -306,6 +376,20 @@ class CardHandler:
             cards.append(pair)
         return cards
 
+    @staticmethod
+    def check_answer(attempt, expected):
+        """
+        Checks an answer the way every study mode and the exam grader do.
+
+        Args:
+            attempt (str): The answer given.
+            expected (str): The side of the card that had to be answered.
+
+        Returns:
+            bool: True if the answer matches exactly, False otherwise.
+        """
+        return attempt == expected
+
     @staticmethod
     def display_cards(cards, attempt_number, filename, settings):
         """
@@ -355,6 +439,25 @@ class CardHandler:
 
 
 class IOHandler:
+    @staticmethod
+    def read_key():
+        """
+        Reads one key press from the terminal, without waiting for Enter.
+
+        Returns:
+            str: The character typed. Enter is "\n" and Backspace is "\x7f" or "\b".
+        """
+        if OSHandler.get_OS() == "windows":
+            key = msvcrt.getwch()
+            return "\n" if key == "\r" else key
+        fd = sys.stdin.fileno()
+        settings = termios.tcgetattr(fd)
+        try:
+            tty.setcbreak(fd)
+            return sys.stdin.read(1)
+        finally:
+            termios.tcsetattr(fd, termios.TCSADRAIN, settings)
+
     @staticmethod
     def handle_boolean_input(message):
         """
@@ -461,12 +564,11 @@ class IOHandler:
             score (int): The score to write.
             filename (str): The filename to write to.
         """
-        with open(filename, "r") as file:
-            oc = file.readlines()[1:]
-            oc = "".join(oc)
-        with open(filename, "w") as file:
-            scoreline = f"# Score: {score}"
-            file.write(scoreline + "\n" + oc)
+        from deckindex import DeckIndex  # imported here, as deckindex builds on this module
+
+        # pad to the widest score, so later scores are written in place
+        scoreline = f"# Score: {score}".ljust(len("# Score: 100"))
+        DeckIndex(filename).set_header(scoreline, "# Score:")
 
 
 class MenuHandler:
@@ -567,10 +669,7 @@ class PrintHandler:
         Args:
             list (list): The list of items to print.
         """
-        output = ""
-        for i, item in enumerate(list_):
-            output += f"{i+1}. {item}\n"
-        print(output)
+        print("".join(f"{i+1}. {item}\n" for i, item in enumerate(list_)))
 
     @staticmethod
     def print_notice(message, end="\n"):
@@ -1,27 +1,48 @@
-import time, random
+import time, random, getpass, threading, uuid
 from pathlib import Path
-from typing import List, Any, Tuple, Optional, Union
+from typing import List, Any, Tuple, Optional, Union, Dict
 from io import TextIOWrapper
 from queue import Queue  # for typing
 
 from handlers import *
+from similarity import *
+from progress import *
+from journal import *
+from storage import *
+from duplicates import *
+from deckcoverage import *
+from browser import *
+from prefetch import *
+from metrics import *
+from deckindex import *
+from deckcache import *
 
 
 class File:
-    def __init__(self, filepath: str) -> None:
+    def __init__(
+        self, filepath: str, backend: Optional[TextBackend] = None, lazy: bool = False
+    ) -> None:
         """
         Initializes an instance of the class with the specified file path.
 
         Args:
             filepath (str): The path to the file to be processed.
+            backend (Optional[TextBackend]): The storage backend to read the cards from. Defaults to the text file.
+            lazy (bool): Whether to leave reading the file to the first `load` or `_refresh`,
+                such as for a queued deck the prefetcher reads ahead of time.
 
         Attributes:
             filepath (Path): The path to the file.
             basename (Path): The base name of the file, extracted from the file path.
             parent (Path): The parent directory of the file.
             subpath (Path): A subpath formed by combining the parent directory with the file's base name.
+            backend (TextBackend): The storage backend the cards are read from.
             content (str): The content of the file, parsed from its contents.
             cards (List[List[str]]) The content of the file parsed into cards
+            mtime (int): The modification time of the file when it was last read, in nanoseconds.
+            lines (List[Tuple[str, List[str]]]): Each card line of the file with its parsed card, in file order.
+            index (Optional[DeckIndex]): The byte offsets of the file's lines, built on the first edit.
+            loaded (bool): Whether the file has been read.
 
         Raises:
             FileNotFoundError: If the file specified by `filepath` does not exist.
@@ -31,8 +52,53 @@ class File:
         self.basename: Path = Path(self.filepath.name)
         self.parent: Path = Path(self.filepath.parent.name)
         self.subpath: Path = Path(self.parent / self.basename)
-        self.content: str = self._open_file(filepath)
-        self.cards: List[List[str]] = self._parse_cards(self.content)
+        self.backend: TextBackend = backend or TextBackend()
+        self.mtime: int = 0
+        self.content: Optional[str] = None
+        self.cards: List[List[str]] = []
+        self.lines: List[Tuple[str, List[str]]] = []
+        self.index: Optional[DeckIndex] = None
+        self.loaded: bool = False
+        if not lazy:
+            self.load()
+
+    def load(self) -> None:
+        """
+        Reads and parses the file, if it has not been yet.
+        """
+        if self.loaded:
+            return
+        self.mtime = self._stat_mtime()
+        with DECK_LOAD.time():
+            self._load()
+        self.loaded = True
+
+    def _load(self) -> None:
+        """
+        Reads and parses the file, or copies its cards from `DECK_CACHE` if this version of
+        it was parsed before. The cached cards are copied because studying shuffles and
+        edits them in place.
+        """
+        key = (type(self.backend).__name__, str(self.filepath.absolute()), self.mtime)
+        cached = DECK_CACHE.get(key) if self.mtime else None
+        if cached is not None:
+            self.content = cached[0]
+            self.cards = list(map(list, cached[1]))
+            self.lines = list(zip(cached[2], self.cards))
+            return
+        self.content = self.backend.read_content(self)
+        self.cards = self._parse_cards(self.content)
+        lines = self._split_lines(self.content)
+        self.lines = list(zip(lines, self.cards))
+        if self.mtime and self.content is not None:
+            DECK_CACHE.put(
+                key,
+                (
+                    self.content,
+                    tuple(map(tuple, self.cards)),
+                    tuple(lines),
+                ),
+            )
 
     def __str__(self) -> str:
         """
@@ -139,6 +205,165 @@ class File:
             cards.append(pair)
         return cards
 
+    def _split_lines(self, content: str) -> List[str]:
+        """
+        Splits parsed content into its card lines, the same way `_parse_cards` does.
+
+        Args:
+            content (str): The content string with cards.
+
+        Returns:
+            List[str]: One line per card.
+        """
+        content = content.split("\n")
+        if content[-1] == "":
+            content = content[:-1]
+        return content
+
+    def size(self) -> int:
+        """
+        Returns the size of the file, as an estimate of what loading it takes.
+
+        Returns:
+            int: The size in bytes, or 0 if the file does not exist.
+        """
+        try:
+            return self.filepath.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _stat_mtime(self) -> int:
+        """
+        Returns the modification time of the file.
+
+        Returns:
+            int: The modification time in nanoseconds, or 0 if the file does not exist.
+        """
+        try:
+            return self.filepath.stat().st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self) -> Optional[Dict[str, List[List[str]]]]:
+        """
+        Reloads the file if it changed on disk, diffing the cards by term.
+
+        Only lines that are new or edited are parsed again. Cards whose definition changed are
+        updated in place, so every list holding them, such as a pass in progress, sees the fix.
+        `cards` is also updated in place, keeping the existing order of unchanged cards.
+
+        Returns:
+            Optional[Dict[str, List[List[str]]]]: None if the file did not change, or was only
+                read now. Otherwise the "changed", "added" and "removed" cards.
+        """
+        if not self.loaded:
+            self.load()
+            return None
+        mtime = self._stat_mtime()
+        if mtime == self.mtime or mtime == 0:
+            return None
+        started = time.perf_counter()
+        content = self.backend.read_content(self)
+        if content is None:
+            return None  # tried again on the next refresh
+        self.mtime = mtime
+        self.content = content
+        unchanged: Dict[str, List[List[str]]] = {}
+        for line, card in self.lines:
+            unchanged.setdefault(line, []).append(card)
+        lines: List[Tuple[str, List[str]]] = []
+        for line in self._split_lines(content):
+            if unchanged.get(line):
+                lines.append((line, unchanged[line].pop(0)))
+            else:
+                lines.append((line, self._parse_cards(line)[0]))
+        old_by_term = self._by_term([card for _, card in self.lines])
+        new_by_term = self._by_term([card for _, card in lines])
+        diff: Dict[str, List[List[str]]] = {"changed": [], "added": [], "removed": []}
+        replaced: Dict[int, List[str]] = {}
+        for key, card in new_by_term.items():
+            old = old_by_term.get(key)
+            if old is None:
+                diff["added"].append(card)
+            elif old is not card:
+                old[:] = card
+                diff["changed"].append(old)
+                replaced[id(card)] = old
+        lines = [(line, replaced.get(id(card), card)) for line, card in lines]
+        diff["removed"] = [
+            card for key, card in old_by_term.items() if key not in new_by_term
+        ]
+        removed = {id(card) for card in diff["removed"]}
+        kept = [card for card in self.cards if id(card) not in removed]
+        self.cards[:] = kept + diff["added"]
+        self.lines = lines
+        DECK_LOAD.observe(time.perf_counter() - started)
+        return diff
+
+    def _by_term(self, cards: List[List[str]]) -> Dict[Tuple[str, int], List[str]]:
+        """
+        Keys cards by their term, numbering repeated terms in order of appearance.
+
+        Args:
+            cards (List[List[str]]): The cards to key.
+
+        Returns:
+            Dict[Tuple[str, int], List[str]]: Maps (term, occurrence) to each card.
+        """
+        seen: Dict[str, int] = {}
+        keyed = {}
+        for card in cards:
+            occurrence = seen.get(card[0], 0)
+            seen[card[0]] = occurrence + 1
+            keyed[(card[0], occurrence)] = card
+        return keyed
+
+    def edit_card(
+        self,
+        card: List[str],
+        new_card: List[str],
+        note: Optional[str] = None,
+        lock: Optional[FileLock] = None,
+    ) -> None:
+        """
+        Writes an edit of a card to the file, patching only its line, and updates the card in place.
+
+        Comments in the file are kept. If the edited line is longer or shorter, or a note is
+        added below it, the old line is marked dead in place and the new lines are appended,
+        until the file is compacted. Until then the card is read from the end of the deck.
+
+        Args:
+            card (List[str]): The card to edit, one of `cards`.
+            new_card (List[str]): The new term and definition.
+            note (Optional[str]): A comment to add below the card.
+            lock (Optional[FileLock]): The lock to hold while writing the file.
+
+        Raises:
+            ValueError: If the card is not in this deck, or the file no longer matches the deck.
+        """
+        position = [id(c) for _, c in self.lines].index(id(card))
+        if self.index is None or self.index.stale():
+            self.index = DeckIndex(self.filepath, lock)
+        self.index.lock = lock
+        lines = self.index.cards()
+        if (
+            len(lines) != len(self.lines)
+            or lines[position].text != self.lines[position][0]
+        ):
+            raise ValueError(f"{self.filepath} changed on disk.")
+        text = ": ".join(new_card)
+        self.index.replace(lines[position], [text] + ([f"# {note}"] if note else []))
+        card[:] = new_card
+        self.lines[position] = (text, card)
+        by_line: Dict[str, List[List[str]]] = {}
+        for line, c in self.lines:
+            by_line.setdefault(line, []).append(c)
+        self.lines = [
+            (line.text, by_line[line.text].pop(0)) for line in self.index.cards()
+        ]
+        self.content = "".join(f"{line}\n" for line, _ in self.lines)
+        self.mtime = self._stat_mtime()
+
 
 class Queue:
     def __init__(self, initial_list: List[File] = []) -> None:
@@ -247,7 +472,13 @@ class Runner:
         settings: List[Tuple[str, bool]] = [
             ["Flip term and definition", True],
             ["Shuffle cards", True],
+            ["Multiple choice", False],
+            ["Skip duplicate cards", False],
+            ["Learn words before phrases", False],
         ],
+        profile: Optional[str] = None,
+        backend: Optional[TextBackend] = None,
+        metrics: Optional[MetricsExporter] = None,
     ) -> None:
         """
         Initializes an instance of the class with the specified file path.
@@ -255,10 +486,27 @@ class Runner:
         Args:
             current_set (File): The file object whose cards are to be processed.
             settings (List[List[str, bool]]): Settings for the displaying of cards.
+            profile (Optional[str]): The learner profile to store progress under. Defaults to the OS user name.
+            backend (Optional[TextBackend]): The storage backend of the library. Defaults to the plain text files of the library, recording reviews in `.progress/library.db`.
+            metrics (Optional[MetricsExporter]): Where to export the session metrics to, if anywhere.
 
         Attributes:
             current_set (File): Stores the file object with the card data.
             settings (List[Tuple[str, bool]]): Stores the settings for how cards should be displayed.
+            distractor_index (Optional[DistractorIndex]): Index of the catalog for multiple choice, built on first use.
+            progress (ProgressStore): The learner's progress, stored apart from the decks in `.progress`.
+            journal (SessionJournal): The journal of this session, used to resume it after a crash.
+            current (Optional[File]): The deck being studied, watched for edits while it is studied.
+            backend (TextBackend): The storage backend decks are listed from and reviews are recorded in.
+            seen (Dict[Tuple[str, str], Path]): The deck each card of the session was first studied in, by duplicate key.
+            duplicate_index (DuplicateIndex): The cards of the decks loaded so far, to find definitions that conflict across decks.
+            coverage_index (CoverageIndex): Links the phrase decks of the library to the word decks defining their words.
+            browser (DeckBrowser): Browses the library a directory at a time when choosing decks, keeping its place between picks.
+            index_lock (threading.Lock): Guards the library-wide indexes, which the prefetcher also builds.
+            card_catalog (Optional[CardCatalog]): The card bitmaps that queries are evaluated over, built on the first query.
+            prefetcher (Prefetcher): Warms the next decks of the queue on a worker thread while a deck is studied.
+            metrics (Optional[MetricsExporter]): Exports the session metrics while the Runner is started.
+            deck_locks (Dict[str, FileLock]): The locks held while writing decks, by deck key.
 
         Raises:
             ValueError: If the settings list is empty or not properly formatted.
@@ -266,6 +514,29 @@ class Runner:
         self.q: Queue[File] = Queue()
         self.filepath = Path(filepath).resolve()
         self.settings: List[Tuple[str, bool]] = settings
+        self.distractor_index: Optional[DistractorIndex] = None
+        self.progress: ProgressStore = ProgressStore(
+            self.filepath / ".progress", profile or getpass.getuser()
+        )
+        self.journal: SessionJournal = SessionJournal(
+            self._journal_directory() / f"{uuid.uuid4().hex}.journal"
+        )
+        self.journal.hold()
+        self.current: Optional[File] = None
+        self.backend: TextBackend = backend or TextBackend(self.filepath)
+        self.seen: Dict[Tuple[str, str], Path] = {}
+        self.duplicate_index: DuplicateIndex = DuplicateIndex()
+        self.coverage_index: CoverageIndex = CoverageIndex()
+        self.browser: DeckBrowser = DeckBrowser(
+            self.filepath,
+            describe=self._describe_decks,
+            build_session=self._build_session,
+        )
+        self.index_lock = threading.Lock()
+        self.card_catalog: Optional[Any] = None
+        self.prefetcher: Prefetcher = Prefetcher(self._warm, File.size)
+        self.metrics: Optional[MetricsExporter] = metrics
+        self.deck_locks: Dict[str, FileLock] = {}
 
     def __str__(self) -> str:
         """
@@ -301,6 +572,15 @@ class Runner:
         """
         Helper function to start the menu and display the cards
         """
+        if self.metrics is not None:
+            self.metrics.start()
+        self.settings = MenuHandler.display_settings(self.settings)
+        try:
+            self._prompt_resume()
+        except KeyboardInterrupt:
+            self.journal.sync()
+            PrintHandler.print_notice("Exiting...")
+            quit()
         while True:
             # get files
             # check type
@@ -309,6 +589,8 @@ class Runner:
             if not TypeHandler.check_types_are(add_files, None):
                 for add_file in add_files:
                     self.q._put(add_file)
+                self._journal_queue()
+                self.prefetcher.schedule(self.q._list())
                 # clear screen
                 # print sets in the queue, minus the one currently loaded
                 print("\033[2J")
@@ -320,6 +602,7 @@ class Runner:
             # if queue is empty
             # exit
             if self.q._empty():
+                self.journal.clear()
                 PrintHandler.print_notice(f"Exiting...")
                 break
 
@@ -329,20 +612,271 @@ class Runner:
             # ask for repeat
             # if ctrlc, exit
             file = self.q._get()
+            self.prefetcher.claim(file)
+            file._refresh()  # read it if it was not warmed, or pick up edits made since
+            self.current = file
+            self._journal_queue()
+            self.prefetcher.schedule(self.q._list())
             PrintHandler.print_notice(f"Now Studying: {file.basename}")
             try:
-                self._display_cards(file.cards, 0, file.filepath, self.settings)
+                self._study_cards(file.cards, file.filepath, self.settings)
                 self._prompt_repeat(file.cards, file.filepath, self.settings)
             except KeyboardInterrupt:
+                self.journal.sync()
                 PrintHandler.print_notice("Exiting...")
                 quit()
 
+    def _prompt_resume(self) -> None:
+        """
+        Offers to resume a session of the profile that was interrupted, rebuilding its queue
+        and the pass in progress from its journal, which this session takes over. Journals of
+        sessions still running are left alone.
+        """
+        state = None
+        for orphan in SessionJournal.orphans(self._journal_directory()):
+            if state is not None:
+                orphan.release()  # offered again at the next start
+                continue
+            state = orphan.replay()
+            if state is not None and IOHandler.handle_boolean_input(
+                "Resume the last session?"
+            ):
+                self.journal.adopt(orphan)
+            else:
+                state = None
+                orphan.clear()
+                orphan.release()
+        if state is None:
+            return
+        self.q._put_list(
+            [
+                File(deck, self.backend, lazy=True)
+                for deck in state["queue"]
+                if Path(deck).exists()
+            ]
+        )
+        self._journal_queue()
+        if state["deck"] is None or not Path(state["deck"]).exists():
+            return
+        file = File(state["deck"], self.backend)
+        self.current = file
+        PrintHandler.print_notice(f"Resuming: {file.basename}")
+        resume = state["pass"]
+        if resume is not None:
+            resume["cards"] = self._resolve_cards(file, resume["cards"])
+            resume["wrong"] = self._resolve_cards(file, resume["wrong"])
+        self._study_cards(file.cards, file.filepath, self.settings, resume)
+        self._prompt_repeat(file.cards, file.filepath, self.settings)
+
+    def _journal_directory(self) -> Path:
+        """
+        Returns the directory holding the session journals of the profile, one per session.
+
+        Returns:
+            Path: `.progress/journals/<profile>` in the library.
+        """
+        return self.progress.filepath.parent / "journals" / self.progress.profile
+
+    def _journal_pass(self, filename: Path, state: Dict[str, Any]) -> None:
+        """
+        Records a pass in the session journal. Cards of the deck being studied are recorded as
+        their position among the deck's card lines, so a resumed pass holds the deck's own
+        cards and they can still be edited and reloaded. Other cards are recorded as they are.
+
+        Args:
+            filename (Path): The filename of the card set.
+            state (Dict[str, Any]): The pass.
+        """
+        positions: Dict[int, int] = {}
+        if self.current is not None and self.current.filepath == filename:
+            positions = {id(card): i for i, (_, card) in enumerate(self.current.lines)}
+        self.journal.append(
+            "pass",
+            **dict(
+                state,
+                cards=[positions.get(id(card), card) for card in state["cards"]],
+                wrong=[positions.get(id(card), card) for card in state["wrong"]],
+            ),
+        )
+
+    @staticmethod
+    def _resolve_cards(file: File, journaled: List[Any]) -> List[List[str]]:
+        """
+        Maps the cards of a pass replayed from the session journal back to the deck's cards.
+
+        Args:
+            file (File): The deck being resumed.
+            journaled (List[Any]): The cards as journaled, positions among the deck's card lines
+                or cards of other decks.
+
+        Returns:
+            List[List[str]]: The cards, leaving out positions past the end of the deck.
+        """
+        cards = [card for _, card in file.lines]
+        return [
+            cards[card] if isinstance(card, int) else card
+            for card in journaled
+            if not isinstance(card, int) or card < len(cards)
+        ]
+
+    def _journal_queue(self) -> None:
+        """
+        Records the decks waiting in the queue in the session journal.
+        """
+        self.journal.append(
+            "queue", decks=[str(file.filepath) for file in self.q._list()]
+        )
+
+    def _study_cards(
+        self,
+        cards: List[List[str]],
+        filename: Path,
+        settings: List[Tuple[str, bool]],
+        resume: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Studies a deck from the start, or from a pass replayed from the session journal,
+        recording its start and end in the journal.
+
+        Args:
+            cards (list): The list of card pairs.
+            filename (Path): The filename of the card set.
+            settings (List[Tuple[str,bool]]): The list of settings.
+            resume (Optional[Dict[str, Any]]): The pass to continue from, if resuming.
+        """
+        if settings[3][1] and resume is None:
+            self._report_conflicts(filename)
+            cards = self._skip_duplicates(cards, filename)
+            if len(cards) == 0:
+                PrintHandler.print_notice(
+                    "Every card was already studied this session."
+                )
+                return
+        self.journal.append("deck", deck=str(filename))
+        SESSIONS.labels("local").inc()
+        if resume is not None and resume.get("words"):
+            self._display_cards(resume["cards"], 1, filename, settings, resume)
+            resume = None
+        elif settings[4][1] and resume is None:
+            self._study_words_first(cards, filename, settings)
+        self._display_cards(cards, 0, filename, settings, resume)
+        self.journal.append("done", deck=str(filename))
+
+    def _index_duplicates(self, file: File) -> None:
+        """
+        Re-indexes a deck in the duplicate index if it changed since it was indexed. Hidden
+        decks, such as session decks repeating cards of other decks, are left out.
+
+        Args:
+            file (File): The deck, as loaded.
+        """
+        if any(
+            part.startswith(".") for part in Path(self._deck_key(file.filepath)).parts
+        ):
+            return
+        with self.index_lock:
+            self.duplicate_index.update_deck(file, self.filepath)
+
+    def _report_conflicts(self, filename: Path) -> None:
+        """
+        Indexes the library's decks that changed, then warns about the cards of a deck whose
+        term is defined differently in another deck.
+
+        Args:
+            filename (Path): The filename of the card set.
+        """
+        for file in self._list_files():
+            self._index_duplicates(file)
+        if self.current is None or self.current.filepath != filename:
+            return
+        with self.index_lock:
+            conflicts = self.duplicate_index.conflicts_of(self.current, self.filepath)
+        for card, entries in conflicts:
+            elsewhere = ", ".join(
+                f"{deck}: {definition}" for deck, _, definition in entries
+            )
+            PrintHandler.print_notice(
+                f"{card[0]} means {card[1]} here, but {elsewhere}."
+            )
+
+    def _skip_duplicates(
+        self, cards: List[List[str]], filename: Path
+    ) -> List[List[str]]:
+        """
+        Leaves out cards already studied in another deck this session, and repeats of a card
+        within the deck, comparing normalized terms and definitions.
+
+        Args:
+            cards (list): The list of card pairs.
+            filename (Path): The filename of the card set.
+
+        Returns:
+            list: The cards left to study.
+        """
+        kept = []
+        in_deck = set()
+        for card in cards:
+            key = DuplicateIndex.key(card)
+            if key in in_deck or self.seen.setdefault(key, filename) != filename:
+                continue
+            in_deck.add(key)
+            kept.append(card)
+        skipped = len(cards) - len(kept)
+        if skipped:
+            PrintHandler.print_notice(f"Skipping {skipped} duplicate cards.")
+        return kept
+
+    def _study_words_first(
+        self, cards: List[List[str]], filename: Path, settings: List[Tuple[str, bool]]
+    ) -> None:
+        """
+        Studies the word cards a phrase deck's cards need, in a pass of their own before the
+        deck. The pass is not scored, so it does not count towards the phrase deck's score,
+        and its reviews are recorded under the word decks. Word cards are asked in the order
+        the phrases need them.
+
+        Args:
+            cards (list): The list of card pairs.
+            filename (Path): The filename of the card set.
+            settings (List[Tuple[str,bool]]): The list of settings.
+        """
+        with self.index_lock:
+            self.coverage_index.update(self._list_files(), self.filepath)
+        deck = self.coverage_index.decks.get(self._deck_key(filename))
+        if deck is None or not deck[1]:
+            return
+        entries = self.coverage_index.needed_words(cards, Path(filename).parent.name)
+        if not entries:
+            return
+        words = [self.coverage_index.word_card(entry) for entry in entries]
+        PrintHandler.print_notice(
+            f"Studying {len(words)} word cards before their phrases."
+        )
+        settings = [list(setting) for setting in settings]
+        settings[1][1] = False
+        self._display_cards(
+            words,
+            1,
+            filename,
+            settings,
+            {
+                "attempt": 1,
+                "cards": words,
+                "wrong": [],
+                "total": len(words),
+                "first_wrong": 0,
+                "words": True,
+                "sources": {word[0]: deck for word, (deck, _) in zip(words, entries)},
+            },
+        )
+
     def _display_cards(
         self,
         cards: List[List[str]],
         attempt_number: int,
         filename: Path,
         settings: List[Tuple[str, bool]],
+        resume: Optional[Dict[str, Any]] = None,
     ) -> None:
         """
         Displays the cards for studying and handles user input.
@@ -352,8 +886,13 @@ class Runner:
             attempt_number (int): The current attempt number.
             filename (str): The filename of the card set.
             settings (List[Tuple[str,bool]]): The list of settings.
+            resume (Optional[Dict[str, Any]]): A pass to continue from, replayed from the session
+                journal or built by the caller. Its "sources", if any, map terms to the deck their
+                reviews are recorded under instead of this one.
 
-        Recursively displays wrong answers.
+        Displays wrong answers again in further passes until all are answered correctly.
+        Every pass and answer is recorded in the session journal. Edits to the deck on disk
+        are picked up before every card.
         """
         if settings[0][1]:
             term = 1
@@ -361,35 +900,367 @@ class Runner:
         else:
             term = 0
             definition = 1
-        if settings[1][1]:
-            random.shuffle(cards)
-        wrong_answers = []
-        for card in cards:
-            try:
-                attempt = input("\r" + card[term] + "\n")
-            except IndexError:
-                PrintHandler.print_exception("Index error: card: " + str(card))
-            if not attempt == card[definition]:
-                wrong_answers.append(card)
-                att2 = ""
-                while att2 != card[definition]:
-                    PrintHandler.print_notice(
-                        f"Type the correct answer: {card[definition]} : ", end=""
-                    )
-                    att2 = input()
-                    if att2 != card[definition]:
-                        print("\033[F\033[K", end="")
-            print("\033[2J")
-        if len(wrong_answers) > 0:
+        if resume is None:
+            resume = self._start_pass(cards, attempt_number, filename, settings[1][1])
+        state = resume
+        while True:
+            self._journal_pass(filename, state)
+            if settings[2][1]:
+                self._precompute_distractors(
+                    state["cards"], definition, filename.parent.name
+                )
+            position = 0
+            while position < len(state["cards"]):
+                if self._reload_pass(filename, state, position):
+                    position = 0
+                    continue
+                card = state["cards"][position]
+                position += 1
+                started = time.monotonic()
+                try:
+                    if settings[2][1]:
+                        correct = self._ask_multiple_choice(
+                            card, term, definition, filename.parent.name
+                        )
+                    else:
+                        correct = self._ask_typed(card, term, definition)
+                except IndexError:
+                    PrintHandler.print_exception("Index error: card: " + str(card))
+                    correct = True  # skipped, but still advances the pass
+                self.journal.append("answer", correct=correct)
+                self._record_answer(
+                    filename, state, card, correct, time.monotonic() - started
+                )
+                print("\033[2J")
+            next_pass = self._next_pass(state, settings[1][1])
+            if next_pass is None:
+                break
             PrintHandler.print_notice("Wrong answers:")
             time.sleep(2)
-            CardHandler.display_cards(
-                wrong_answers, attempt_number + 1, filename, settings
-            )
+            state = next_pass
         if attempt_number == 0:
-            score = MathHandler.calc_last_score(len(wrong_answers), len(cards))
+            score = self._score_deck(filename, state)
             PrintHandler.print_notice(f"Score: {score}%")
-            IOHandler.write_last_score_to_file(score, filename)
+
+    def _start_pass(
+        self,
+        cards: List[List[str]],
+        attempt_number: int,
+        filename: Path,
+        shuffle: bool,
+    ) -> Dict[str, Any]:
+        """
+        Starts studying the cards of a deck, in the form the session journal records passes in.
+
+        Args:
+            cards (List[List[str]]): The cards to study, shuffled in place if `shuffle` is set.
+            attempt_number (int): The attempt number, 0 for a scored pass.
+            filename (Path): The path of the deck.
+            shuffle (bool): Whether to shuffle the cards.
+
+        Returns:
+            Dict[str, Any]: The state of the first pass.
+        """
+        if shuffle:
+            random.shuffle(cards)
+        state = {
+            "attempt": attempt_number,
+            "cards": list(cards),
+            "wrong": [],
+            "total": len(cards),
+            "first_wrong": None,
+        }
+        sources = self._session_sources(filename)
+        if sources is not None:
+            state["sources"] = sources
+        return state
+
+    def _record_answer(
+        self,
+        filename: Path,
+        state: Dict[str, Any],
+        card: List[str],
+        correct: bool,
+        latency: float,
+    ) -> None:
+        """
+        Records an answer to a card of a pass, in the pass, the metrics and the review history.
+
+        Args:
+            filename (Path): The path of the deck.
+            state (Dict[str, Any]): The pass the card belongs to.
+            card (List[str]): The card answered.
+            correct (bool): Whether the answer was correct.
+            latency (float): The time taken to answer, in seconds.
+        """
+        if not correct:
+            state["wrong"].append(card)
+        ANSWERS.labels("correct" if correct else "wrong").inc()
+        ANSWER_LATENCY.observe(latency)
+        self.backend.record_review(
+            state.get("sources", {}).get(card[0], self._deck_key(filename)),
+            card,
+            correct,
+            latency,
+            self.progress.profile,
+        )
+
+    @staticmethod
+    def _next_pass(state: Dict[str, Any], shuffle: bool) -> Optional[Dict[str, Any]]:
+        """
+        Ends a pass, starting another over the cards answered wrong.
+
+        Args:
+            state (Dict[str, Any]): The pass that ended.
+            shuffle (bool): Whether to shuffle the cards of the next pass.
+
+        Returns:
+            Optional[Dict[str, Any]]: The next pass, or None if every card was answered correctly.
+        """
+        if state["attempt"] == 0:
+            state["first_wrong"] = len(state["wrong"])
+        if not state["wrong"]:
+            return None
+        if shuffle:
+            random.shuffle(state["wrong"])
+        return dict(state, attempt=state["attempt"] + 1, cards=state["wrong"], wrong=[])
+
+    def _score_deck(self, filename: Path, state: Dict[str, Any]) -> int:
+        """
+        Scores the first pass over a deck and saves the score in the learner's progress.
+
+        Args:
+            filename (Path): The path of the deck.
+            state (Dict[str, Any]): The last pass over the deck.
+
+        Returns:
+            int: The score as a percentage.
+        """
+        score = MathHandler.calc_last_score(state["first_wrong"], state["total"])
+        if (
+            "sources" not in state
+        ):  # a session deck mixes decks, so its score belongs to none
+            with WRITE_BACK.time():
+                self.progress.record_score(self._deck_key(filename), score)
+        return score
+
+    def _reload_pass(
+        self, filename: Path, state: Dict[str, Any], position: int
+    ) -> bool:
+        """
+        Swaps edits of the deck being studied into the pass in progress.
+
+        Changed cards are already updated in place by `File._refresh`. Removed cards are dropped
+        from the rest of the pass and from the wrong answers, and added cards are appended to the
+        pass. The cards already answered are cut from the pass and the new pass is journaled.
+
+        Args:
+            filename (Path): The filename of the card set.
+            state (Dict[str, Any]): The pass in progress.
+            position (int): The number of cards of the pass already answered.
+
+        Returns:
+            bool: True if the pass was rebuilt and starts again from position 0, False otherwise.
+        """
+        if (
+            self.current is None
+            or self.current.filepath != filename
+            or state.get("words")
+        ):
+            return False
+        diff = self.current._refresh()
+        if diff is None:
+            return False
+        self._index_duplicates(self.current)
+        removed = {id(card) for card in diff["removed"]}
+        remaining = state["cards"][position:]
+        state["cards"] = [card for card in remaining if id(card) not in removed]
+        state["cards"] += diff["added"]
+        state["wrong"] = [card for card in state["wrong"] if id(card) not in removed]
+        if state["attempt"] == 0:
+            state["total"] += len(state["cards"]) - len(remaining)
+        self._journal_pass(filename, state)
+        PrintHandler.print_notice(
+            f"Reloaded {filename.name}: {len(diff['changed'])} changed, "
+            f"{len(diff['added'])} added, {len(diff['removed'])} removed."
+        )
+        return True
+
+    def _ask_typed(self, card: List[str], term: int, definition: int) -> bool:
+        """
+        Asks for a card by typed recall, making the user retype the answer if it was wrong.
+
+        Args:
+            card (List[str]): The card to ask.
+            term (int): The index of the side shown to the user.
+            definition (int): The index of the side the user has to answer.
+
+        Returns:
+            bool: True if the first attempt was correct, False otherwise.
+        """
+        attempt = input("\r" + card[term] + "\n")
+        while attempt == "/edit":
+            self._edit_card(card)
+            attempt = input("\r" + card[term] + "\n")
+        if CardHandler.check_answer(attempt, card[definition]):
+            return True
+        att2 = ""
+        while att2 != card[definition]:
+            PrintHandler.print_notice(
+                f"Type the correct answer (or /edit to fix the card): {card[definition]} : ",
+                end="",
+            )
+            att2 = input()
+            if att2 == "/edit":
+                self._edit_card(card)
+            elif att2 != card[definition]:
+                print("\033[F\033[K", end="")
+        return False
+
+    def _edit_card(self, card: List[str]) -> None:
+        """
+        Lets the user fix a card of the deck being studied, or add a note below it, writing
+        only the affected part of the deck file.
+
+        Args:
+            card (List[str]): The card to edit.
+        """
+        if self.current is None or not any(c is card for _, c in self.current.lines):
+            PrintHandler.print_exception(
+                "Only cards of the deck being studied can be edited."
+            )
+            return
+        PrintHandler.print_notice(f"Editing: {': '.join(card)}")
+        term = input("- New term (Enter to keep): ") or card[0]
+        definition = input("- New definition (Enter to keep): ") or card[1]
+        note = input("- Note to add below the card (Enter for none): ").strip()
+        if ": " in term or ": " in definition or term.strip().startswith("#"):
+            PrintHandler.print_exception('A card cannot contain ": " or start with #.')
+            return
+        try:
+            self.current.edit_card(
+                card,
+                [term, definition],
+                note or None,
+                self._deck_lock(self.current.filepath),
+            )
+        except (ValueError, OSError) as e:
+            PrintHandler.print_exception(f"Could not edit the card: {e}")
+            return
+        PrintHandler.print_notice(f"Saved: {term}: {definition}")
+
+    def _ask_multiple_choice(
+        self, card: List[str], term: int, definition: int, group: str
+    ) -> bool:
+        """
+        Asks for a card as multiple choice, using near neighbours from the catalog as distractors.
+
+        Args:
+            card (List[str]): The card to ask.
+            term (int): The index of the side shown to the user.
+            definition (int): The index of the side the user has to answer.
+            group (str): The folder the card's deck is in, used to prefer related distractors.
+
+        Returns:
+            bool: True if the correct option was chosen, False otherwise.
+        """
+        options = self._get_distractor_index().distractors(
+            card[definition], definition, group=group
+        )
+        options = options + [card[definition]]
+        random.shuffle(options)
+        print("\r" + card[term])
+        self._print_list(options)
+        choice = IOHandler.handle_integer_input(
+            "Choose the answer.", 1, len(options) + 1
+        )
+        if options[choice - 1] == card[definition]:
+            return True
+        PrintHandler.print_notice(f"The correct answer was: {card[definition]}")
+        time.sleep(2)
+        return False
+
+    def _get_distractor_index(self) -> DistractorIndex:
+        """
+        Returns the distractor index of the catalog, building it once on first use.
+
+        Returns:
+            DistractorIndex: The index over every deck in the Runner's filepath.
+        """
+        with self.index_lock:
+            if self.distractor_index is None:
+                self.distractor_index = DistractorIndex(
+                    (file.parent.name, file.cards) for file in self._list_files()
+                )
+        return self.distractor_index
+
+    def _precompute_distractors(
+        self, cards: List[List[str]], definition: int, group: str
+    ) -> None:
+        """
+        Looks up the distractors of a pass on a worker thread, building the distractor index
+        first if needed, so the first cards can be asked while the rest are looked up.
+
+        Args:
+            cards (List[List[str]]): The cards of the pass.
+            definition (int): The index of the side the user has to answer.
+            group (str): The folder the cards' deck is in.
+        """
+        threading.Thread(
+            target=lambda: self._get_distractor_index().precompute(
+                list(cards), definition, group=group
+            ),
+            daemon=True,
+        ).start()
+
+    def _warm(self, file: File) -> None:
+        """
+        Does the work of loading a queued deck ahead of time: reading it, or reloading it if
+        it was edited, and building what the current settings will look up while it is studied.
+
+        Args:
+            file (File): The queued deck.
+        """
+        file._refresh()
+        if self.settings[3][1]:
+            self._index_duplicates(file)
+        if self.settings[2][1]:
+            self._get_distractor_index().precompute(
+                file.cards, 0 if self.settings[0][1] else 1, group=file.parent.name
+            )
+        if self.settings[4][1]:
+            with self.index_lock:
+                self.coverage_index.update(self._list_files(), self.filepath)
+
+    def _deck_lock(self, filename: Path) -> FileLock:
+        """
+        Returns the lock held while writing a deck, shared by every profile and session of
+        the library.
+
+        Args:
+            filename (Path): The path of the deck.
+
+        Returns:
+            FileLock: The lock, at `.progress/locks/<deck>.lock`.
+        """
+        key = self._deck_key(filename)
+        if key not in self.deck_locks:
+            self.deck_locks[key] = FileLock(
+                self.progress.filepath.parent / "locks" / f"{key}.lock"
+            )
+        return self.deck_locks[key]
+
+    def _deck_key(self, filename: Path) -> str:
+        """
+        Returns the key a deck's progress is stored under.
+
+        Args:
+            filename (Path): The path of the deck.
+
+        Returns:
+            str: The deck's path relative to the Runner's filepath, with forward slashes.
+        """
+        return Path(filename).resolve().relative_to(self.filepath).as_posix()
 
     def _prompt_repeat(
         self, cards: List[List[str]], filename: Path, settings: List[Tuple[str, bool]]
@@ -407,7 +1278,7 @@ class Runner:
         while True:
             repeat = IOHandler.handle_boolean_input("Repeat set?")
             if repeat:
-                self._display_cards(cards, 0, filename, settings)
+                self._study_cards(cards, filename, settings)
             else:
                 break
 
@@ -439,30 +1310,104 @@ class Runner:
         Returns:
             list: A list of file paths.
         """
-        path = self.filepath
-        files = []
-        for file in path.rglob("*"):
-            if file.is_file():
-                files.append(File(file))
+        files = [
+            File(file, self.backend) for file in self.backend.list_files(self.filepath)
+        ]
         return sorted(files, key=lambda file: file.filepath)
 
     def _choose_file(self) -> Optional[File]:
         """
-        Prompts the user to choose a file to study from a directory.
+        Prompts the user to browse to a file to study.
+
+        Returns:
+            Optional[File]: The selected file, or None if the user escaped.
+        """
+        chosen = self.browser.choose("Choose file to add to the queue.")
+        return None if chosen is None else File(chosen, self.backend, lazy=True)
+
+    def _build_session(self, query: str) -> Path:
+        """
+        Writes the cards matching a query to a session deck in the progress directory, so it
+        can be queued like any other deck.
 
         Args:
-            directory (str): The directory to search for files.
+            query (str): The card query, e.g. "folder:Duolingo and missed>=1".
 
         Returns:
-            str: The path to the selected file.
+            Path: The session deck.
+
+        Raises:
+            ValueError: If the query is not valid or no card matches it.
         """
-        files: List[File] = self._list_files()
-        print("\033[2J")
-        self._print_list(files)
-        selection = IOHandler.handle_choose_input(
-            "Choose file to add to the queue.", 1, len(files) + 1, "Q"
-        )
-        return None if selection == None else files[selection - 1]
+        from query import CardCatalog  # imported on first use, as it loads NumPy
+
+        if self.card_catalog is None:
+            self.card_catalog = CardCatalog(self.filepath)
+        self.card_catalog.refresh(self.progress.profile)
+        bits = self.card_catalog.query(query)
+        if not bits:
+            raise ValueError(f"No cards match {query}.")
+        name = "".join(c if c.isalnum() else "-" for c in query).strip("-")[:60]
+        deck = self._session_directory() / f"{name or 'query'}.txt"
+        self.card_catalog.write_deck(bits, deck, query)
+        return deck
+
+    def _session_directory(self) -> Path:
+        """
+        Returns the directory the profile's session decks are written to.
+
+        Returns:
+            Path: The directory, in the progress directory and named after the profile.
+        """
+        return self.progress.filepath.parent / "sessions" / self.progress.profile
+
+    def _session_sources(self, filename: Path) -> Optional[Dict[str, str]]:
+        """
+        Maps the terms of a session deck to the decks they were copied from, using the
+        `# from:` comments the deck was written with.
+
+        Args:
+            filename (Path): The filename of the card set.
+
+        Returns:
+            Optional[Dict[str, str]]: The source deck of each term, or None if the deck is not
+                a session deck.
+        """
+        if self._session_directory().resolve() not in Path(filename).resolve().parents:
+            return None
+        sources: Dict[str, str] = {}
+        source = None
+        with open(filename, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.startswith("# from: "):
+                    source = line[len("# from: ") :].strip()
+                elif source is not None and not line.startswith("#") and ": " in line:
+                    sources[line.split(": ")[0]] = source
+        return sources
+
+    def _describe_decks(self, decks: List[Path]) -> List[str]:
+        """
+        Describes the recent scores of decks for the deck browser.
+
+        Args:
+            decks (List[Path]): The decks to describe.
+
+        Returns:
+            List[str]: The average of the last 5 scores and the date of the last attempt of
+                each deck, or an empty string if it was never studied.
+        """
+        summary = self.progress.summary()
+        notes = []
+        for deck in decks:
+            found = summary.get(self._deck_key(deck))
+            if found is None:
+                notes.append("")
+            else:
+                last = time.strftime("%Y-%m-%d", time.localtime(found[1]))
+                notes.append(
+                    f"  (last 5 average: {found[0]:.0f}%, last attempt: {last})"
+                )
+        return notes
 
     def _print_list(self, any_list: List[Any]) -> None:
         """
@@ -473,10 +1418,9 @@ class Runner:
 
         Has special formatting for List[File] types
         """
-        output = ""
-        for i, item in enumerate(any_list):
-            if TypeHandler.check_types_are(any_list, File):
-                output += f"{i+1}. {item.subpath}\n"
-            else:
-                output += f"{i+1}. {item}\n"
-        print(output, end="")
+        files = TypeHandler.check_types_are(any_list, File)
+        lines = [
+            f"{i+1}. {item.subpath if files else item}\n"
+            for i, item in enumerate(any_list)
+        ]
+        print("".join(lines), end="")
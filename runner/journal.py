@@ -0,0 +1,194 @@
+import json, os, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from progress import FileLock
+
+
+class SessionJournal:
+    def __init__(
+        self, filepath: Path, batch_size: int = 20, interval: float = 2.0
+    ) -> None:
+        """
+        Initializes an append-only journal of a study session.
+
+        Every event is written through to the operating system as soon as it is appended,
+        so it survives Ctrl-C or a crash of the process. Syncing to disk is batched: the
+        journal is fsynced every `batch_size` events or `interval` seconds, whichever
+        comes first, so at most that window can be lost on power failure.
+
+        Every session has its own journal, and holds the lock beside it while it runs, so
+        concurrent sessions of a profile never write or clear each other's journals. A journal
+        whose lock is free was left by a session that ended without clearing it.
+
+        Events are JSON lines with an "e" field:
+            queue:  {"decks": [...]} the decks waiting in the queue.
+            deck:   {"deck": path} a deck started being studied.
+            pass:   {"attempt": n, "cards": [...], "wrong": [...], "total": t, "first_wrong": f}
+                    a pass over cards started, carrying what is needed to score the deck. Cards
+                    of the deck are recorded as their position among its card lines. The pass
+                    of word cards studied before a phrase deck also has "words" and "sources".
+            answer: {"correct": bool} the next card of the pass was answered.
+            done:   {"deck": path} the deck was finished and scored.
+
+        Args:
+            filepath (Path): The journal file.
+            batch_size (int): The number of events between fsyncs.
+            interval (float): The maximum number of seconds between fsyncs.
+
+        Attributes:
+            filepath (Path): The journal file.
+            batch_size (int): The number of events between fsyncs.
+            interval (float): The maximum number of seconds between fsyncs.
+            file (Optional[IO]): The journal file while open for appending.
+            unsynced (int): The number of events written since the last fsync.
+            last_sync (float): The time of the last fsync.
+            lock (FileLock): Held by the session the journal belongs to, while it runs.
+        """
+        self.filepath: Path = Path(filepath)
+        self.batch_size: int = batch_size
+        self.interval: float = interval
+        self.file = None
+        self.unsynced: int = 0
+        self.last_sync: float = time.monotonic()
+        self.lock: FileLock = FileLock(
+            self.filepath.with_name(self.filepath.name + ".lock")
+        )
+
+    @classmethod
+    def orphans(cls, directory: Path) -> List["SessionJournal"]:
+        """
+        Finds the journals of a directory whose sessions are gone, most recent first, and
+        takes their locks. Locks left without a journal are removed.
+
+        Args:
+            directory (Path): The directory holding the journals of a profile.
+
+        Returns:
+            List[SessionJournal]: The orphaned journals, whose locks are now held.
+        """
+        found = []
+        for lock in Path(directory).glob("*.journal.lock"):
+            journal = cls(lock.with_suffix(""))
+            if not journal.lock.acquire(blocking=False):
+                continue  # its session is still running
+            if journal.filepath.exists():
+                found.append(journal)
+            else:
+                journal.release()
+        return sorted(found, key=lambda journal: -journal.filepath.stat().st_mtime)
+
+    def hold(self) -> None:
+        """
+        Takes the lock of the journal for the session it belongs to.
+        """
+        self.lock.acquire()
+
+    def release(self) -> None:
+        """
+        Releases the lock of the journal and removes the lock file, once the journal is
+        cleared or adopted.
+        """
+        if self.lock.file is not None:
+            self.lock.filepath.unlink(missing_ok=True)
+            self.lock.release()
+
+    def adopt(self, orphan: "SessionJournal") -> None:
+        """
+        Takes over the events of an orphaned journal, to resume its session.
+
+        Args:
+            orphan (SessionJournal): The journal to take over, whose lock is held.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        os.replace(orphan.filepath, self.filepath)
+        orphan.release()
+
+    def append(self, event: str, **fields: Any) -> None:
+        """
+        Appends an event to the journal.
+
+        Args:
+            event (str): The type of the event.
+            **fields (Any): The data of the event.
+        """
+        if self.file is None:
+            self.filepath.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(self.filepath, "a", encoding="utf-8")
+        fields["e"] = event
+        self.file.write(json.dumps(fields, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.batch_size
+            or time.monotonic() - self.last_sync >= self.interval
+        ):
+            self.sync()
+
+    def sync(self) -> None:
+        """
+        Forces every appended event to disk.
+        """
+        if self.file is not None and self.unsynced:
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def clear(self) -> None:
+        """
+        Removes the journal, after a session ended cleanly or a resume was declined.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.unsynced = 0
+        self.filepath.unlink(missing_ok=True)
+
+    def replay(self) -> Optional[Dict[str, Any]]:
+        """
+        Rebuilds the state of an interrupted session from its events, in O(events).
+
+        A torn last line, left by a crash in the middle of a write, is ignored.
+
+        Returns:
+            Optional[Dict[str, Any]]: None if there is nothing to resume. Otherwise a dict with
+                "queue" (List[str]), the decks still waiting, "deck" (Optional[str]), the deck
+                being studied, and "pass" (Optional[Dict[str, Any]]), the pass in progress with
+                the cards still to answer.
+        """
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as file:
+                lines = file.readlines()
+        except FileNotFoundError:
+            return None
+        queue: List[str] = []
+        deck: Optional[str] = None
+        current: Optional[Dict[str, Any]] = None
+        position = 0
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                break
+            if event["e"] == "queue":
+                queue = event["decks"]
+            elif event["e"] == "deck":
+                deck, current = event["deck"], None
+            elif event["e"] == "pass":
+                current, position = event, 0
+            elif event["e"] == "answer" and current is not None:
+                if position >= len(current["cards"]):
+                    continue
+                if not event["correct"]:
+                    current["wrong"].append(current["cards"][position])
+                position += 1
+            elif event["e"] == "done":
+                deck, current = None, None
+        if current is not None:
+            current["cards"] = current["cards"][position:]
+            del current["e"]
+        if deck is None and not queue:
+            return None
+        return {"queue": queue, "deck": deck, "pass": current}
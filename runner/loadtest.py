@@ -0,0 +1,180 @@
+'''
+Load test for the local study server.
+
+Copies a library to a temporary directory, so the progress of the simulated learners
+never reaches the real one, and starts a server over the copy. Then opens many concurrent
+sessions that each study random decks, answering correctly most of the time, and reports
+throughput and request latency.
+
+Usage:
+    python runner/loadtest.py Swedish/flashcards --clients 300 --decks 3
+'''
+
+import argparse, asyncio, json, random, shutil, subprocess, sys, tempfile, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from handlers import *
+
+
+class LoadTest:
+    def __init__(
+        self,
+        socket_path: Optional[str],
+        host: str,
+        port: int,
+        clients: int,
+        decks: int,
+        accuracy: float,
+    ) -> None:
+        """
+        Initializes a load test.
+
+        Args:
+            socket_path (Optional[str]): The server's Unix socket. If None, TCP is used.
+            host (str): The server's host over TCP.
+            port (int): The server's port over TCP.
+            clients (int): The number of concurrent sessions.
+            decks (int): The number of decks each session studies.
+            accuracy (float): The chance of answering a card correctly.
+
+        Attributes:
+            latencies (List[float]): The round-trip time of every request, in seconds.
+            errors (int): The number of sessions that failed.
+        """
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.clients = clients
+        self.decks = decks
+        self.accuracy = accuracy
+        self.latencies: List[float] = []
+        self.errors: int = 0
+
+    async def _request(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, **request: Any
+    ) -> Dict[str, Any]:
+        """
+        Sends a request and times the reply.
+
+        Args:
+            reader (asyncio.StreamReader): The connection's reader.
+            writer (asyncio.StreamWriter): The connection's writer.
+            **request (Any): The fields of the request.
+
+        Returns:
+            Dict[str, Any]: The server's reply.
+        """
+        start = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+        reply = json.loads(await reader.readline())
+        self.latencies.append(time.perf_counter() - start)
+        return reply
+
+    async def _client(self, number: int) -> None:
+        """
+        Runs one simulated learner.
+
+        Args:
+            number (int): The learner's number, used as its profile name.
+        """
+        try:
+            if self.socket_path is not None:
+                reader, writer = await asyncio.open_unix_connection(self.socket_path)
+            else:
+                reader, writer = await asyncio.open_connection(self.host, self.port)
+            await self._request(
+                reader, writer, op="hello", profile=f"loadtest-{number}"
+            )
+            decks = (await self._request(reader, writer, op="list"))["decks"]
+            for deck in random.sample(decks, min(self.decks, len(decks))):
+                reply = await self._request(reader, writer, op="study", deck=deck)
+                answers: Dict[str, str] = {}
+                while not reply["done"]:
+                    prompt = reply["prompt"]
+                    guess = (
+                        answers.get(prompt, "")
+                        if random.random() < self.accuracy
+                        else ""
+                    )
+                    reply = await self._request(reader, writer, op="answer", text=guess)
+                    answers[prompt] = reply["answer"]
+            writer.close()
+        except (OSError, ValueError, KeyError):
+            self.errors += 1
+
+    async def run(self) -> None:
+        """
+        Runs all sessions concurrently and prints a summary.
+        """
+        start = time.perf_counter()
+        await asyncio.gather(*(self._client(i) for i in range(self.clients)))
+        elapsed = time.perf_counter() - start
+        latencies = sorted(self.latencies) or [0.0]
+        PrintHandler.print_notice(f"Sessions: {self.clients} ({self.errors} failed)")
+        PrintHandler.print_notice(
+            f"Requests: {len(self.latencies)} in {elapsed:.2f}s "
+            f"({len(self.latencies) / elapsed:.0f}/s)"
+        )
+        for percentile in (50, 95, 99):
+            index = min(len(latencies) - 1, len(latencies) * percentile // 100)
+            PrintHandler.print_notice(
+                f"p{percentile} latency: {latencies[index] * 1000:.2f}ms"
+            )
+
+
+def serve_copy(filepath: str, directory: str) -> Tuple[subprocess.Popen, str]:
+    """
+    Copies a library without its progress and starts a study server over the copy.
+
+    Args:
+        filepath (str): The root directory of the library.
+        directory (str): The temporary directory to copy the library into.
+
+    Returns:
+        Tuple[subprocess.Popen, str]: The server process and the Unix socket it listens on.
+
+    Raises:
+        RuntimeError: If the server exits or does not listen within a minute.
+    """
+    library = Path(directory) / "library"
+    shutil.copytree(filepath, library, ignore=shutil.ignore_patterns(".progress"))
+    socket_path = str(Path(directory) / "server.sock")
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            str(Path(__file__).with_name("server.py")),
+            str(library),
+            "--socket",
+            socket_path,
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while not Path(socket_path).exists():
+        if server.poll() is not None or time.monotonic() > deadline:
+            server.kill()
+            raise RuntimeError("The study server did not start.")
+        time.sleep(0.1)
+    return server, socket_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the local study server.")
+    parser.add_argument("filepath", help="The root directory of the library to copy.")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--decks", type=int, default=3)
+    parser.add_argument("--accuracy", type=float, default=0.8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        server, socket_path = serve_copy(args.filepath, directory)
+        try:
+            asyncio.run(
+                LoadTest(
+                    socket_path, "", 0, args.clients, args.decks, args.accuracy
+                ).run()
+            )
+        finally:
+            server.terminate()
+            server.wait()
@@ -0,0 +1,477 @@
+'''
+Metrics of study sessions in the Prometheus and OpenMetrics text formats.
+
+Counters and histograms are kept per thread, so recording a value never takes a lock, and
+the threads' values are only added up when the metrics are rendered. The registry can be
+written to a textfile-collector `.prom` file or served over HTTP on an interval.
+
+Usage:
+    FLASHCARDS_METRICS_FILE=/var/lib/node_exporter/flashcards.prom python runner/runner.py
+    FLASHCARDS_METRICS_PORT=9464 python runner/runner.py
+    python runner/server.py Swedish/flashcards --metrics-port 9464
+'''
+
+import argparse, atexit, bisect, os, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from handlers import *
+
+
+class Metric:
+    TYPE = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        """
+        Initializes a metric with no values recorded.
+
+        Args:
+            name (str): The name of the metric, without a `_total` suffix.
+            help (str): The description of the metric.
+            labelnames (Sequence[str]): The names of the metric's labels, if any.
+
+        Attributes:
+            children (Dict[Tuple[str, ...], Metric]): The metric of each set of label values.
+            cells (List[List[float]]): The values recorded by each thread.
+        """
+        self.name: str = name
+        self.help: str = help
+        self.labelnames: Tuple[str, ...] = tuple(labelnames)
+        self.children: Dict[Tuple[str, ...], "Metric"] = {}
+        self.cells: List[List[float]] = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def labels(self, *values: str) -> "Metric":
+        """
+        Returns the metric of a set of label values, creating it on first use.
+
+        Args:
+            *values (str): One value per label name.
+
+        Returns:
+            Metric: The metric to record values of these labels in.
+
+        Raises:
+            ValueError: If the number of values does not match the label names.
+        """
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}")
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._child())
+        return child
+
+    def _child(self) -> "Metric":
+        """
+        Creates an unlabelled metric of the same kind.
+
+        Returns:
+            Metric: The new metric.
+        """
+        return type(self)(self.name, self.help)
+
+    def _cell(self) -> List[float]:
+        """
+        Returns the calling thread's values. Only that thread writes to them, so they can be
+        updated without a lock.
+
+        Returns:
+            List[float]: The thread's values.
+        """
+        cell = getattr(self.local, "cell", None)
+        if cell is None:
+            cell = self.local.cell = self._empty()
+            with self.lock:
+                self.cells.append(cell)
+        return cell
+
+    def _empty(self) -> List[float]:
+        """
+        Returns the values of a thread that has recorded nothing.
+
+        Returns:
+            List[float]: The empty values.
+        """
+        return [0.0]
+
+    def _total(self) -> List[float]:
+        """
+        Adds up the values of every thread.
+
+        Returns:
+            List[float]: The summed values.
+        """
+        total = self._empty()
+        for cell in list(self.cells):
+            for i, value in enumerate(cell):
+                total[i] += value
+        return total
+
+    def _samples(self, openmetrics: bool) -> List[Tuple[str, str, float]]:
+        """
+        Returns the samples of the metric, without labels.
+
+        Args:
+            openmetrics (bool): Whether the samples are rendered as OpenMetrics.
+
+        Returns:
+            List[Tuple[str, str, float]]: (suffix, extra labels, value) triples.
+        """
+        return [("", "", self._total()[0])]
+
+    def render(self, openmetrics: bool = False) -> List[str]:
+        """
+        Renders the metric and its labelled children.
+
+        Args:
+            openmetrics (bool): Whether to render OpenMetrics instead of the Prometheus text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        family = (
+            self.name if openmetrics or self.TYPE != "counter" else self.name + "_total"
+        )
+        lines = [f"# HELP {family} {self.help}", f"# TYPE {family} {self.TYPE}"]
+        metrics = sorted(self.children.items()) if self.labelnames else [((), self)]
+        for values, metric in metrics:
+            labels = [f'{n}="{v}"' for n, v in zip(self.labelnames, values)]
+            for suffix, extra, value in metric._samples(openmetrics):
+                names = ",".join(labels + ([extra] if extra else []))
+                lines.append(
+                    f"{self.name}{suffix}{'{' + names + '}' if names else ''} {value:.17g}"
+                )
+        return lines
+
+
+class Counter(Metric):
+    TYPE = "counter"
+
+    def inc(self, amount: float = 1.0) -> None:
+        """
+        Increases the counter.
+
+        Args:
+            amount (float): The amount to add.
+        """
+        self._cell()[0] += amount
+
+    def _samples(self, openmetrics: bool) -> List[Tuple[str, str, float]]:
+        return [("_total", "", self._total()[0])]
+
+
+class Histogram(Metric):
+    TYPE = "histogram"
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = BUCKETS,
+    ) -> None:
+        """
+        Initializes a histogram with no observations.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labelnames (Sequence[str]): The names of the metric's labels, if any.
+            buckets (Sequence[float]): The upper bounds of the buckets, ascending.
+        """
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        super().__init__(name, help, labelnames)
+
+    def _child(self) -> "Histogram":
+        return Histogram(self.name, self.help, buckets=self.buckets)
+
+    def _empty(self) -> List[float]:
+        # one count per bucket, then +Inf, the sum and the count
+        return [0.0] * (len(self.buckets) + 3)
+
+    def observe(self, value: float) -> None:
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value, such as a duration in seconds.
+        """
+        cell = self._cell()
+        cell[bisect.bisect_left(self.buckets, value)] += 1
+        cell[-2] += value
+        cell[-1] += 1
+
+    def time(self) -> "Timer":
+        """
+        Returns a context manager that observes how long its block takes.
+
+        Returns:
+            Timer: The timer.
+        """
+        return Timer(self)
+
+    def _samples(self, openmetrics: bool) -> List[Tuple[str, str, float]]:
+        total = self._total()
+        samples = []
+        cumulative = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), total):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else f"{bound:g}"
+            samples.append(("_bucket", f'le="{le}"', cumulative))
+        samples.append(("_sum", "", total[-2]))
+        samples.append(("_count", "", total[-1]))
+        return samples
+
+
+class Timer:
+    def __init__(self, histogram: Histogram) -> None:
+        """
+        Initializes a timer.
+
+        Args:
+            histogram (Histogram): The histogram to observe the duration in.
+        """
+        self.histogram = histogram
+        self.started: float = 0.0
+
+    def __enter__(self) -> "Timer":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Registry:
+    def __init__(self) -> None:
+        """
+        Initializes an empty registry.
+
+        Attributes:
+            metrics (Dict[str, Metric]): The registered metrics, by name.
+        """
+        self.metrics: Dict[str, Metric] = {}
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        """
+        Registers a counter.
+
+        Args:
+            name (str): The name of the metric, without a `_total` suffix.
+            help (str): The description of the metric.
+            labelnames (Sequence[str]): The names of the metric's labels, if any.
+
+        Returns:
+            Counter: The counter.
+        """
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = Histogram.BUCKETS,
+    ) -> Histogram:
+        """
+        Registers a histogram.
+
+        Args:
+            name (str): The name of the metric.
+            help (str): The description of the metric.
+            labelnames (Sequence[str]): The names of the metric's labels, if any.
+            buckets (Sequence[float]): The upper bounds of the buckets, ascending.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def _register(self, metric):
+        """
+        Adds a metric to the registry.
+
+        Args:
+            metric (Metric): The metric.
+
+        Returns:
+            Metric: The same metric.
+
+        Raises:
+            ValueError: If a metric of the same name is already registered.
+        """
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered.")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self, openmetrics: bool = False) -> str:
+        """
+        Renders every metric.
+
+        Args:
+            openmetrics (bool): Whether to render OpenMetrics instead of the Prometheus text format.
+
+        Returns:
+            str: The exposition text.
+        """
+        lines = []
+        for metric in self.metrics.values():
+            lines += metric.render(openmetrics)
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+SESSIONS = REGISTRY.counter(
+    "flashcards_sessions", "Decks studied, including repeats.", ["source"]
+)
+ANSWERS = REGISTRY.counter(
+    "flashcards_cards_answered",
+    "Cards answered, by whether they were right.",
+    ["result"],
+)
+ANSWER_LATENCY = REGISTRY.histogram(
+    "flashcards_answer_latency_seconds",
+    "Time from showing a card to its answer.",
+    buckets=(0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0),
+)
+DECK_LOAD = REGISTRY.histogram(
+    "flashcards_deck_load_seconds", "Time to read and parse a deck."
+)
+WRITE_BACK = REGISTRY.histogram(
+    "flashcards_write_back_seconds", "Time to save a score."
+)
+
+
+class MetricsExporter:
+    def __init__(
+        self,
+        registry: Registry = REGISTRY,
+        textfile: Optional[str] = None,
+        port: Optional[int] = None,
+        host: str = "127.0.0.1",
+        interval: float = 15.0,
+    ) -> None:
+        """
+        Initializes an exporter. Nothing is exported until it is started.
+
+        Args:
+            registry (Registry): The metrics to export.
+            textfile (Optional[str]): The `.prom` file to write, for node_exporter's textfile collector.
+            port (Optional[int]): The port to serve the metrics on over HTTP.
+            host (str): The host to serve the metrics on.
+            interval (float): How often to write the textfile, in seconds.
+        """
+        self.registry = registry
+        self.textfile: Optional[Path] = Path(textfile) if textfile else None
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server: Optional[ThreadingHTTPServer] = None
+
+    @staticmethod
+    def from_environment() -> Optional["MetricsExporter"]:
+        """
+        Configures an exporter from FLASHCARDS_METRICS_FILE, FLASHCARDS_METRICS_PORT and
+        FLASHCARDS_METRICS_INTERVAL.
+
+        Returns:
+            Optional[MetricsExporter]: The exporter, or None if neither a file nor a port is set.
+        """
+        textfile = os.environ.get("FLASHCARDS_METRICS_FILE")
+        port = os.environ.get("FLASHCARDS_METRICS_PORT")
+        if not textfile and not port:
+            return None
+        interval = float(os.environ.get("FLASHCARDS_METRICS_INTERVAL", 15.0))
+        return MetricsExporter(
+            textfile=textfile, port=int(port) if port else None, interval=interval
+        )
+
+    def start(self) -> None:
+        """
+        Starts writing the textfile on the interval and serving the endpoint, on daemon threads.
+        The textfile is written a last time when the program exits.
+        """
+        if self.textfile is not None:
+            threading.Thread(target=self._write_loop, daemon=True).start()
+            atexit.register(self.stop)
+        if self.port is not None:
+            registry = self.registry
+
+            class Handler(BaseHTTPRequestHandler):
+                def do_GET(self) -> None:
+                    openmetrics = "application/openmetrics-text" in self.headers.get(
+                        "Accept", ""
+                    )
+                    body = registry.render(openmetrics).encode()
+                    self.send_response(200)
+                    self.send_header(
+                        "Content-Type",
+                        (
+                            "application/openmetrics-text; version=1.0.0; charset=utf-8"
+                            if openmetrics
+                            else "text/plain; version=0.0.4; charset=utf-8"
+                        ),
+                    )
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+                def log_message(self, *args) -> None:
+                    pass
+
+            self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def write(self) -> None:
+        """
+        Writes the textfile now, replacing it atomically so the collector never reads half of it.
+        The file is made readable by everyone, as the collector usually runs as another user.
+        """
+        if self.textfile is not None:
+            self.textfile.parent.mkdir(parents=True, exist_ok=True)
+            FileHandler.atomic_write(self.textfile, self.registry.render(), mode=0o644)
+
+    def _write_loop(self) -> None:
+        """
+        Writes the textfile every interval until stopped.
+        """
+        while not self.stopped.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                PrintHandler.print_exception(f"Could not write metrics: {e}")
+
+    def stop(self) -> None:
+        """
+        Stops exporting, writing the textfile a last time. It runs when the program exits, so a
+        failed write is reported rather than raised.
+        """
+        self.stopped.set()
+        try:
+            self.write()
+        except OSError as e:
+            PrintHandler.print_exception(f"Could not write metrics: {e}")
+        if self.server is not None:
+            self.server.shutdown()
+
+
+def parse_metrics_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments for exporting metrics.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument(
+        "--metrics-file", help="Textfile-collector .prom file to write."
+    )
+    parser.add_argument("--metrics-port", type=int, help="Port to serve metrics on.")
+    parser.add_argument("--metrics-interval", type=float, default=15.0)
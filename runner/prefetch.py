@@ -0,0 +1,119 @@
+'''
+Background prefetch of queued decks.
+
+A worker thread warms the next decks of the study queue while the current one is studied,
+so the work of loading them is off the critical path when they come up. Queued decks are
+only read when they are warmed, or when they come up if they were not. Only the next few
+decks are warmed, and only as many as fit in a budget of bytes of deck files.
+'''
+
+import threading
+from typing import Any, Callable, Dict, List, Set
+
+
+class Prefetcher:
+    def __init__(
+        self,
+        warm: Callable[[Any], None],
+        size: Callable[[Any], int],
+        depth: int = 2,
+        budget: int = 64 * 2**20,
+    ) -> None:
+        """
+        Initializes a prefetcher and starts its worker thread.
+
+        Args:
+            warm (Callable[[File], None]): Does the work of loading a deck ahead of time.
+            size (Callable[[File], int]): Estimates what warming a deck takes, in bytes.
+            depth (int): How many decks ahead of the current one to warm.
+            budget (int): The most bytes of decks warmed ahead of time at once.
+
+        Attributes:
+            pending (List[File]): The decks waiting to be warmed, next first.
+            warmed (Set[int]): The ids of the decks warmed and not yet claimed.
+            running (Dict[int, threading.Event]): Set when the deck being warmed is done, by id.
+        """
+        self.warm = warm
+        self.size = size
+        self.depth: int = depth
+        self.budget: int = budget
+        self.pending: List[Any] = []
+        self.warmed: Set[int] = set()
+        self.running: Dict[int, threading.Event] = {}
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._work, daemon=True)
+        self.thread.start()
+
+    def schedule(self, upcoming: List[Any]) -> None:
+        """
+        Sets the decks coming up next. Of the first `depth` of them, those that fit in the
+        budget together with the decks before them are warmed in order, if they are not warm yet.
+
+        Args:
+            upcoming (List[File]): The decks of the queue, next first.
+        """
+        chosen, total = [], 0
+        for file in upcoming[: self.depth]:
+            total += self.size(file)
+            if total > self.budget:
+                break
+            chosen.append(file)
+        with self.condition:
+            self.pending = [
+                file
+                for file in chosen
+                if id(file) not in self.warmed and id(file) not in self.running
+            ]
+            self.condition.notify()
+
+    def claim(self, file: Any) -> bool:
+        """
+        Takes a deck off the queue, waiting for it if it is being warmed.
+
+        Args:
+            file (File): The deck about to be studied.
+
+        Returns:
+            bool: Whether the deck was warmed ahead of time.
+        """
+        with self.condition:
+            if file in self.pending:
+                self.pending.remove(file)
+            event = self.running.get(id(file))
+        if event is not None:
+            event.wait()
+        with self.condition:
+            if id(file) not in self.warmed:
+                return False
+            self.warmed.remove(id(file))
+            return True
+
+    def _next(self) -> Any:
+        """
+        Waits for a deck to warm and marks it as running.
+
+        Returns:
+            File: The deck to warm.
+        """
+        with self.condition:
+            while not self.pending:
+                self.condition.wait()
+            file = self.pending.pop(0)
+            self.running[id(file)] = threading.Event()
+            return file
+
+    def _work(self) -> None:
+        """
+        Warms scheduled decks until the program exits.
+        """
+        while True:
+            file = self._next()
+            try:
+                self.warm(file)
+                warmed = True
+            except Exception:
+                warmed = False  # the deck is loaded again when it is studied
+            with self.condition:
+                if warmed:
+                    self.warmed.add(id(file))
+                self.running.pop(id(file)).set()
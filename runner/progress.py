@@ -0,0 +1,210 @@
+import json, time, threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from handlers import *
+
+if OSHandler.get_OS() == "windows":
+    import msvcrt
+else:
+    import fcntl
+
+
+class FileLock:
+    def __init__(self, filepath: Path) -> None:
+        """
+        Initializes an advisory, exclusive lock backed by a lock file.
+
+        Args:
+            filepath (Path): The path of the lock file. It is created if it does not exist.
+
+        Attributes:
+            filepath (Path): The path of the lock file.
+            file (Optional[IO]): The open lock file while the lock is held.
+            thread_lock (threading.Lock): Serializes threads of this process sharing the lock.
+        """
+        self.filepath: Path = Path(filepath)
+        self.file = None
+        self.thread_lock: threading.Lock = threading.Lock()
+
+    def __enter__(self) -> "FileLock":
+        """
+        Blocks until the lock is acquired.
+
+        Returns:
+            FileLock: The held lock.
+        """
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        """
+        Releases the lock.
+        """
+        self.release()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """
+        Acquires the lock.
+
+        Args:
+            blocking (bool): Whether to wait for the lock, rather than give up if it is held.
+
+        Returns:
+            bool: Whether the lock was acquired.
+        """
+        if not self.thread_lock.acquire(blocking):
+            return False
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.filepath, "a+")
+        try:
+            if OSHandler.get_OS() == "windows":
+                self.file.seek(0)
+                while True:
+                    try:
+                        mode = msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK
+                        msvcrt.locking(self.file.fileno(), mode, 1)
+                        break
+                    except OSError:  # LK_LOCK gives up after 10 seconds, keep waiting
+                        if not blocking:
+                            raise
+            else:
+                mode = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                fcntl.flock(self.file.fileno(), mode)
+        except OSError:
+            self.file.close()
+            self.file = None
+            self.thread_lock.release()
+            return False
+        return True
+
+    def release(self) -> None:
+        """
+        Releases the lock.
+        """
+        if OSHandler.get_OS() == "windows":
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+        self.file = None
+        self.thread_lock.release()
+
+
+class ProgressStore:
+    def __init__(self, directory: Path, profile: str) -> None:
+        """
+        Initializes the progress store of one learner profile.
+
+        Progress is kept apart from the deck files, so any number of profiles can study
+        the same library. Every update takes an advisory lock, re-reads the store, and
+        replaces it atomically, so concurrent sessions of the same profile never lose
+        each other's updates.
+
+        Args:
+            directory (Path): The directory holding the progress stores of all profiles.
+            profile (str): The name of the learner profile.
+
+        Attributes:
+            profile (str): The name of the learner profile.
+            filepath (Path): The JSON file holding this profile's progress.
+            lock (FileLock): The lock guarding updates to the file.
+        """
+        self.profile: str = profile
+        self.filepath: Path = Path(directory) / f"{profile}.json"
+        self.lock: FileLock = FileLock(Path(directory) / f"{profile}.lock")
+
+    def __repr__(self) -> str:
+        """
+        Returns an unambiguous string representation of the object, useful for debugging.
+
+        Returns:
+            str: A string that represents the object with its key attributes.
+        """
+        return (
+            f"{self.__class__.__name__}\n"
+            f"\t.profile == {repr(self.profile)},\n"
+            f"\t.filepath == {repr(self.filepath)}\n"
+        )
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Reads the whole store. Readers need no lock since the file is only ever replaced atomically.
+
+        Returns:
+            Dict[str, Any]: The stored progress, with a "decks" mapping keyed by deck.
+        """
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {"profile": self.profile, "decks": {}}
+
+    def update(self, change: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+        """
+        Applies a change to the store under the lock and writes it back atomically.
+
+        Args:
+            change (Callable[[Dict[str, Any]], None]): A function that modifies the loaded store in place.
+
+        Returns:
+            Dict[str, Any]: The store as written.
+        """
+        with self.lock:
+            data = self.load()
+            change(data)
+            FileHandler.atomic_write(
+                self.filepath, json.dumps(data, ensure_ascii=False)
+            )
+        return data
+
+    def record_score(self, deck: str, score: int) -> None:
+        """
+        Appends a score to the history of a deck.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+            score (int): The score as a percentage.
+        """
+
+        def change(data: Dict[str, Any]) -> None:
+            entry = data["decks"].setdefault(deck, {"scores": []})
+            entry["scores"].append([round(time.time()), score])
+
+        self.update(change)
+
+    def last_scores(self, deck: str, count: int = 5) -> List[int]:
+        """
+        Returns the most recent scores of a deck.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+            count (int): The number of scores to return.
+
+        Returns:
+            List[int]: Up to `count` scores, oldest first.
+        """
+        entry: Optional[Dict[str, Any]] = self.load()["decks"].get(deck)
+        if entry is None:
+            return []
+        return [score for _, score in entry["scores"][-count:]]
+
+    def summary(self, count: int = 5) -> Dict[str, Tuple[float, int]]:
+        """
+        Summarizes the recent scores of every deck, for listing decks.
+
+        Args:
+            count (int): The number of recent scores to average.
+
+        Returns:
+            Dict[str, Tuple[float, int]]: The average of the last `count` scores and the time
+                of the last attempt, as a UNIX timestamp, by deck.
+        """
+        summary = {}
+        for deck, entry in self.load()["decks"].items():
+            scores = entry["scores"][-count:]
+            if scores:
+                average = sum(score for _, score in scores) / len(scores)
+                summary[deck] = (average, scores[-1][0])
+        return summary
@@ -0,0 +1,633 @@
+'''
+Card queries for building study sessions.
+
+Every card of the library gets a number, and each attribute is indexed as bitmaps over those
+numbers, kept as Python integers: one bitmap per deck, folder and tag, and bit-sliced indexes
+(one bitmap per bit of the value) for the times a card was missed, when it was last seen and
+how long it takes to answer. A query is evaluated with bitwise AND, OR and NOT over these
+bitmaps, so no card is looked at until the matches are listed.
+
+Queries combine predicates with `and`, `or`, `not` and parentheses. Predicates next to each
+other are combined with `and`.
+
+    deck:Duolingo/s7*       decks whose path matches a glob
+    folder:Tiktok           decks in a folder
+    tag:food                cards under a `# tags:` comment with the tag
+    missed>=2               cards answered wrong at least twice
+    seen<7 / seen>30        cards last seen within 7 days / more than 30 days ago
+    seen:never              cards never reviewed
+    latency>p90 / latency>4 cards slower than 90% of the reviewed cards / than 4 seconds
+
+Usage:
+    python runner/query.py Swedish/flashcards "folder:Duolingo and missed>=1"
+    python runner/query.py Swedish/flashcards "tag:food not seen<7" --out session.txt
+'''
+
+import argparse, fnmatch, getpass, os, re, time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from handlers import *
+from storage import TextBackend
+from analytics import ReviewColumns
+
+TOKEN_RE = re.compile(
+    r'\s*(?:(?P<paren>[()])|(?P<field>[a-z]+)\s*(?P<op>>=|<=|[:=<>])\s*(?P<value>"[^"]*"|[^\s()]+)|(?P<word>[^\s()]+))'
+)
+
+
+def bitmap(ranges: List[Tuple[int, int]], size: int) -> int:
+    """
+    Builds a bitmap from runs of card numbers, filling whole bytes at a time.
+
+    Args:
+        ranges (List[Tuple[int, int]]): The first and past-the-last card number of each run.
+        size (int): The number of cards.
+
+    Returns:
+        int: The bitmap, with bit i set for card i.
+    """
+    buffer = bytearray((size + 7) // 8)
+    for start, end in ranges:
+        while start < end and start & 7:
+            buffer[start >> 3] |= 1 << (start & 7)
+            start += 1
+        while start < end and end & 7:
+            end -= 1
+            buffer[end >> 3] |= 1 << (end & 7)
+        buffer[start >> 3 : end >> 3] = b"\xff" * ((end - start) >> 3)
+    return int.from_bytes(buffer, "little")
+
+
+def bitmap_from_mask(mask: np.ndarray) -> int:
+    """
+    Builds a bitmap from a boolean array over the cards.
+
+    Args:
+        mask (np.ndarray): Whether each card is in the bitmap.
+
+    Returns:
+        int: The bitmap, with bit i set for card i.
+    """
+    return int.from_bytes(np.packbits(mask, bitorder="little").tobytes(), "little")
+
+
+def members(bits: int) -> List[int]:
+    """
+    Lists the card numbers in a bitmap.
+
+    Args:
+        bits (int): The bitmap.
+
+    Returns:
+        List[int]: The card numbers, ascending.
+    """
+    digits = bin(bits)[:1:-1]
+    found, i = [], digits.find("1")
+    while i != -1:
+        found.append(i)
+        i = digits.find("1", i + 1)
+    return found
+
+
+class BitSlicedIndex:
+    def __init__(self, values: np.ndarray, exists: np.ndarray) -> None:
+        """
+        Indexes a non-negative integer attribute of the cards as one bitmap per bit.
+
+        Args:
+            values (np.ndarray): The value of each card.
+            exists (np.ndarray): Whether each card has a value.
+
+        Attributes:
+            exists (int): The bitmap of the cards that have a value.
+            slices (List[int]): The bitmap of each bit of the values, lowest first.
+        """
+        values = np.where(exists, values, 0).astype(np.int64)
+        width = int(values.max()).bit_length() if len(values) else 0
+        self.exists: int = bitmap_from_mask(exists)
+        self.slices: List[int] = [
+            bitmap_from_mask((values >> i) & 1 == 1) for i in range(width)
+        ]
+
+    def compare(self, op: str, value: int) -> int:
+        """
+        Finds the cards whose value compares to a constant, going from the highest bit down.
+
+        Args:
+            op (str): One of "=", "<", "<=", ">" and ">=".
+            value (int): The constant.
+
+        Returns:
+            int: The bitmap of the matching cards.
+        """
+        greater, less, equal = 0, 0, self.exists
+        if value < 0:
+            greater, equal = self.exists, 0
+        elif value >> len(self.slices):
+            less, equal = self.exists, 0
+        else:
+            for i in reversed(range(len(self.slices))):
+                bits = self.slices[i]
+                if value >> i & 1:
+                    less |= equal & ~bits
+                    equal &= bits
+                else:
+                    greater |= equal & bits
+                    equal &= ~bits
+        return {
+            "=": equal,
+            "<": less,
+            "<=": less | equal,
+            ">": greater,
+            ">=": greater | equal,
+        }[op]
+
+
+class CardCatalog:
+    def __init__(self, root: Path) -> None:
+        """
+        Initializes an empty catalog of a library. Call `refresh` to index it.
+
+        Args:
+            root (Path): The root directory of the library.
+
+        Attributes:
+            cards (List[Tuple[str, str, str]]): (deck, term, definition) of each card, by number.
+            decks (Dict[str, Tuple[int, int]]): The first and past-the-last card number of each deck.
+            folders (Dict[str, int]): The bitmap of each folder.
+            tags (Dict[str, int]): The bitmap of each tag.
+            everything (int): The bitmap of every card.
+            stamp (Dict[str, int]): The modification time of each deck when it was indexed.
+            missed (Optional[BitSlicedIndex]): The times each card was answered wrong.
+            last (Optional[BitSlicedIndex]): When each card was last seen, in UNIX seconds.
+            latency (Optional[BitSlicedIndex]): The mean time taken to answer each card, in milliseconds.
+            latencies (np.ndarray): The mean latencies of the reviewed cards, sorted, for percentiles.
+            profile (Optional[str]): The learner profile the review indexes are of.
+        """
+        self.root: Path = Path(root).resolve()
+        self.cards: List[Tuple[str, str, str]] = []
+        self.decks: Dict[str, Tuple[int, int]] = {}
+        self.folders: Dict[str, int] = {}
+        self.tags: Dict[str, int] = {}
+        self.everything: int = 0
+        self.stamp: Dict[str, int] = {}
+        self.missed: Optional[BitSlicedIndex] = None
+        self.last: Optional[BitSlicedIndex] = None
+        self.latency: Optional[BitSlicedIndex] = None
+        self.latencies: np.ndarray = np.empty(0, np.int64)
+        self.profile: Optional[str] = None
+        directory = self.root / ".progress"
+        self.columns = ReviewColumns(
+            directory / "library.db", directory / "reviews.npz"
+        )
+
+    def __len__(self) -> int:
+        """
+        Returns the number of cards in the catalog.
+
+        Returns:
+            int: The number of cards.
+        """
+        return len(self.cards)
+
+    def _walk(self) -> Dict[str, int]:
+        """
+        Finds the decks of the library, skipping hidden files and directories.
+
+        Returns:
+            Dict[str, int]: The modification time of each deck, by path relative to the library.
+        """
+        found = {}
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith(".")]
+            for filename in filenames:
+                if not filename.startswith("."):
+                    path = Path(directory) / filename
+                    found[path.relative_to(self.root).as_posix()] = (
+                        path.stat().st_mtime_ns
+                    )
+        return found
+
+    def refresh(self, profile: str) -> bool:
+        """
+        Reindexes the decks if any of them changed, and the review history of a profile if
+        reviews were added since the last refresh.
+
+        Args:
+            profile (str): The learner profile whose reviews are indexed.
+
+        Returns:
+            bool: True if anything was reindexed.
+        """
+        stamp = self._walk()
+        rebuilt = stamp != self.stamp
+        if rebuilt:
+            self._build(stamp)
+        added = self.columns.refresh()
+        if rebuilt or added or profile != self.profile:
+            self._index_reviews(profile)
+            return True
+        return False
+
+    def _build(self, stamp: Dict[str, int]) -> None:
+        """
+        Numbers the cards of every deck and builds the deck, folder and tag bitmaps. A tags
+        comment applies to the run of cards below it, so tags are collected as runs.
+
+        Args:
+            stamp (Dict[str, int]): The decks to index and their modification times.
+        """
+        self.cards, self.decks = [], {}
+        folders: Dict[str, List[Tuple[int, int]]] = {}
+        tagged: Dict[str, List[Tuple[int, int]]] = {}
+        for deck in sorted(stamp):
+            start = len(self.cards)
+            runs: List[Tuple[int, List[str]]] = [(start, [])]
+            with open(self.root / deck, "r", encoding="utf-8") as file:
+                for term, definition, tags in TextBackend.iter_cards(file):
+                    if tags is not runs[-1][1]:
+                        runs.append((len(self.cards), tags))
+                    self.cards.append((deck, term, definition))
+            runs.append((len(self.cards), []))
+            for (begin, tags), (end, _) in zip(runs, runs[1:]):
+                for tag in tags:
+                    tagged.setdefault(tag, []).append((begin, end))
+            self.decks[deck] = (start, len(self.cards))
+            folders.setdefault(Path(deck).parent.name, []).append(
+                (start, len(self.cards))
+            )
+        size = len(self.cards)
+        self.folders = {folder: bitmap(runs, size) for folder, runs in folders.items()}
+        self.tags = {tag: bitmap(runs, size) for tag, runs in tagged.items()}
+        self.everything = (1 << size) - 1
+        self.stamp = stamp
+
+    def _index_reviews(self, profile: str) -> None:
+        """
+        Builds the bit-sliced indexes of the review history of a profile, matching reviews
+        to cards by deck and term.
+
+        Args:
+            profile (str): The learner profile.
+        """
+        columns = self.columns.columns
+        mask = self.columns.select(profile)
+        terms = len(self.columns.vocabularies["term"]) or 1
+        pairs = columns["deck"][mask].astype(np.int64) * terms + columns["term"][mask]
+        unique, inverse = np.unique(pairs, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        wrong = np.bincount(
+            inverse, weights=1 - columns["correct"][mask], minlength=len(unique)
+        )
+        latency = np.bincount(
+            inverse, weights=columns["latency"][mask], minlength=len(unique)
+        ) / np.maximum(counts, 1)
+        last = np.zeros(len(unique))
+        np.maximum.at(last, inverse, columns["ts"][mask])
+
+        deck_codes = self.columns.codes["deck"]
+        term_codes = self.columns.codes["term"]
+        card_pairs = np.full(len(self.cards), -1, np.int64)
+        for deck, (first, end) in self.decks.items():
+            code = deck_codes.get(deck)
+            if code is None:
+                continue
+            codes = np.fromiter(
+                (term_codes.get(term, -1) for _, term, _ in self.cards[first:end]),
+                np.int64,
+                end - first,
+            )
+            card_pairs[first:end] = np.where(codes >= 0, code * terms + codes, -1)
+        if len(unique):
+            found = np.minimum(np.searchsorted(unique, card_pairs), len(unique) - 1)
+            seen = (card_pairs >= 0) & (unique[found] == card_pairs)
+        else:
+            found = np.zeros(len(self.cards), np.int64)
+            seen = np.zeros(len(self.cards), bool)
+            wrong = last = latency = np.zeros(1)
+        milliseconds = (latency[found] * 1000).round().astype(np.int64)
+        self.missed = BitSlicedIndex(wrong[found], seen)
+        self.last = BitSlicedIndex(last[found], seen)
+        self.latency = BitSlicedIndex(milliseconds, seen)
+        self.latencies = np.sort(milliseconds[seen])
+        self.profile = profile
+
+    def query(self, text: str) -> int:
+        """
+        Evaluates a query.
+
+        Args:
+            text (str): The query.
+
+        Returns:
+            int: The bitmap of the matching cards.
+
+        Raises:
+            ValueError: If the query is not valid.
+        """
+        tokens = self._tokenize(text)
+        if not tokens:
+            raise ValueError("The query is empty.")
+        bits, position = self._parse_or(tokens, 0)
+        if position != len(tokens):
+            raise ValueError(f"Unexpected {self._describe(tokens[position])}.")
+        return bits
+
+    def select(self, bits: int) -> List[Tuple[str, str, str]]:
+        """
+        Lists the cards in a bitmap.
+
+        Args:
+            bits (int): The bitmap.
+
+        Returns:
+            List[Tuple[str, str, str]]: (deck, term, definition) of each card, in library order.
+        """
+        return [self.cards[i] for i in members(bits)]
+
+    @staticmethod
+    def _tokenize(text: str) -> List[Tuple[str, ...]]:
+        """
+        Splits a query into parentheses, predicates and words.
+
+        Args:
+            text (str): The query.
+
+        Returns:
+            List[Tuple[str, ...]]: ("(",) or (")",), ("predicate", field, op, value) or ("word", word).
+
+        Raises:
+            ValueError: If a quote is not closed.
+        """
+        tokens: List[Tuple[str, ...]] = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            match = TOKEN_RE.match(text, position)
+            if match is None or match.end() == position:
+                raise ValueError(f"Cannot read the query from: {text[position:]}")
+            if match["paren"]:
+                tokens.append((match["paren"],))
+            elif match["field"]:
+                value = match["value"]
+                if value.startswith('"'):
+                    value = value[1:-1]
+                tokens.append(("predicate", match["field"], match["op"], value))
+            else:
+                if match["word"].startswith('"'):
+                    raise ValueError(f"Unclosed quote in: {match['word']}")
+                tokens.append(("word", match["word"].lower()))
+            position = match.end()
+        return tokens
+
+    @staticmethod
+    def _describe(token: Tuple[str, ...]) -> str:
+        """
+        Describes a token for an error message.
+
+        Args:
+            token (Tuple[str, ...]): The token.
+
+        Returns:
+            str: The token as it was written.
+        """
+        if token[0] == "predicate":
+            return f'"{token[1]}{token[2]}{token[3]}"'
+        return f'"{token[-1]}"'
+
+    def _parse_or(
+        self, tokens: List[Tuple[str, ...]], position: int
+    ) -> Tuple[int, int]:
+        """
+        Evaluates predicates joined by `or`.
+
+        Args:
+            tokens (List[Tuple[str, ...]]): The tokens of the query.
+            position (int): Where to start.
+
+        Returns:
+            Tuple[int, int]: The bitmap and the position after the expression.
+        """
+        bits, position = self._parse_and(tokens, position)
+        while position < len(tokens) and tokens[position] == ("word", "or"):
+            right, position = self._parse_and(tokens, position + 1)
+            bits |= right
+        return bits, position
+
+    def _parse_and(
+        self, tokens: List[Tuple[str, ...]], position: int
+    ) -> Tuple[int, int]:
+        """
+        Evaluates predicates joined by `and`, or written next to each other.
+
+        Args:
+            tokens (List[Tuple[str, ...]]): The tokens of the query.
+            position (int): Where to start.
+
+        Returns:
+            Tuple[int, int]: The bitmap and the position after the expression.
+        """
+        bits, position = self._parse_not(tokens, position)
+        while position < len(tokens) and tokens[position] not in (
+            ("word", "or"),
+            (")",),
+        ):
+            if tokens[position] == ("word", "and"):
+                position += 1
+            right, position = self._parse_not(tokens, position)
+            bits &= right
+        return bits, position
+
+    def _parse_not(
+        self, tokens: List[Tuple[str, ...]], position: int
+    ) -> Tuple[int, int]:
+        """
+        Evaluates a predicate, a parenthesized query, or `not` before either.
+
+        Args:
+            tokens (List[Tuple[str, ...]]): The tokens of the query.
+            position (int): Where to start.
+
+        Returns:
+            Tuple[int, int]: The bitmap and the position after the expression.
+
+        Raises:
+            ValueError: If the query ends early or has something other than a predicate here.
+        """
+        if position >= len(tokens):
+            raise ValueError("The query ends too early.")
+        token = tokens[position]
+        if token == ("word", "not"):
+            bits, position = self._parse_not(tokens, position + 1)
+            return self.everything & ~bits, position
+        if token == ("(",):
+            bits, position = self._parse_or(tokens, position + 1)
+            if position >= len(tokens) or tokens[position] != (")",):
+                raise ValueError("A parenthesis is not closed.")
+            return bits, position + 1
+        if token[0] == "predicate":
+            return self._predicate(*token[1:]), position + 1
+        raise ValueError(
+            f"Expected a predicate such as folder:Duolingo, not {self._describe(token)}."
+        )
+
+    def _predicate(self, field: str, op: str, value: str) -> int:
+        """
+        Evaluates one predicate.
+
+        Args:
+            field (str): deck, folder, tag, missed, seen or latency.
+            op (str): ":", "=", "<", "<=", ">" or ">=". ":" means "=".
+            value (str): What to compare with.
+
+        Returns:
+            int: The bitmap of the matching cards.
+
+        Raises:
+            ValueError: If the field is unknown, or the comparison or value does not suit it.
+        """
+        op = "=" if op == ":" else op
+        if field in ("deck", "folder", "tag"):
+            if op != "=":
+                raise ValueError(f"Use {field}:{value} to match {field}s.")
+            if field == "deck":
+                return bitmap(
+                    [
+                        span
+                        for deck, span in self.decks.items()
+                        if fnmatch.fnmatchcase(deck, value)
+                        or fnmatch.fnmatchcase(Path(deck).stem, value)
+                    ],
+                    len(self.cards),
+                )
+            return (self.folders if field == "folder" else self.tags).get(value, 0)
+        if field == "missed":
+            count = self._number(field, value)
+            if not count.is_integer():
+                raise ValueError(f"missed needs a whole number, not {value}.")
+            return self.missed.compare(op, int(count))
+        if field == "seen":
+            if value == "never":
+                if op != "=":
+                    raise ValueError("Use seen:never to match cards never reviewed.")
+                return self.everything & ~self.last.exists
+            return self._seen(op, self._number(field, value, "d"))
+        if field == "latency":
+            if value.startswith("p"):
+                percentile = self._number(field, value[1:])
+                if not 0 <= percentile <= 100:
+                    raise ValueError(f"Percentiles go from p0 to p100, not {value}.")
+                if not self.latencies.size:
+                    return 0
+                rank = int((len(self.latencies) - 1) * percentile / 100)
+                milliseconds = int(self.latencies[rank])
+            else:
+                milliseconds = round(self._number(field, value, "s") * 1000)
+            return self.latency.compare(op, milliseconds)
+        raise ValueError(
+            f"Unknown field {field}. Use deck, folder, tag, missed, seen or latency."
+        )
+
+    def _seen(self, op: str, days: float) -> int:
+        """
+        Finds the reviewed cards by how many days ago they were last seen.
+
+        Args:
+            op (str): How the days ago compare with `days`.
+            days (float): The number of days.
+
+        Returns:
+            int: The bitmap of the matching cards.
+        """
+        now = time.time()
+        cutoff = int(now - days * 86400)
+        if op == "=":
+            start = int(now - (days + 1) * 86400)
+            return self.last.compare(">", start) & self.last.compare("<=", cutoff)
+        flipped = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}[op]
+        return self.last.compare(flipped, cutoff)
+
+    @staticmethod
+    def _number(field: str, value: str, unit: str = "") -> float:
+        """
+        Reads the number a predicate compares with.
+
+        Args:
+            field (str): The field, for the error message.
+            value (str): The value as written.
+            unit (str): A unit the value may end with, such as "d" for days.
+
+        Returns:
+            float: The number.
+
+        Raises:
+            ValueError: If the value is not a number.
+        """
+        try:
+            return float(
+                value[: -len(unit)] if unit and value.endswith(unit) else value
+            )
+        except ValueError:
+            raise ValueError(f"{field} needs a number, not {value}.") from None
+
+    def write_deck(self, bits: int, filepath: Path, query: str) -> int:
+        """
+        Writes the matching cards as a deck, with the query as its header. Each run of cards
+        from the same deck is preceded by a `# from: <deck>` comment, so their reviews can be
+        recorded under the deck they were copied from.
+
+        Args:
+            bits (int): The bitmap of the cards.
+            filepath (Path): Where to write the deck.
+            query (str): The query the cards came from.
+
+        Returns:
+            int: The number of cards written.
+        """
+        cards = self.select(bits)
+        lines = [f"# query: {query}"]
+        source = None
+        for deck, term, definition in cards:
+            if deck != source:
+                lines.append(f"# from: {deck}")
+                source = deck
+            lines.append(f"{term}: {definition}")
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        FileHandler.atomic_write(filepath, "\n".join(lines) + "\n")
+        return len(cards)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find cards matching a query.")
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument(
+        "query", help='The query, e.g. "folder:Duolingo and missed>=1".'
+    )
+    parser.add_argument("--profile", default=getpass.getuser())
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--out", help="Write the matching cards to this deck.")
+    args = parser.parse_args()
+    catalog = CardCatalog(Path(args.filepath))
+    started = time.perf_counter()
+    catalog.refresh(args.profile)
+    indexed = time.perf_counter()
+    try:
+        bits = catalog.query(args.query)
+    except ValueError as e:
+        PrintHandler.print_exception(f"Error: {e}")
+        raise SystemExit(2)
+    finished = time.perf_counter()
+    count = bin(bits).count("1")
+    PrintHandler.print_notice(
+        f"{count} of {len(catalog)} cards match, indexed in {indexed - started:.3f}s, "
+        f"queried in {(finished - indexed) * 1000:.2f}ms"
+    )
+    if args.out:
+        catalog.write_deck(bits, Path(args.out), args.query)
+        PrintHandler.print_notice(f"Wrote {count} cards to {args.out}")
+    else:
+        for deck, term, definition in catalog.select(bits)[: args.limit]:
+            print(f"\t{deck}: {term}: {definition}")
@@ -2,11 +2,15 @@
 To Do:
 - replace subpath with relative path from inserted filepath
 - set creator
-- metadata for each file (last 5 average, last attempt)
 - audio from google translate
 '''
 
 from helper import *
 
 
-Runner("Swedish/flashcards").start()
+filepath = "Swedish/flashcards"
+Runner(
+    filepath,
+    backend=backend_from_environment(Path(filepath)),
+    metrics=MetricsExporter.from_environment(),
+).start()
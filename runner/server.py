@@ -0,0 +1,343 @@
+'''
+Local study server.
+
+Parses the library once into a shared, read-only DeckCache and serves any number of
+concurrent study sessions over a Unix socket or TCP, speaking newline-delimited JSON.
+Answers and scores go through the same Runner code as studying in the terminal, so they
+are recorded in the review history and progress of the learner's profile.
+
+Usage:
+    python runner/server.py Swedish/flashcards --socket /tmp/flashcards.sock
+    python runner/server.py Swedish/flashcards --port 8765
+'''
+
+import argparse, asyncio, json, time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from helper import *
+
+
+class DeckCache:
+    def __init__(self, filepath: str) -> None:
+        """
+        Parses every deck in a library once, to be shared by all sessions.
+
+        Args:
+            filepath (str): The root directory of the library.
+
+        Attributes:
+            filepath (Path): The root directory of the library.
+            decks (Dict[str, tuple]): Maps each deck key to its cards, as a tuple of (term, definition) tuples.
+        """
+        runner = Runner(filepath)
+        self.filepath: Path = runner.filepath
+        self.decks: Dict[str, tuple] = {
+            runner._deck_key(file.filepath): tuple(
+                tuple(card) for card in file.cards if len(card) >= 2
+            )
+            for file in runner._list_files()
+        }
+
+    def __len__(self) -> int:
+        """
+        Returns the number of decks in the cache.
+
+        Returns:
+            int: The number of decks.
+        """
+        return len(self.decks)
+
+
+class StudySession:
+    def __init__(
+        self,
+        runner: Runner,
+        filename: Path,
+        cards: tuple,
+        flip: bool = True,
+        shuffle: bool = True,
+    ) -> None:
+        """
+        Tracks one learner's study of a deck without blocking on input.
+
+        Passes, answers and scores go through the same `Runner` methods as
+        `Runner._display_cards`: the first pass is scored, wrong answers are asked again in
+        further passes until all are answered correctly, and every answer is recorded in the
+        review history of the library.
+
+        Args:
+            runner (Runner): The runner of the learner's profile.
+            filename (Path): The path of the deck.
+            cards (tuple): The shared, read-only cards of the deck.
+            flip (bool): Whether to show the definition and ask for the term.
+            shuffle (bool): Whether to shuffle every pass.
+
+        Attributes:
+            runner (Runner): The runner of the learner's profile.
+            filename (Path): The path of the deck.
+            term (int): The index of the side shown to the learner.
+            definition (int): The index of the side the learner has to answer.
+            shuffle (bool): Whether to shuffle every pass.
+            state (Dict[str, Any]): The current pass, as built by `Runner._start_pass`.
+            position (int): The position in the current pass.
+            score (Optional[int]): The score of the first pass, once every card is answered correctly.
+            shown (float): When the current card was shown, to time the answer.
+        """
+        self.runner: Runner = runner
+        self.filename: Path = filename
+        self.term: int = 1 if flip else 0
+        self.definition: int = 0 if flip else 1
+        self.shuffle: bool = shuffle
+        self.state: Dict[str, Any] = runner._start_pass(
+            list(cards), 0, filename, shuffle
+        )
+        self.position: int = 0
+        self.score: Optional[int] = None
+        self.shown: float = time.monotonic()
+
+    def done(self) -> bool:
+        """
+        Returns whether every card has been answered correctly.
+
+        Returns:
+            bool: True if the session is over, False otherwise.
+        """
+        return self.score is not None
+
+    def prompt(self) -> str:
+        """
+        Returns the side of the current card shown to the learner.
+
+        Returns:
+            str: The prompt of the current card.
+        """
+        return self.state["cards"][self.position][self.term]
+
+    def answer(self, attempt: str) -> Dict[str, Any]:
+        """
+        Grades and records an answer to the current card and moves on to the next one,
+        saving the score once the last pass is over.
+
+        Args:
+            attempt (str): The learner's answer.
+
+        Returns:
+            Dict[str, Any]: Whether the answer was correct, and the expected answer.
+        """
+        card = self.state["cards"][self.position]
+        expected = card[self.definition]
+        correct = CardHandler.check_answer(attempt, expected)
+        self.runner._record_answer(
+            self.filename, self.state, card, correct, time.monotonic() - self.shown
+        )
+        self.shown = time.monotonic()
+        self.position += 1
+        if self.position == len(self.state["cards"]):
+            next_pass = self.runner._next_pass(self.state, self.shuffle)
+            if next_pass is None:
+                self.score = self.runner._score_deck(self.filename, self.state)
+            else:
+                self.state, self.position = next_pass, 0
+        return {"correct": correct, "answer": expected}
+
+
+class StudyServer:
+    def __init__(self, cache: DeckCache) -> None:
+        """
+        Initializes the server over a shared deck cache.
+
+        Args:
+            cache (DeckCache): The parsed library shared by all sessions.
+
+        Attributes:
+            cache (DeckCache): The parsed library.
+            backend (TextBackend): The storage backend the reviews of every profile are recorded in.
+            runners (Dict[str, Runner]): One runner per connected profile, holding its progress.
+            active (int): The number of connected clients.
+        """
+        self.cache: DeckCache = cache
+        self.backend: TextBackend = backend_from_environment(cache.filepath)
+        self.runners: Dict[str, Runner] = {}
+        self.active: int = 0
+
+    async def handle_client(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """
+        Serves one client connection until it disconnects.
+
+        Args:
+            reader (asyncio.StreamReader): The stream to read requests from.
+            writer (asyncio.StreamWriter): The stream to write replies to.
+        """
+        self.active += 1
+        state: Dict[str, Any] = {
+            "profile": "anonymous",
+            "deck": None,
+            "session": None,
+        }
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("expected a JSON object")
+                    reply = await self.handle_request(request, state)
+                except (ValueError, KeyError) as e:
+                    reply = {"error": f"Bad request: {e}"}
+                except Exception as e:
+                    PrintHandler.print_exception(f"Error handling a request: {e!r}")
+                    reply = {"error": f"Server error: {e}"}
+                writer.write(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self.active -= 1
+            writer.close()
+
+    async def handle_request(
+        self, request: Dict[str, Any], state: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """
+        Handles one request of a client.
+
+        Args:
+            request (Dict[str, Any]): The request, with an "op" of hello, list, study or answer.
+            state (Dict[str, Any]): The state of the client's connection.
+
+        Returns:
+            Dict[str, Any]: The reply to send back.
+
+        Raises:
+            KeyError: If a required field is missing.
+            ValueError: If the operation is unknown.
+        """
+        op = request["op"]
+        if op == "hello":
+            profile = str(request["profile"])
+            if not profile or Path(profile).name != profile or profile.startswith("."):
+                return {"error": f"Invalid profile name: {profile}"}
+            state["profile"] = profile
+            return {"ok": True, "decks": len(self.cache)}
+        if op == "list":
+            return {"decks": sorted(self.cache.decks)}
+        if op == "study":
+            deck = request["deck"]
+            if deck not in self.cache.decks:
+                return {"error": f"Unknown deck: {deck}"}
+            if not self.cache.decks[deck]:
+                return {"error": f"Deck has no cards: {deck}"}
+            state["deck"] = deck
+            SESSIONS.labels("server").inc()
+            state["session"] = StudySession(
+                self._runner(state["profile"]),
+                self.cache.filepath / deck,
+                self.cache.decks[deck],
+                request.get("flip", True),
+                request.get("shuffle", True),
+            )
+            return self._next(state)
+        if op == "answer":
+            session: Optional[StudySession] = state["session"]
+            if session is None or session.done():
+                return {"error": "No card is being studied."}
+            reply = await asyncio.to_thread(session.answer, str(request["text"]))
+            reply.update(self._next(state))
+            return reply
+        raise ValueError(f"unknown op {op}")
+
+    def _next(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Describes what the client should show next.
+
+        Args:
+            state (Dict[str, Any]): The state of the client's connection.
+
+        Returns:
+            Dict[str, Any]: The next prompt, or the score if the session is over.
+        """
+        session: StudySession = state["session"]
+        if session.done():
+            return {"done": True, "score": session.score}
+        return {
+            "done": False,
+            "prompt": session.prompt(),
+            "attempt_number": session.state["attempt"],
+            "remaining": len(session.state["cards"]) - session.position,
+        }
+
+    def _runner(self, profile: str) -> Runner:
+        """
+        Returns the runner of a profile, creating it on first use.
+
+        Args:
+            profile (str): The name of the learner profile.
+
+        Returns:
+            Runner: The profile's runner, sharing the server's backend.
+        """
+        if profile not in self.runners:
+            self.runners[profile] = Runner(
+                self.cache.filepath, profile=profile, backend=self.backend
+            )
+        return self.runners[profile]
+
+    async def serve(self, socket_path: Optional[str], host: str, port: int) -> None:
+        """
+        Listens for clients until cancelled.
+
+        Args:
+            socket_path (Optional[str]): The Unix socket to listen on. If None, TCP is used.
+            host (str): The host to listen on over TCP.
+            port (int): The port to listen on over TCP.
+        """
+        if socket_path is not None:
+            server = await asyncio.start_unix_server(
+                self.handle_client, socket_path, backlog=1024
+            )
+            where = socket_path
+        else:
+            server = await asyncio.start_server(
+                self.handle_client, host, port, backlog=1024
+            )
+            where = f"{host}:{port}"
+        PrintHandler.print_notice(f"Serving {len(self.cache)} decks on {where}")
+        async with server:
+            await server.serve_forever()
+
+
+def parse_address_args(parser: argparse.ArgumentParser) -> None:
+    """
+    Adds the arguments for where the server listens.
+
+    Args:
+        parser (argparse.ArgumentParser): The parser to add the arguments to.
+    """
+    parser.add_argument("--socket", help="Unix socket path to use instead of TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve study sessions from one shared deck cache."
+    )
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parse_address_args(parser)
+    parse_metrics_args(parser)
+    args = parser.parse_args()
+    MetricsExporter(
+        textfile=args.metrics_file,
+        port=args.metrics_port,
+        interval=args.metrics_interval,
+    ).start()
+    server = StudyServer(DeckCache(args.filepath))
+    try:
+        asyncio.run(server.serve(args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        PrintHandler.print_notice("Exiting...")
@@ -0,0 +1,292 @@
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+
+class EditDistance:
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalizes a string for comparison, ignoring case and surrounding whitespace.
+
+        Args:
+            text (str): The string to normalize.
+
+        Returns:
+            str: The normalized string.
+        """
+        return " ".join(text.lower().split())
+
+    @staticmethod
+    def levenshtein(a: str, b: str, bound: Optional[int] = None) -> int:
+        """
+        Calculates the Levenshtein distance between two strings.
+
+        Args:
+            a (str): The first string.
+            b (str): The second string.
+            bound (Optional[int]): If given, only the cells within this many edits of the
+                diagonal are calculated, and it stops early once the distance is known to exceed it.
+
+        Returns:
+            int: The edit distance, or bound + 1 if the distance exceeds the bound.
+        """
+        if len(a) < len(b):
+            a, b = b, a
+        if bound is None:
+            bound = len(a)
+        if len(a) - len(b) > bound:
+            return bound + 1
+        beyond = bound + 1
+        previous = list(range(len(b) + 1))
+        for i, char_a in enumerate(a, 1):
+            low, high = max(1, i - bound), min(len(b), i + bound)
+            current = [beyond] * (len(b) + 1)
+            if low == 1:
+                current[0] = i
+            for j in range(low, high + 1):
+                current[j] = min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != b[j - 1]),
+                )
+            if min(current[low - 1 : high + 1]) > bound:
+                return beyond
+            previous = current
+        return min(previous[-1], beyond)
+
+
+class NGramIndex:
+    N = 3  # the length of the n-grams
+    LIMIT = 12  # the most candidates whose edit distance is calculated per search
+    RADIUS = 4  # the largest edit distance a neighbour may have
+    COMMON = 512  # n-grams shared by more words of one length than this are skipped
+
+    def __init__(self) -> None:
+        """
+        Initializes an empty index of words by their n-grams, banded by word length.
+
+        Attributes:
+            words (List[str]): The indexed words, by id.
+            ids (Dict[str, int]): The id of each word.
+            groups (Dict[str, int]): The bit of each group of decks words were added under.
+            members (List[int]): The bits of the groups each word was added under, by id.
+            postings (Dict[int, Dict[str, List[int]]]): The ids of the words containing each
+                n-gram, by word length.
+        """
+        self.words: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.groups: Dict[str, int] = {}
+        self.members: List[int] = []
+        self.postings: Dict[int, Dict[str, List[int]]] = {}
+
+    def __len__(self) -> int:
+        """
+        Returns the number of distinct words in the index.
+
+        Returns:
+            int: The number of words.
+        """
+        return len(self.words)
+
+    @classmethod
+    def grams(cls, word: str) -> Set[str]:
+        """
+        Splits a word into its n-grams, padded so the start and end of the word count.
+
+        Args:
+            word (str): The word.
+
+        Returns:
+            Set[str]: The n-grams.
+        """
+        padded = f" {word} "
+        return {padded[i : i + cls.N] for i in range(max(1, len(padded) - cls.N + 1))}
+
+    def add(self, word: str, group: str = "") -> None:
+        """
+        Inserts a word into the index. A duplicate word is only added to the group.
+
+        Args:
+            word (str): The word to insert.
+            group (str): The group of decks the word comes from.
+        """
+        i = self.ids.get(word)
+        if i is None:
+            i = self.ids[word] = len(self.words)
+            self.words.append(word)
+            self.members.append(0)
+            bucket = self.postings.setdefault(len(word), {})
+            for gram in self.grams(word):
+                ids = bucket.get(gram)
+                if ids is None:
+                    bucket[gram] = [i]
+                else:
+                    ids.append(i)
+        bit = self.groups.setdefault(group, 1 << len(self.groups))
+        self.members[i] |= bit
+
+    def nearest(
+        self, word: str, band: int, exclude: Set[str], group: str = ""
+    ) -> List[Tuple[bool, int, str]]:
+        """
+        Finds the words within `RADIUS` edits of a word, among the `LIMIT` words of a similar
+        length sharing the most n-grams with it. Words of the given group are candidates
+        before any other word, so the limit is spent on them first. N-grams common to more
+        than `COMMON` words of a length, such as those of articles, say little about a word
+        and are skipped.
+
+        Args:
+            word (str): The word to search around.
+            band (int): How much longer or shorter than the word candidates may be.
+            exclude (Set[str]): Words that must not be returned.
+            group (str): The group whose words are preferred.
+
+        Returns:
+            List[Tuple[bool, int, str]]: (outside the group, distance, word) triples, the words
+                of the group first and then by distance.
+        """
+        grams = self.grams(word)
+        bit = self.groups.get(group, 0)
+        counts: Counter = Counter()
+        for length in range(max(1, len(word) - band), len(word) + band + 1):
+            bucket = self.postings.get(length)
+            if not bucket:
+                continue
+            for gram in grams:
+                ids = bucket.get(gram)
+                if ids and len(ids) <= self.COMMON:
+                    counts.update(ids)
+        inside, outside = [], []
+        for i, shared in counts.most_common(4 * self.LIMIT + len(exclude)):
+            if shared < 2 or len(inside) == self.LIMIT:
+                break
+            if self.words[i] not in exclude:
+                (inside if self.members[i] & bit else outside).append(i)
+        found = []
+        for i in inside + outside[: self.LIMIT - len(inside)]:
+            candidate = self.words[i]
+            distance = EditDistance.levenshtein(word, candidate, self.RADIUS)
+            if distance <= self.RADIUS:
+                found.append((not self.members[i] & bit, distance, candidate))
+        return sorted(found)
+
+    def similar_length(self, word: str, k: int, exclude: Set[str]) -> List[str]:
+        """
+        Picks words whose length is closest to a word's, for when it has no near neighbours.
+
+        Args:
+            word (str): The word.
+            k (int): The number of words to return.
+            exclude (Set[str]): Words that must not be returned.
+
+        Returns:
+            List[str]: Up to k words.
+        """
+        picked: List[str] = []
+        for length in sorted(self.postings, key=lambda length: abs(length - len(word))):
+            for ids in self.postings[length].values():
+                for i in ids:
+                    if len(picked) == k:
+                        return picked
+                    if self.words[i] not in exclude and self.words[i] not in picked:
+                        picked.append(self.words[i])
+        return picked
+
+
+class DistractorIndex:
+    BAND = (
+        2  # how much longer or shorter than the answer neighbours are looked for first
+    )
+    WIDE_BAND = 6  # how much when there are too few of those
+
+    def __init__(self, decks: Iterable[Tuple[str, List[List[str]]]]) -> None:
+        """
+        Builds an n-gram index of the answers on each card side, remembering the groups of
+        decks each answer comes from.
+
+        Args:
+            decks (Iterable[Tuple[str, List[List[str]]]]): (group, cards) pairs, where group is
+                the folder the deck belongs to, e.g. "Duolingo".
+
+        Attributes:
+            catalog (List[NGramIndex]): An index of normalized answers for each card side.
+            originals (List[Dict[str, str]]): Maps each normalized answer back to its original text.
+            precomputed (Dict[Tuple[str, int, int, str], List[str]]): Distractors already looked up.
+        """
+        self.catalog: List[NGramIndex] = [NGramIndex(), NGramIndex()]
+        self.originals: List[Dict[str, str]] = [{}, {}]
+        self.precomputed: Dict[Tuple[str, int, int, str], List[str]] = {}
+        for group, cards in decks:
+            for card in cards:
+                if len(card) < 2:
+                    continue
+                for side in (0, 1):
+                    key = EditDistance.normalize(card[side])
+                    if not key:
+                        continue
+                    self.originals[side].setdefault(key, card[side])
+                    self.catalog[side].add(key, group)
+
+    def distractors(
+        self, answer: str, side: int, k: int = 3, group: str = ""
+    ) -> List[str]:
+        """
+        Returns plausible wrong answers for a card.
+
+        Neighbours are looked for among the answers of the card's own group of decks first,
+        then in the whole catalog, then among answers of a wider range of lengths, and are
+        ranked by edit distance and then by shared words. Answers of a similar length fill
+        any places left. Results are kept, so every card only searches once per catalog.
+
+        Args:
+            answer (str): The correct answer of the card.
+            side (int): Which side of the card the answer is on, 0 or 1.
+            k (int): The number of distractors to return.
+            group (str): The group the card belongs to.
+
+        Returns:
+            List[str]: Up to k distractors, in their original spelling.
+        """
+        key = EditDistance.normalize(answer)
+        cached = self.precomputed.get((key, side, k, group))
+        if cached is not None:
+            return cached
+        index = self.catalog[side]
+        tokens = set(key.split())
+        picked: List[str] = []
+        exclude = {key}
+        for band in (self.BAND, self.WIDE_BAND):
+            if len(picked) >= k:
+                break
+            found = index.nearest(key, band, exclude, group)
+            found.sort(
+                key=lambda found: (
+                    found[0],
+                    found[1],
+                    -len(tokens.intersection(found[2].split())),
+                )
+            )
+            for _, _, word in found[: k - len(picked)]:
+                picked.append(word)
+                exclude.add(word)
+        if len(picked) < k:
+            picked += index.similar_length(key, k - len(picked), exclude)
+        picked = [self.originals[side][word] for word in picked]
+        self.precomputed[(key, side, k, group)] = picked
+        return picked
+
+    def precompute(
+        self, cards: List[List[str]], side: int, k: int = 3, group: str = ""
+    ) -> None:
+        """
+        Looks up the distractors of every card in a deck ahead of time.
+
+        Args:
+            cards (List[List[str]]): The cards of the deck.
+            side (int): Which side of the cards the answers are on, 0 or 1.
+            k (int): The number of distractors per card.
+            group (str): The group the deck belongs to.
+        """
+        for card in cards:
+            if len(card) > side:
+                self.distractors(card[side], side, k, group)
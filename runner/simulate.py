@@ -0,0 +1,425 @@
+'''
+Offline learner simulator for comparing study policies.
+
+Simulated learners study the real decks of a library for a number of days, one session a
+day, and are tested some days after the last session. Each learner remembers each card
+along an exponential forgetting curve, p = exp(-elapsed / stability). A correct answer
+grows the stability by more the more the card had been forgotten, so repeating a card
+that was just seen does little; a wrong answer, after which the card is retyped, resets
+it. Every learner of every deck is simulated at once, as rows of NumPy arrays with one
+column per card.
+
+Policies:
+    shuffle-retry   shuffle the deck, then repeat the cards answered wrong in further
+                    shuffled passes until every card is answered right (how decks are studied now)
+    reinsert        put a card answered wrong back a few cards later in the same pass
+    spaced          only study the cards due to fall below 90% recall, and a few new ones
+                    a day, reinserting cards answered wrong
+
+Usage:
+    python runner/simulate.py Swedish/flashcards
+    python runner/simulate.py Swedish/flashcards --learners 2000 --days 60 --policy spaced
+'''
+
+import argparse, time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from helper import *
+
+POLICIES = ("shuffle-retry", "reinsert", "spaced")
+
+
+class LearnerModel:
+    FIRST_STABILITY = 1.0  # days to 37% recall after first being shown the answer
+    GROWTH = 5.0  # how much a correct answer grows the stability of an average card
+    MASSED = 0.1  # how much a correct answer grows it when the card was just seen
+    LAPSE = 0.4  # the share of the stability kept after a wrong answer
+    ANSWER_SECONDS = 3.0  # time to read the prompt and type an answer
+    SECONDS_PER_CHARACTER = 0.15  # time to type each character of the answer
+    RETYPE_SECONDS = 4.0  # extra time to read the correct answer and retype it
+    PASS_SECONDS = 2.0  # the pause before each pass of wrong answers
+
+    def __init__(self, ability_spread: float = 0.3, card_spread: float = 0.3) -> None:
+        """
+        Initializes the model of how learners remember cards.
+
+        Args:
+            ability_spread (float): The standard deviation of how much harder or easier cards
+                are for one learner than for the average learner.
+            card_spread (float): The standard deviation of how hard cards are beyond what their
+                answer's length predicts.
+        """
+        self.ability_spread = ability_spread
+        self.card_spread = card_spread
+
+    def difficulty(
+        self, lengths: np.ndarray, words: np.ndarray, rng: np.random.Generator
+    ) -> np.ndarray:
+        """
+        Rates how hard each card is to remember. Longer answers and phrases are harder.
+
+        Args:
+            lengths (np.ndarray): The number of characters of each answer.
+            words (np.ndarray): The number of words of each answer.
+            rng (np.random.Generator): The random numbers.
+
+        Returns:
+            np.ndarray: The difficulty of each card, around 0 to 2.
+        """
+        return (
+            0.3 * np.log1p(lengths / 8)
+            + 0.25 * np.maximum(words - 1, 0)
+            + rng.normal(0, self.card_spread, lengths.shape)
+        )
+
+    def recall(self, stability: np.ndarray, elapsed: np.ndarray) -> np.ndarray:
+        """
+        Returns the chance of recalling cards. Cards never seen cannot be recalled.
+
+        Args:
+            stability (np.ndarray): The stability of each card in days, 0 if never seen.
+            elapsed (np.ndarray): The days since each card was last seen.
+
+        Returns:
+            np.ndarray: The chance of a correct answer.
+        """
+        seen = stability > 0
+        return np.where(seen, np.exp(-elapsed / np.where(seen, stability, 1)), 0.0)
+
+    def update(
+        self,
+        stability: np.ndarray,
+        difficulty: np.ndarray,
+        recalled: np.ndarray,
+        correct: np.ndarray,
+    ) -> np.ndarray:
+        """
+        Returns the stability of cards after answering them.
+
+        Args:
+            stability (np.ndarray): The stability before answering, 0 if never seen.
+            difficulty (np.ndarray): The difficulty of each card.
+            recalled (np.ndarray): The chance the card had of being recalled.
+            correct (np.ndarray): Whether each answer was correct.
+
+        Returns:
+            np.ndarray: The new stability in days.
+        """
+        grown = stability * (
+            1 + self.MASSED + self.GROWTH * np.exp(-difficulty) * np.sqrt(1 - recalled)
+        )
+        first = self.FIRST_STABILITY * np.exp(-difficulty / 2)
+        lapsed = np.maximum(first, stability * self.LAPSE)
+        return np.where(correct, grown, lapsed)
+
+    def seconds(self, lengths: np.ndarray, correct: np.ndarray) -> np.ndarray:
+        """
+        Returns the time taken to answer cards.
+
+        Args:
+            lengths (np.ndarray): The number of characters of each answer.
+            correct (np.ndarray): Whether each answer was correct.
+
+        Returns:
+            np.ndarray: The seconds taken, including retyping wrong answers.
+        """
+        typing = self.ANSWER_SECONDS + self.SECONDS_PER_CHARACTER * lengths
+        return np.where(correct, typing, 2 * typing + self.RETYPE_SECONDS)
+
+
+class Simulation:
+    def __init__(
+        self,
+        decks: List[List[List[str]]],
+        learners: int,
+        model: Optional[LearnerModel] = None,
+        flip: bool = True,
+        seed: int = 0,
+    ) -> None:
+        """
+        Lays out every learner of every deck as a row of arrays with one column per card,
+        padding shorter decks.
+
+        Args:
+            decks (List[List[List[str]]]): The cards of each deck.
+            learners (int): The number of learners studying each deck.
+            model (Optional[LearnerModel]): How learners remember. Defaults to LearnerModel().
+            flip (bool): Whether the term is the answer, as in the "Flip term and definition" setting.
+            seed (int): The seed of the random numbers, so runs can be compared.
+
+        Attributes:
+            valid (np.ndarray): Which columns of each row are cards rather than padding.
+            lengths (np.ndarray): The number of characters of each answer.
+            difficulty (np.ndarray): How hard each card is for each learner.
+        """
+        self.model: LearnerModel = model or LearnerModel()
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        answer = 0 if flip else 1
+        decks = [[card for card in cards if len(card) >= 2] for cards in decks if cards]
+        width = max((len(cards) for cards in decks), default=0)
+        lengths = np.zeros((len(decks), width))
+        words = np.zeros((len(decks), width))
+        valid = np.zeros((len(decks), width), bool)
+        for row, cards in enumerate(decks):
+            lengths[row, : len(cards)] = [len(card[answer]) for card in cards]
+            words[row, : len(cards)] = [len(card[answer].split()) for card in cards]
+            valid[row, : len(cards)] = True
+        difficulty = self.model.difficulty(lengths, words, rng)
+        self.valid: np.ndarray = np.repeat(valid, learners, axis=0)
+        self.lengths: np.ndarray = np.repeat(lengths, learners, axis=0)
+        self.difficulty: np.ndarray = np.repeat(
+            difficulty, learners, axis=0
+        ) + rng.normal(0, self.model.ability_spread, (len(self.valid), 1))
+
+    def run(
+        self,
+        policy: str,
+        days: int = 30,
+        test_delay: float = 7,
+        new_per_day: int = 10,
+        retention: float = 0.9,
+        max_attempts: int = 10,
+    ) -> Dict[str, float]:
+        """
+        Simulates a policy.
+
+        Args:
+            policy (str): One of POLICIES.
+            days (int): The number of days with a session.
+            test_delay (float): The days between the last session and the test.
+            new_per_day (int): The most new cards a spaced session introduces.
+            retention (float): The chance of recall at which a spaced card is due.
+            max_attempts (int): The most times a card is asked in one session.
+
+        Returns:
+            Dict[str, float]: The "reviews", the study "minutes" per learner, the share of
+                cards recalled at the test as "retention", and "retained_per_minute", the cards
+                recalled at the test per minute of study. All are 0 without any cards.
+
+        Raises:
+            ValueError: If the policy is unknown.
+        """
+        if policy not in POLICIES:
+            raise ValueError(
+                f"Unknown policy {policy}. Use one of {', '.join(POLICIES)}."
+            )
+        rng = np.random.default_rng(self.seed + 1)
+        rows, width = self.valid.shape
+        stability = np.zeros((rows, width))
+        last = np.zeros((rows, width))
+        seconds = np.zeros(rows)
+        reviews = 0
+        for day in range(days):
+            now = np.full(rows, float(day))
+            if policy == "spaced":
+                seen = stability > 0
+                due = seen & (now[:, None] - last >= -stability * np.log(retention))
+                unseen = self.valid & ~seen
+                new = unseen & (np.cumsum(unseen, axis=1) <= new_per_day)
+                studied = self.valid & (due | new)
+            else:
+                studied = self.valid
+            attempts = np.zeros((rows, width), np.int32)
+
+            def answer(row: np.ndarray, column: np.ndarray) -> np.ndarray:
+                elapsed = now[row] - last[row, column]
+                recalled = self.model.recall(stability[row, column], elapsed)
+                correct = rng.random(len(row)) < recalled
+                stability[row, column] = self.model.update(
+                    stability[row, column],
+                    self.difficulty[row, column],
+                    recalled,
+                    correct,
+                )
+                spent = self.model.seconds(self.lengths[row, column], correct)
+                seconds[row] += spent
+                now[row] += spent / 86400
+                last[row, column] = now[row]
+                attempts[row, column] += 1
+                return correct | (attempts[row, column] >= max_attempts)
+
+            if policy == "shuffle-retry":
+                reviews += self._retry_session(studied, answer, seconds, rng)
+            else:
+                reviews += self._reinsert_session(studied, answer, rng)
+        elapsed = days - 1 + test_delay - last
+        recalled = np.where(
+            self.valid, self.model.recall(stability, np.maximum(elapsed, 0)), 0.0
+        )
+        minutes = seconds / 60
+        retained = recalled.sum(axis=1)
+        return {
+            "reviews": reviews,
+            "minutes": float(minutes.mean()) if rows else 0.0,
+            "retention": float(retained.sum() / max(self.valid.sum(), 1)),
+            "retained_per_minute": float(retained.sum() / max(minutes.sum(), 1e-9)),
+        }
+
+    @staticmethod
+    def _shuffled(cards: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+        """
+        Shuffles the cards of every row.
+
+        Args:
+            cards (np.ndarray): Which columns of each row to shuffle.
+            rng (np.random.Generator): The random numbers.
+
+        Returns:
+            np.ndarray: The columns of each row in a random order, the chosen ones first.
+        """
+        return np.argsort(np.where(cards, rng.random(cards.shape), np.inf), axis=1)
+
+    def _retry_session(
+        self,
+        studied: np.ndarray,
+        answer: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        seconds: np.ndarray,
+        rng: np.random.Generator,
+    ) -> int:
+        """
+        Studies one session of the shuffle-retry policy. A pass is shuffled up front, so each
+        step answers the next card of every row still in the pass at once.
+
+        Args:
+            studied (np.ndarray): The cards studied in the session.
+            answer (Callable[[np.ndarray, np.ndarray], np.ndarray]): Answers a card of each of
+                the given rows, returning which ones are done for the session.
+            seconds (np.ndarray): The study time of each row, to add the pauses between passes to.
+            rng (np.random.Generator): The random numbers.
+
+        Returns:
+            int: The number of reviews.
+        """
+        reviews = 0
+        cards = studied
+        first = True
+        while True:
+            count = cards.sum(axis=1)
+            if not count.any():
+                return reviews
+            if not first:
+                seconds += (count > 0) * self.model.PASS_SECONDS
+            first = False
+            order = self._shuffled(cards, rng)
+            cards = np.zeros_like(cards)
+            for step in range(int(count.max())):
+                row = np.flatnonzero(count > step)
+                column = order[row, step]
+                done = answer(row, column)
+                cards[row[~done], column[~done]] = True
+                reviews += len(row)
+
+    def _reinsert_session(
+        self,
+        studied: np.ndarray,
+        answer: Callable[[np.ndarray, np.ndarray], np.ndarray],
+        rng: np.random.Generator,
+        gap: int = 3,
+    ) -> int:
+        """
+        Studies one session in which cards answered wrong come back a few cards later. Each row
+        walks its shuffled cards, and keeps the cards waiting to come back in a few slots, so
+        a step only looks at the next card and those slots.
+
+        Args:
+            studied (np.ndarray): The cards studied in the session.
+            answer (Callable[[np.ndarray, np.ndarray], np.ndarray]): Answers a card of each of
+                the given rows, returning which ones are done for the session.
+            rng (np.random.Generator): The random numbers.
+            gap (int): The number of cards asked before a card answered wrong comes back.
+
+        Returns:
+            int: The number of reviews.
+        """
+        rows, width = studied.shape
+        everyone = np.arange(rows)
+        order = self._shuffled(studied, rng)
+        count = studied.sum(axis=1)
+        position = np.zeros(rows, np.int64)
+        waiting = np.full(
+            (rows, 1), np.inf
+        )  # the position each waiting card comes back at
+        cards = np.zeros((rows, 1), np.int64)
+        reviews = 0
+        while True:
+            upcoming = np.where(position < count, position, np.inf)
+            slot = waiting.argmin(axis=1)
+            back = waiting[everyone, slot] < upcoming
+            key = np.where(back, waiting[everyone, slot], upcoming)
+            active = np.isfinite(key)
+            if not active.any():
+                return reviews
+            row, slot, back, key = (
+                everyone[active],
+                slot[active],
+                back[active],
+                key[active],
+            )
+            column = np.where(
+                back,
+                cards[row, slot],
+                order[row, np.minimum(position[row], width - 1)],
+            )
+            waiting[row[back], slot[back]] = np.inf
+            position[row[~back]] += 1
+            done = answer(row, column)
+            reviews += len(row)
+            row, column, key = row[~done], column[~done], key[~done]
+            if len(row) == 0:
+                continue
+            free = np.isinf(waiting[row])
+            if not free.any(axis=1).all():
+                waiting = np.hstack([waiting, np.full((rows, 1), np.inf)])
+                cards = np.hstack([cards, np.zeros((rows, 1), np.int64)])
+                free = np.isinf(waiting[row])
+            slot = free.argmax(axis=1)
+            waiting[row, slot] = key + gap + 0.5
+            cards[row, slot] = column
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare study policies on simulated learners."
+    )
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument("--learners", type=int, default=500, help="Learners per deck.")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument(
+        "--test-delay",
+        type=float,
+        default=7,
+        help="Days from the last session to the test.",
+    )
+    parser.add_argument("--new-per-day", type=int, default=10)
+    parser.add_argument("--policy", choices=POLICIES, action="append")
+    parser.add_argument(
+        "--no-flip",
+        dest="flip",
+        action="store_false",
+        help="Show terms and ask for definitions.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    decks = [File(path).cards for path in TextBackend().list_files(Path(args.filepath))]
+    simulation = Simulation(decks, args.learners, flip=args.flip, seed=args.seed)
+    if not simulation.valid.any():
+        PrintHandler.print_exception(f"No cards found in {args.filepath}.")
+        raise SystemExit(1)
+    PrintHandler.print_notice(
+        f"{len(decks)} decks, {int(simulation.valid.sum())} learner-cards, "
+        f"{args.days} days, tested {args.test_delay:g} days later"
+    )
+    for policy in args.policy or POLICIES:
+        started = time.perf_counter()
+        result = simulation.run(policy, args.days, args.test_delay, args.new_per_day)
+        elapsed = time.perf_counter() - started
+        print(
+            f"\t{policy}: {result['retention'] * 100:.1f}% retained, "
+            f"{result['minutes']:.0f} min per learner, "
+            f"{result['retained_per_minute']:.2f} cards retained per minute "
+            f"({result['reviews']:,} reviews in {elapsed:.1f}s)"
+        )
@@ -0,0 +1,645 @@
+'''
+Storage backends for decks and review history.
+
+TextBackend reads the `term: definition` text files directly. SQLiteBackend mirrors them
+into indexed tables for decks, cards and tags, and keeps the two in sync in both
+directions, so listing decks and building sessions are indexed queries instead of
+directory walks. Both record the review history of a library in the reviews table of
+`.progress/library.db`, which analytics and queries read.
+
+Tags are read from comment lines of the form `# tags: food, travel`, which apply to the
+cards below them until the next tags line. The SQLite mirror keeps every comment line
+with the card below it, so exporting a deck writes its comments back; only blank lines
+are lost.
+
+The study runner uses the backend named by FLASHCARDS_BACKEND, "text" by default or
+"sqlite".
+
+Usage:
+    FLASHCARDS_BACKEND=sqlite python runner/runner.py
+    python runner/storage.py Swedish/flashcards sync
+    python runner/storage.py Swedish/flashcards missed --days 7 --profile alice
+'''
+
+import argparse, getpass, os, sqlite3, threading, time
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from handlers import *
+
+
+class TextBackend:
+    REVIEWS_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY,
+            deck TEXT NOT NULL,
+            term TEXT NOT NULL,
+            profile TEXT NOT NULL,
+            ts REAL NOT NULL,
+            correct INTEGER NOT NULL,
+            latency REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS reviews_card ON reviews(deck, term);
+        CREATE INDEX IF NOT EXISTS reviews_profile_ts ON reviews(profile, ts);
+    """
+
+    def __init__(
+        self, root: Optional[Path] = None, db_path: Optional[Path] = None
+    ) -> None:
+        """
+        Initializes a backend reading the text files of a library.
+
+        Args:
+            root (Optional[Path]): The root directory of the library. Without it no reviews are recorded.
+            db_path (Optional[Path]): The database of the review history. Defaults to `.progress/library.db` in the library.
+
+        Attributes:
+            root (Optional[Path]): The root directory of the library.
+            db_path (Optional[Path]): The database of the review history, if reviews are recorded.
+            local (threading.local): Holds one connection per thread.
+        """
+        self.root: Optional[Path] = Path(root).resolve() if root is not None else None
+        self.db_path: Optional[Path] = None
+        if db_path is not None or self.root is not None:
+            self.db_path = Path(db_path or self.root / ".progress" / "library.db")
+        self.local = threading.local()
+
+    def connection(self) -> sqlite3.Connection:
+        """
+        Returns this thread's connection to the database, opening it on first use.
+
+        Returns:
+            sqlite3.Connection: The connection.
+        """
+        db = getattr(self.local, "db", None)
+        if db is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            db = sqlite3.connect(self.db_path, timeout=30)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA foreign_keys=ON")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.executescript(self.REVIEWS_SCHEMA)
+            self.local.db = db
+        return db
+
+    def list_files(self, root: Path) -> List[Path]:
+        """
+        Recursively lists the decks under a directory, skipping hidden paths.
+
+        Args:
+            root (Path): The root directory of the library.
+
+        Returns:
+            List[Path]: The paths of the decks, sorted.
+        """
+        files = []
+        for file in Path(root).rglob("*"):
+            hidden = any(part.startswith(".") for part in file.relative_to(root).parts)
+            if file.is_file() and not hidden:
+                files.append(file)
+        return sorted(files)
+
+    def read_content(self, file: Any) -> Optional[str]:
+        """
+        Reads the card lines of a deck.
+
+        Args:
+            file (File): The deck to read.
+
+        Returns:
+            Optional[str]: The card lines, or None if the deck could not be read.
+        """
+        return file._open_file(file.filepath)
+
+    def record_review(
+        self,
+        deck: str,
+        card: List[str],
+        correct: bool,
+        latency: float,
+        profile: str,
+    ) -> None:
+        """
+        Records an answer in the review history, if the backend has a database.
+
+        Args:
+            deck (str): The deck's path relative to the library.
+            card (List[str]): The card that was answered.
+            correct (bool): Whether the answer was correct.
+            latency (float): The time taken to answer, in seconds.
+            profile (str): The learner profile that answered.
+        """
+        if self.db_path is None:
+            return
+        db = self.connection()
+        with db:
+            db.execute(
+                "INSERT INTO reviews (deck, term, profile, ts, correct, latency) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (deck, card[0], profile, time.time(), int(correct), latency),
+            )
+
+    @staticmethod
+    def iter_cards(lines: Iterable[str]) -> Iterator[Tuple[str, str, List[str]]]:
+        """
+        Streams the cards of a text deck with their tags.
+
+        Args:
+            lines (Iterable[str]): The raw lines of the deck.
+
+        Returns:
+            Iterator[Tuple[str, str, List[str]]]: (term, definition, tags) triples.
+        """
+        tags: List[str] = []
+        for line in lines:
+            stripped = line.strip()
+            if stripped == "":
+                continue
+            if stripped.startswith("#"):
+                tags = TextBackend.parse_tags(stripped, tags)
+                continue
+            pair = line.rstrip("\n").split(": ")
+            yield pair[0], ": ".join(pair[1:]), tags
+
+    @staticmethod
+    def parse_tags(comment: str, tags: List[str]) -> List[str]:
+        """
+        Reads the tags a comment line sets.
+
+        Args:
+            comment (str): The comment line.
+            tags (List[str]): The tags in effect before the line.
+
+        Returns:
+            List[str]: The tags in effect after the line.
+        """
+        comment = comment.strip().lstrip("#").strip()
+        if comment.lower().startswith("tags:"):
+            return [t.strip() for t in comment[5:].split(",") if t.strip()]
+        return tags
+
+
+class SQLiteBackend(TextBackend):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS decks (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            folder TEXT NOT NULL,
+            mtime INTEGER NOT NULL,
+            header TEXT NOT NULL DEFAULT '',
+            footer TEXT NOT NULL DEFAULT '',
+            dirty INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS cards (
+            id INTEGER PRIMARY KEY,
+            deck_id INTEGER NOT NULL REFERENCES decks(id) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            definition TEXT NOT NULL,
+            comments TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS cards_deck ON cards(deck_id, position);
+        CREATE INDEX IF NOT EXISTS cards_term ON cards(term);
+        CREATE TABLE IF NOT EXISTS tags (
+            card_id INTEGER NOT NULL REFERENCES cards(id) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (card_id, tag)
+        );
+        CREATE INDEX IF NOT EXISTS tags_tag ON tags(tag);
+    """
+
+    def __init__(
+        self, root: Path, db_path: Optional[Path] = None, sync_interval: float = 60.0
+    ) -> None:
+        """
+        Opens, or creates, the SQLite mirror of a library.
+
+        Args:
+            root (Path): The root directory of the library.
+            db_path (Optional[Path]): The database file. Defaults to `.progress/library.db` in the library.
+            sync_interval (float): The minimum number of seconds between syncs with the disk when listing decks.
+
+        Attributes:
+            root (Path): The root directory of the library.
+            db_path (Path): The database file.
+            sync_interval (float): The minimum number of seconds between syncs when listing decks.
+            last_sync (Optional[float]): When the database was last synced with the disk.
+            local (threading.local): Holds one connection per thread.
+        """
+        super().__init__(root, db_path)
+        self.sync_interval: float = sync_interval
+        self.last_sync: Optional[float] = None
+        with self.connection() as db:
+            db.executescript(self.SCHEMA)
+            self._migrate(db)
+
+    def _migrate(self, db: sqlite3.Connection) -> None:
+        """
+        Adds the comment columns to a database created before they existed, and has its
+        decks imported again on the next sync to fill them.
+
+        Args:
+            db (sqlite3.Connection): The connection.
+        """
+        added = False
+        for table, column in (("decks", "footer"), ("cards", "comments")):
+            columns = [row[1] for row in db.execute(f"PRAGMA table_info({table})")]
+            if column not in columns:
+                db.execute(
+                    f"ALTER TABLE {table} ADD COLUMN {column} TEXT NOT NULL DEFAULT ''"
+                )
+                added = True
+        if added:
+            db.execute("UPDATE decks SET mtime = 0 WHERE dirty = 0")
+
+    def _key(self, path: Path) -> str:
+        """
+        Returns the key a deck is stored under.
+
+        Args:
+            path (Path): The path of the deck.
+
+        Returns:
+            str: The deck's path relative to the library, with forward slashes.
+        """
+        return Path(path).resolve().relative_to(self.root).as_posix()
+
+    def _walk(self) -> Dict[str, int]:
+        """
+        Finds the text decks on disk and their modification times.
+
+        Returns:
+            Dict[str, int]: Maps each deck key to its modification time in nanoseconds.
+        """
+        found = {}
+        for directory, subdirectories, filenames in os.walk(self.root):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = Path(directory) / filename
+                found[self._key(path)] = path.stat().st_mtime_ns
+        return found
+
+    def sync(self) -> Dict[str, int]:
+        """
+        Brings the database and the text files in line with each other.
+
+        Decks edited on disk since the last sync are imported. Decks edited in the database,
+        and not on disk, are exported. If both sides changed, the text file wins.
+
+        Returns:
+            Dict[str, int]: The number of decks "imported", "exported" and "deleted".
+        """
+        counts = {"imported": 0, "exported": 0, "deleted": 0}
+        self.last_sync = time.monotonic()
+        on_disk = self._walk()
+        db = self.connection()
+        in_db = {
+            path: (mtime, dirty)
+            for path, mtime, dirty in db.execute("SELECT path, mtime, dirty FROM decks")
+        }
+        for path, (mtime, dirty) in in_db.items():
+            if path not in on_disk:
+                if dirty:
+                    self.export_deck(path)
+                    counts["exported"] += 1
+                else:
+                    with db:
+                        db.execute("DELETE FROM decks WHERE path = ?", (path,))
+                    counts["deleted"] += 1
+            elif on_disk[path] != mtime:
+                self.import_deck(path)
+                counts["imported"] += 1
+            elif dirty:
+                self.export_deck(path)
+                counts["exported"] += 1
+        for path in on_disk.keys() - in_db.keys():
+            self.import_deck(path)
+            counts["imported"] += 1
+        return counts
+
+    def import_deck(self, path: str) -> None:
+        """
+        Replaces a deck's cards and tags in the database with the content of its text file.
+
+        Args:
+            path (str): The deck key.
+        """
+        filepath = self.root / path
+        mtime = filepath.stat().st_mtime_ns
+        with open(filepath, "r", encoding="utf-8") as file:
+            header, cards, comments, footer = self.parse_lines(file)
+        db = self.connection()
+        with db:
+            db.execute(
+                "INSERT INTO decks (path, folder, mtime, header, footer, dirty) "
+                "VALUES (?, ?, ?, ?, ?, 0) "
+                "ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, "
+                "header = excluded.header, footer = excluded.footer, dirty = 0",
+                (path, Path(path).parent.name, mtime, header, footer),
+            )
+            deck_id = db.execute(
+                "SELECT id FROM decks WHERE path = ?", (path,)
+            ).fetchone()[0]
+            db.execute("DELETE FROM cards WHERE deck_id = ?", (deck_id,))
+            self._insert_cards(db, deck_id, cards, comments)
+
+    def _insert_cards(
+        self,
+        db: sqlite3.Connection,
+        deck_id: int,
+        cards: Iterable[Tuple[str, str, List[str]]],
+        comments: Optional[List[str]] = None,
+    ) -> None:
+        """
+        Inserts cards and their tags into a deck.
+
+        Args:
+            db (sqlite3.Connection): The connection, inside a transaction.
+            deck_id (int): The deck to insert into.
+            cards (Iterable[Tuple[str, str, List[str]]]): (term, definition, tags) triples, in order.
+            comments (Optional[List[str]]): The comment lines above each card, if any.
+        """
+        for position, (term, definition, tags) in enumerate(cards):
+            card_id = db.execute(
+                "INSERT INTO cards (deck_id, position, term, definition, comments) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    deck_id,
+                    position,
+                    term,
+                    definition,
+                    comments[position] if comments else "",
+                ),
+            ).lastrowid
+            db.executemany(
+                "INSERT OR IGNORE INTO tags (card_id, tag) VALUES (?, ?)",
+                [(card_id, tag) for tag in tags],
+            )
+
+    @staticmethod
+    def parse_lines(
+        lines: Iterable[str],
+    ) -> Tuple[str, List[Tuple[str, str, List[str]]], List[str], str]:
+        """
+        Parses the lines of a text deck into its header, tagged cards and comments. Blank
+        lines are not kept.
+
+        Args:
+            lines (Iterable[str]): The raw lines of the deck.
+
+        Returns:
+            Tuple[str, List[Tuple[str, str, List[str]]], List[str], str]: The comment lines
+                before the first card, (term, definition, tags) triples, the comment lines
+                between each card and the one before it, and the comment lines after the last card.
+        """
+        lines = list(lines)
+        header: Optional[List[str]] = None
+        comments: List[str] = []
+        pending: List[str] = []
+        for line in lines:
+            stripped = line.strip()
+            if stripped == "":
+                continue
+            if stripped.startswith("#"):
+                pending.append(line.rstrip("\n"))
+            elif header is None:
+                header, pending = pending, []
+                comments.append("")
+            else:
+                comments.append("\n".join(pending))
+                pending = []
+        if header is None:
+            header, pending = pending, []
+        return (
+            "\n".join(header),
+            list(TextBackend.iter_cards(lines)),
+            comments,
+            "\n".join(pending),
+        )
+
+    def export_deck(self, path: str) -> None:
+        """
+        Writes a deck from the database back to its text file, atomically, with the comments
+        it was imported with. Tags lines are added where the tags of a card changed.
+
+        Args:
+            path (str): The deck key.
+        """
+        db = self.connection()
+        deck_id, header, footer = db.execute(
+            "SELECT id, header, footer FROM decks WHERE path = ?", (path,)
+        ).fetchone()
+        lines = header.split("\n") if header else []
+        tags: List[str] = []
+        for line in lines:
+            tags = self.parse_tags(line, tags)
+        for card_id, term, definition, comments in db.execute(
+            "SELECT id, term, definition, comments FROM cards WHERE deck_id = ? "
+            "ORDER BY position",
+            (deck_id,),
+        ).fetchall():
+            for comment in comments.split("\n") if comments else []:
+                lines.append(comment)
+                tags = self.parse_tags(comment, tags)
+            card_tags = [
+                tag
+                for (tag,) in db.execute(
+                    "SELECT tag FROM tags WHERE card_id = ? ORDER BY rowid", (card_id,)
+                )
+            ]
+            if card_tags != tags:
+                lines.append(f"# tags: {', '.join(card_tags)}")
+                tags = card_tags
+            lines.append(f"{term}: {definition}")
+        if footer:
+            lines.append(footer)
+        filepath = self.root / path
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        FileHandler.atomic_write(filepath, "\n".join(lines) + "\n")
+        with db:
+            db.execute(
+                "UPDATE decks SET mtime = ?, dirty = 0 WHERE id = ?",
+                (filepath.stat().st_mtime_ns, deck_id),
+            )
+
+    def write_deck(
+        self, path: str, cards: Iterable[Tuple[str, str, List[str]]], header: str = ""
+    ) -> None:
+        """
+        Creates or replaces a deck in the database. It is written to disk on the next sync.
+
+        Args:
+            path (str): The deck key.
+            cards (Iterable[Tuple[str, str, List[str]]]): (term, definition, tags) triples, in order.
+            header (str): The comment lines to put above the cards.
+        """
+        db = self.connection()
+        with db:
+            db.execute(
+                "INSERT INTO decks (path, folder, mtime, header, dirty) VALUES (?, ?, 0, ?, 1) "
+                "ON CONFLICT(path) DO UPDATE SET header = excluded.header, dirty = 1",
+                (path, Path(path).parent.name, header),
+            )
+            deck_id = db.execute(
+                "SELECT id FROM decks WHERE path = ?", (path,)
+            ).fetchone()[0]
+            db.execute("DELETE FROM cards WHERE deck_id = ?", (deck_id,))
+            self._insert_cards(db, deck_id, cards)
+
+    def list_files(self, root: Path) -> List[Path]:
+        """
+        Lists the decks of the library from the database.
+
+        The database is synced with the disk first if it has not been for `sync_interval`
+        seconds, otherwise this is a single indexed query. Edits to a deck that is read are
+        picked up by `read_content` regardless.
+
+        Args:
+            root (Path): The root directory of the library.
+
+        Returns:
+            List[Path]: The paths of the decks, sorted.
+        """
+        if (
+            self.last_sync is None
+            or time.monotonic() - self.last_sync >= self.sync_interval
+        ):
+            self.sync()
+        return [
+            self.root / path
+            for (path,) in self.connection().execute(
+                "SELECT path FROM decks ORDER BY path"
+            )
+        ]
+
+    def read_content(self, file: Any) -> Optional[str]:
+        """
+        Reads the card lines of a deck from the database, importing the text file first if
+        it changed on disk.
+
+        Args:
+            file (File): The deck to read.
+
+        Returns:
+            Optional[str]: The card lines, or None if the deck could not be read.
+        """
+        path = self._key(file.filepath)
+        db = self.connection()
+        row = db.execute(
+            "SELECT id, mtime FROM decks WHERE path = ?", (path,)
+        ).fetchone()
+        try:
+            if row is None or row[1] != file.filepath.stat().st_mtime_ns:
+                self.import_deck(path)
+                row = db.execute(
+                    "SELECT id FROM decks WHERE path = ?", (path,)
+                ).fetchone()
+        except FileNotFoundError as e:
+            if row is None:
+                PrintHandler.print_exception(f"Error: {str(e)}")
+                return None
+        return "".join(
+            f"{term}: {definition}\n"
+            for term, definition in db.execute(
+                "SELECT term, definition FROM cards WHERE deck_id = ? ORDER BY position",
+                (row[0],),
+            )
+        )
+
+    def missed_cards(
+        self, profile: str, since: float, folder: Optional[str] = None
+    ) -> List[Tuple[str, str, str, int]]:
+        """
+        Finds the cards a learner got wrong since a point in time.
+
+        Args:
+            profile (str): The learner profile.
+            since (float): The earliest review to consider, as a UNIX timestamp.
+            folder (Optional[str]): Only consider decks in this folder, e.g. "Duolingo".
+
+        Returns:
+            List[Tuple[str, str, str, int]]: (deck, term, definition, times missed), most missed first.
+        """
+        query = (
+            "SELECT r.deck, r.term, c.definition, COUNT(*) AS missed FROM reviews r "
+            "JOIN decks d ON d.path = r.deck "
+            "JOIN cards c ON c.deck_id = d.id AND c.term = r.term "
+            "WHERE r.profile = ? AND r.ts >= ? AND r.correct = 0"
+        )
+        args: List[Any] = [profile, since]
+        if folder is not None:
+            query += " AND d.folder = ?"
+            args.append(folder)
+        query += " GROUP BY r.deck, r.term ORDER BY missed DESC, r.deck, r.term"
+        return self.connection().execute(query, args).fetchall()
+
+    def cards_with_tag(self, tag: str) -> List[Tuple[str, str, str]]:
+        """
+        Finds the cards with a tag.
+
+        Args:
+            tag (str): The tag to look for.
+
+        Returns:
+            List[Tuple[str, str, str]]: (deck, term, definition) triples.
+        """
+        return (
+            self.connection()
+            .execute(
+                "SELECT d.path, c.term, c.definition FROM tags t "
+                "JOIN cards c ON c.id = t.card_id JOIN decks d ON d.id = c.deck_id "
+                "WHERE t.tag = ? ORDER BY d.path, c.position",
+                (tag,),
+            )
+            .fetchall()
+        )
+
+
+BACKENDS = {"text": TextBackend, "sqlite": SQLiteBackend}
+
+
+def backend_from_environment(root: Path) -> TextBackend:
+    """
+    Configures the storage backend of a library from FLASHCARDS_BACKEND.
+
+    Args:
+        root (Path): The root directory of the library.
+
+    Returns:
+        TextBackend: The backend named, of the library, which records reviews either way.
+
+    Raises:
+        ValueError: If the variable names an unknown backend.
+    """
+    name = os.environ.get("FLASHCARDS_BACKEND", "text").lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend {name}. Use one of {', '.join(BACKENDS)}.")
+    return BACKENDS[name](root)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Manage the SQLite mirror of a library."
+    )
+    parser.add_argument("filepath", help="The root directory of the library.")
+    parser.add_argument("command", choices=["sync", "missed"])
+    parser.add_argument("--days", type=float, default=7)
+    parser.add_argument("--profile", default=getpass.getuser())
+    parser.add_argument("--folder")
+    args = parser.parse_args()
+    backend = SQLiteBackend(Path(args.filepath))
+    if args.command == "sync":
+        counts = backend.sync()
+        PrintHandler.print_notice(
+            f"Imported {counts['imported']}, exported {counts['exported']}, "
+            f"deleted {counts['deleted']} decks."
+        )
+    else:
+        backend.sync()
+        since = time.time() - args.days * 86400
+        for deck, term, definition, missed in backend.missed_cards(
+            args.profile, since, args.folder
+        ):
+            print(f"{missed}x {deck}: {term}: {definition}")
@@ -0,0 +1,635 @@
+'''
+Streaming import and export of decks.
+
+Imports CSV/TSV files and Anki packages (.apkg, a zip holding a SQLite collection) into
+`term: definition` decks, and exports decks back to CSV/TSV or .apkg. Rows are processed
+one at a time and written in batches, so memory stays bounded whatever the input size.
+
+Usage:
+    python runner/transfer.py import words.csv Swedish/flashcards/Misc/words.txt
+    python runner/transfer.py import collection.apkg Swedish/flashcards/Anki
+    python runner/transfer.py export Swedish/flashcards/Duolingo/s7.txt s7.tsv
+'''
+
+import argparse, csv, hashlib, html, json, os, re, shutil, sqlite3, sys, tempfile, time
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from handlers import *
+from storage import TextBackend
+
+
+class TransferReport:
+    def __init__(self, source: str, interval: int = 50000, examples: int = 10) -> None:
+        """
+        Counts rows as they are transferred and reports progress.
+
+        Args:
+            source (str): The name of what is being transferred, for messages.
+            interval (int): The number of rows between progress messages.
+            examples (int): The number of malformed rows to keep as examples.
+
+        Attributes:
+            source (str): The name of what is being transferred.
+            rows (int): The number of rows read.
+            written (int): The number of cards written.
+            malformed (int): The number of rows skipped as malformed.
+            reasons (Dict[str, int]): The number of malformed rows per reason.
+            examples (List[Tuple[int, str, str]]): (row number, reason, row) of the first malformed rows.
+            started (float): When the transfer started.
+        """
+        self.source: str = source
+        self.interval: int = interval
+        self.max_examples: int = examples
+        self.rows: int = 0
+        self.written: int = 0
+        self.malformed: int = 0
+        self.reasons: Dict[str, int] = {}
+        self.examples: List[Tuple[int, str, str]] = []
+        self.started: float = time.monotonic()
+
+    def row(self) -> None:
+        """
+        Counts a row read, printing progress every `interval` rows.
+        """
+        self.rows += 1
+        if self.rows % self.interval == 0:
+            elapsed = time.monotonic() - self.started
+            print(
+                f"\r- {self.source}: {self.rows} rows ({self.rows / elapsed:.0f}/s)",
+                end="",
+                file=sys.stderr,
+            )
+
+    def reject(self, reason: str, row: Iterable[str]) -> None:
+        """
+        Counts a malformed row.
+
+        Args:
+            reason (str): Why the row was rejected.
+            row (Iterable[str]): The fields of the row.
+        """
+        self.malformed += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if len(self.examples) < self.max_examples:
+            self.examples.append((self.rows, reason, " | ".join(row)[:80]))
+
+    def summary(self) -> None:
+        """
+        Prints a summary of the transfer.
+        """
+        elapsed = time.monotonic() - self.started
+        if self.rows >= self.interval:
+            print(file=sys.stderr)
+        PrintHandler.print_notice(
+            f"{self.source}: {self.written} cards written from {self.rows} rows "
+            f"in {elapsed:.2f}s, {self.malformed} malformed."
+        )
+        for reason, count in sorted(self.reasons.items()):
+            PrintHandler.print_notice(f"  {count}x {reason}")
+        for number, reason, row in self.examples:
+            PrintHandler.print_notice(f"  row {number}: {reason}: {row}")
+
+
+class DeckWriter:
+    def __init__(self, filepath: Path, header: str, batch_size: int = 5000) -> None:
+        """
+        Writes cards to a deck in batches, replacing the deck atomically when closed. The
+        deck keeps the permissions of the one it replaces.
+
+        Args:
+            filepath (Path): The deck to write.
+            header (str): The comment line to put at the top of the deck.
+            batch_size (int): The number of lines buffered between writes.
+
+        Attributes:
+            filepath (Path): The deck to write.
+            batch_size (int): The number of lines buffered between writes.
+            buffer (List[str]): The lines not yet written.
+            tags (List[str]): The tags of the last card written.
+            file (TextIO): The temporary file being written.
+        """
+        self.filepath: Path = Path(filepath)
+        self.batch_size: int = batch_size
+        self.buffer: List[str] = [header] if header else []
+        self.tags: List[str] = []
+        self.filepath.parent.mkdir(parents=True, exist_ok=True)
+        mode = FileHandler.file_mode(self.filepath)
+        fd, self.temp_name = tempfile.mkstemp(
+            dir=self.filepath.parent, prefix=f".{self.filepath.name}.", suffix=".tmp"
+        )
+        FileHandler.set_mode(fd, mode)
+        self.file: TextIO = os.fdopen(fd, "w", encoding="utf-8")
+
+    def write(self, term: str, definition: str, tags: List[str]) -> None:
+        """
+        Adds a card to the deck, with a tags comment whenever the tags change.
+
+        Args:
+            term (str): The term of the card.
+            definition (str): The definition of the card.
+            tags (List[str]): The tags of the card.
+        """
+        if tags != self.tags:
+            self.buffer.append(f"# tags: {', '.join(tags)}")
+            self.tags = tags
+        self.buffer.append(f"{term}: {definition}")
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Writes the buffered lines.
+        """
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+
+    def close(self) -> None:
+        """
+        Writes the rest of the deck and moves it into place.
+        """
+        self.flush()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self.temp_name, self.filepath)
+
+    def abort(self) -> None:
+        """
+        Discards the deck being written.
+        """
+        self.file.close()
+        os.unlink(self.temp_name)
+
+
+class Importer:
+    TAG_RE = re.compile(r"<[^>]+>")
+
+    @staticmethod
+    def clean(field: str) -> str:
+        """
+        Turns a field into a single line of plain text, removing HTML from Anki fields.
+
+        Args:
+            field (str): The raw field.
+
+        Returns:
+            str: The cleaned field.
+        """
+        if "<" in field or "&" in field:
+            field = html.unescape(Importer.TAG_RE.sub(" ", field.replace("<br>", " ")))
+        return " ".join(field.split())
+
+    @staticmethod
+    def check(term: str, definition: str) -> Optional[str]:
+        """
+        Checks that a card can be stored as a `term: definition` line. Decks are split on
+        every ": ", so neither side may contain one.
+
+        Args:
+            term (str): The term of the card.
+            definition (str): The definition of the card.
+
+        Returns:
+            Optional[str]: Why the card is malformed, or None if it is fine.
+        """
+        if not term or not definition:
+            return "empty term or definition"
+        if ": " in term or term.startswith("#"):
+            return "term cannot be stored as a deck line"
+        if ": " in definition:
+            return "definition cannot be stored as a deck line"
+        return None
+
+    @staticmethod
+    def import_delimited(
+        source: Path, destination: Path, delimiter: Optional[str] = None
+    ) -> TransferReport:
+        """
+        Streams a CSV or TSV file into a deck. Columns are term, definition and optional tags.
+
+        Args:
+            source (Path): The CSV or TSV file.
+            destination (Path): The deck to write.
+            delimiter (Optional[str]): The column delimiter. Defaults to a tab for .tsv files and a comma otherwise.
+
+        Returns:
+            TransferReport: The counts of the import.
+        """
+        if delimiter is None:
+            delimiter = "\t" if source.suffix.lower() in (".tsv", ".tab") else ","
+        report = TransferReport(source.name)
+        writer = DeckWriter(destination, f"# Imported from {source.name}")
+        try:
+            with open(source, "r", encoding="utf-8-sig", newline="") as file:
+                for row in csv.reader(file, delimiter=delimiter):
+                    report.row()
+                    if len(row) < 2:
+                        report.reject("fewer than 2 columns", row)
+                        continue
+                    term, definition = Importer.clean(row[0]), Importer.clean(row[1])
+                    reason = Importer.check(term, definition)
+                    if reason is not None:
+                        report.reject(reason, row)
+                        continue
+                    tags = row[2].replace(",", " ").split() if len(row) > 2 else []
+                    writer.write(term, definition, tags)
+                    report.written += 1
+        except BaseException:
+            writer.abort()
+            raise
+        writer.close()
+        return report
+
+    @staticmethod
+    def import_apkg(source: Path, destination: Path) -> TransferReport:
+        """
+        Streams the notes of an Anki package into decks, one deck per Anki deck.
+
+        The collection is copied out of the zip to a temporary file, since SQLite cannot read
+        from inside a zip, then read one note at a time. The first two fields of each note
+        become the term and definition.
+
+        Args:
+            source (Path): The .apkg file.
+            destination (Path): The directory to write the decks to.
+
+        Returns:
+            TransferReport: The counts of the import.
+
+        Raises:
+            ValueError: If the package holds no collection this importer can read.
+        """
+        report = TransferReport(source.name)
+        writers: Dict[int, DeckWriter] = {}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            collection = Path(temp_dir) / "collection.anki2"
+            with zipfile.ZipFile(source) as package:
+                names = set(package.namelist())
+                name = next(
+                    (
+                        n
+                        for n in ("collection.anki21", "collection.anki2")
+                        if n in names
+                    ),
+                    None,
+                )
+                if name is None:
+                    raise ValueError(f"{source.name} holds no readable Anki collection")
+                with package.open(name) as src, open(collection, "wb") as dst:
+                    shutil.copyfileobj(src, dst, 1 << 20)
+            db = sqlite3.connect(collection)
+            try:
+                deck_names = {
+                    int(did): deck["name"]
+                    for did, deck in json.loads(
+                        db.execute("SELECT decks FROM col").fetchone()[0]
+                    ).items()
+                }
+                rows = db.execute(
+                    "SELECT n.flds, n.tags, MIN(c.did) FROM notes n "
+                    "LEFT JOIN cards c ON c.nid = n.id GROUP BY n.id ORDER BY n.id"
+                )
+                for fields, tags, did in rows:
+                    report.row()
+                    fields = fields.split("\x1f")
+                    if len(fields) < 2:
+                        report.reject("fewer than 2 fields", fields)
+                        continue
+                    term, definition = Importer.clean(fields[0]), Importer.clean(
+                        fields[1]
+                    )
+                    reason = Importer.check(term, definition)
+                    if reason is not None:
+                        report.reject(reason, fields)
+                        continue
+                    did = did or 1
+                    if did not in writers:
+                        name = deck_names.get(did, "Default")
+                        writers[did] = DeckWriter(
+                            destination / Exporter.deck_filename(name),
+                            f"# Imported from {source.name}: {name}",
+                        )
+                    writers[did].write(term, definition, tags.split())
+                    report.written += 1
+            except BaseException:
+                for writer in writers.values():
+                    writer.abort()
+                raise
+            finally:
+                db.close()
+        for writer in writers.values():
+            writer.close()
+        return report
+
+
+class Exporter:
+    ANKI_SCHEMA = """
+        CREATE TABLE col (id integer primary key, crt integer not null, mod integer not null,
+            scm integer not null, ver integer not null, dty integer not null, usn integer not null,
+            ls integer not null, conf text not null, models text not null, decks text not null,
+            dconf text not null, tags text not null);
+        CREATE TABLE notes (id integer primary key, guid text not null, mid integer not null,
+            mod integer not null, usn integer not null, tags text not null, flds text not null,
+            sfld integer not null, csum integer not null, flags integer not null, data text not null);
+        CREATE TABLE cards (id integer primary key, nid integer not null, did integer not null,
+            ord integer not null, mod integer not null, usn integer not null, type integer not null,
+            queue integer not null, due integer not null, ivl integer not null, factor integer not null,
+            reps integer not null, lapses integer not null, left integer not null, odue integer not null,
+            odid integer not null, flags integer not null, data text not null);
+        CREATE TABLE revlog (id integer primary key, cid integer not null, usn integer not null,
+            ease integer not null, ivl integer not null, lastIvl integer not null, factor integer not null,
+            time integer not null, type integer not null);
+        CREATE TABLE graves (usn integer not null, oid integer not null, type integer not null);
+    """
+
+    ANKI_INDEXES = """
+        CREATE INDEX ix_notes_usn on notes (usn);
+        CREATE INDEX ix_cards_usn on cards (usn);
+        CREATE INDEX ix_revlog_usn on revlog (usn);
+        CREATE INDEX ix_cards_nid on cards (nid);
+        CREATE INDEX ix_cards_sched on cards (did, queue, due);
+        CREATE INDEX ix_revlog_cid on revlog (cid);
+        CREATE INDEX ix_notes_csum on notes (csum);
+    """
+
+    @staticmethod
+    def deck_filename(name: str) -> str:
+        """
+        Turns an Anki deck name into a deck filename. Subdecks are joined with underscores.
+
+        Args:
+            name (str): The Anki deck name.
+
+        Returns:
+            str: The filename.
+        """
+        name = (
+            re.sub(r'[\\/:*?"<>|]+', "_", name.replace("::", "_")).strip() or "Default"
+        )
+        return f"{name}.txt"
+
+    @staticmethod
+    def read_deck(source: Path) -> Iterator[Tuple[str, str, List[str]]]:
+        """
+        Streams the cards of a deck with their tags.
+
+        Args:
+            source (Path): The deck.
+
+        Returns:
+            Iterator[Tuple[str, str, List[str]]]: (term, definition, tags) triples.
+        """
+        with open(source, "r", encoding="utf-8") as file:
+            yield from TextBackend.iter_cards(file)
+
+    @staticmethod
+    def export_delimited(
+        source: Path, destination: Path, delimiter: Optional[str] = None
+    ) -> TransferReport:
+        """
+        Streams a deck into a CSV or TSV file with term, definition and tags columns.
+
+        Args:
+            source (Path): The deck.
+            destination (Path): The CSV or TSV file to write.
+            delimiter (Optional[str]): The column delimiter. Defaults to a tab for .tsv files and a comma otherwise.
+
+        Returns:
+            TransferReport: The counts of the export.
+        """
+        if delimiter is None:
+            delimiter = "\t" if destination.suffix.lower() in (".tsv", ".tab") else ","
+        report = TransferReport(source.name)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        with open(destination, "w", encoding="utf-8", newline="") as file:
+            writer = csv.writer(file, delimiter=delimiter)
+            for term, definition, tags in Exporter.read_deck(source):
+                report.row()
+                writer.writerow([term, definition, " ".join(tags)])
+                report.written += 1
+        return report
+
+    @staticmethod
+    def export_apkg(
+        source: Path, destination: Path, batch_size: int = 5000
+    ) -> TransferReport:
+        """
+        Writes a deck as an Anki package with a basic front/back note type.
+
+        Args:
+            source (Path): The deck.
+            destination (Path): The .apkg file to write.
+            batch_size (int): The number of notes inserted per batch.
+
+        Returns:
+            TransferReport: The counts of the export.
+        """
+        report = TransferReport(source.name)
+        now = int(time.time())
+        model_id, deck_id = now * 1000, now * 1000 + 1
+        deck_name = source.stem
+        with tempfile.TemporaryDirectory() as temp_dir:
+            collection = Path(temp_dir) / "collection.anki2"
+            db = sqlite3.connect(collection)
+            # a throwaway file until it is zipped, so skip the rollback journal
+            db.execute("PRAGMA journal_mode=OFF")
+            db.execute("PRAGMA synchronous=OFF")
+            db.executescript(Exporter.ANKI_SCHEMA)
+            db.execute(
+                "INSERT INTO col VALUES (1, ?, ?, ?, 11, 0, 0, 0, '{}', ?, ?, '{}', '{}')",
+                (
+                    now,
+                    now * 1000,
+                    now * 1000,
+                    json.dumps(Exporter._anki_model(model_id, deck_id, now)),
+                    json.dumps(Exporter._anki_deck(deck_id, deck_name, now)),
+                ),
+            )
+            notes, cards = [], []
+            for term, definition, tags in Exporter.read_deck(source):
+                report.row()
+                note_id = model_id + report.rows
+                fields = f"{term}\x1f{definition}"
+                checksum = int(hashlib.sha1(term.encode()).hexdigest()[:8], 16)
+                guid = hashlib.sha1(f"{deck_name}\x1f{term}".encode()).hexdigest()[:10]
+                tag_field = f" {' '.join(tags)} " if tags else ""
+                notes.append(
+                    (
+                        note_id,
+                        guid,
+                        model_id,
+                        now,
+                        -1,
+                        tag_field,
+                        fields,
+                        term,
+                        checksum,
+                        0,
+                        "",
+                    )
+                )
+                cards.append(
+                    (
+                        note_id,
+                        note_id,
+                        deck_id,
+                        0,
+                        now,
+                        -1,
+                        0,
+                        0,
+                        report.rows,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        0,
+                        "",
+                    )
+                )
+                report.written += 1
+                if len(notes) >= batch_size:
+                    Exporter._insert_anki(db, notes, cards)
+                    notes, cards = [], []
+            Exporter._insert_anki(db, notes, cards)
+            db.executescript(Exporter.ANKI_INDEXES)
+            db.commit()
+            db.close()
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(
+                destination, "w", zipfile.ZIP_DEFLATED, compresslevel=1
+            ) as package:
+                package.write(collection, "collection.anki2")
+                package.writestr("media", "{}")
+        return report
+
+    @staticmethod
+    def _insert_anki(
+        db: sqlite3.Connection, notes: List[tuple], cards: List[tuple]
+    ) -> None:
+        """
+        Inserts a batch of notes and their cards into an Anki collection.
+
+        Args:
+            db (sqlite3.Connection): The collection.
+            notes (List[tuple]): Rows of the notes table.
+            cards (List[tuple]): Rows of the cards table.
+        """
+        db.executemany("INSERT INTO notes VALUES (?,?,?,?,?,?,?,?,?,?,?)", notes)
+        db.executemany(
+            "INSERT INTO cards VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", cards
+        )
+
+    @staticmethod
+    def _anki_model(model_id: int, deck_id: int, now: int) -> Dict[str, dict]:
+        """
+        Returns a basic front/back note type.
+
+        Args:
+            model_id (int): The id of the note type.
+            deck_id (int): The deck new cards go to.
+            now (int): The current time, as a UNIX timestamp.
+
+        Returns:
+            Dict[str, dict]: The note types of the collection, keyed by id.
+        """
+        field = {
+            "ord": 0,
+            "sticky": False,
+            "rtl": False,
+            "font": "Arial",
+            "size": 20,
+            "media": [],
+        }
+        return {
+            str(model_id): {
+                "id": model_id,
+                "name": "Basic (flashcards)",
+                "type": 0,
+                "mod": now,
+                "usn": -1,
+                "sortf": 0,
+                "did": deck_id,
+                "tmpls": [
+                    {
+                        "name": "Card 1",
+                        "ord": 0,
+                        "qfmt": "{{Front}}",
+                        "afmt": "{{FrontSide}}<hr id=answer>{{Back}}",
+                        "did": None,
+                        "bqfmt": "",
+                        "bafmt": "",
+                    }
+                ],
+                "flds": [
+                    dict(field, name="Front", ord=0),
+                    dict(field, name="Back", ord=1),
+                ],
+                "css": ".card { font-family: arial; font-size: 20px; text-align: center; }",
+                "latexPre": "",
+                "latexPost": "",
+                "req": [[0, "all", [0]]],
+                "tags": [],
+                "vers": [],
+            }
+        }
+
+    @staticmethod
+    def _anki_deck(deck_id: int, name: str, now: int) -> Dict[str, dict]:
+        """
+        Returns the decks of an exported collection.
+
+        Args:
+            deck_id (int): The id of the exported deck.
+            name (str): The name of the exported deck.
+            now (int): The current time, as a UNIX timestamp.
+
+        Returns:
+            Dict[str, dict]: The decks of the collection, keyed by id.
+        """
+        deck = {
+            "newToday": [0, 0],
+            "revToday": [0, 0],
+            "lrnToday": [0, 0],
+            "timeToday": [0, 0],
+            "collapsed": False,
+            "desc": "",
+            "dyn": 0,
+            "conf": 1,
+            "usn": -1,
+            "mod": now,
+            "extendNew": 10,
+            "extendRev": 50,
+        }
+        return {
+            "1": dict(deck, id=1, name="Default"),
+            str(deck_id): dict(deck, id=deck_id, name=name),
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import and export decks.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("source", type=Path)
+    parser.add_argument("destination", type=Path)
+    parser.add_argument("--delimiter", help="Column delimiter for CSV/TSV files.")
+    args = parser.parse_args()
+    if args.command == "import" and args.source.suffix.lower() == ".apkg":
+        report = Importer.import_apkg(args.source, args.destination)
+    elif args.command == "import":
+        report = Importer.import_delimited(
+            args.source, args.destination, args.delimiter
+        )
+    elif args.destination.suffix.lower() == ".apkg":
+        report = Exporter.export_apkg(args.source, args.destination)
+    else:
+        report = Exporter.export_delimited(
+            args.source, args.destination, args.delimiter
+        )
+    report.summary()